@@ -0,0 +1,23 @@
+#!/bin/bash
+# librespot --onevent hook, forwards player and volume events to the
+# "Spotify Event" topic of speakerManager.
+# Usage: librespot ... --onevent /path/to/librespotEvent.sh
+
+mqtt_host="localhost"
+mqtt_user="user"
+mqtt_pass="password"
+mqtt_topic="librespot/event"
+
+case "$PLAYER_EVENT" in
+    started) message="start" ;;
+    playing) message="play" ;;
+    paused) message="pause" ;;
+    stopped) message="stop" ;;
+    changed) message="change" ;;
+    session_connected) message="sessionconnected" ;;
+    # librespot reports 0-65535, speakerManager expects a percentage
+    volume_set|volume_changed) message="volume_changed:$(( (VOLUME * 100 + 32767) / 65535 ))" ;;
+    *) message="$PLAYER_EVENT" ;;
+esac
+
+mosquitto_pub -h "$mqtt_host" -u "$mqtt_user" -P "$mqtt_pass" -t "$mqtt_topic" -m "$message"
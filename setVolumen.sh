@@ -1,5 +1,11 @@
 #!/bin/bash
 
+# Standalone helper run by hand, it halves the Headphone hardware control in
+# one step. It never goes through the SpeakerManager mixer, so the gain ramps
+# (playback.rampDuration) do not apply to it. Fades and ducking of
+# announcements are done by those ramps; use the "Set Volume" command for
+# volume changes while the service is running.
+
 playback_volume_control="Headphone"
 playback_volume=$(amixer get Headphone | grep -m 1 -o -P "(?<=\[)[0-9]+(?=%\])")
 echo "Old Volume: $playback_volume"
@@ -0,0 +1,1630 @@
+"""
+SpeakerManager benchmarks.
+
+Offline micro-benchmarks for the request and playback paths.  Nothing here
+talks to the broker, the sound card or any cloud service, so they can run on
+a development machine.  A run exits non-zero when one of its checks fails.
+Run from the repository root:
+
+    python speakerManager/benchmark.py dispatch-latency
+    python speakerManager/benchmark.py dispatch-latency --messages 50
+    python speakerManager/benchmark.py async-engine --rooms 4
+    python speakerManager/benchmark.py topic-routing --topics 5000
+    python speakerManager/benchmark.py mixer-cpu --seconds 30
+    python speakerManager/benchmark.py channels-load --rooms 12 --requests 60
+    python speakerManager/benchmark.py tts-cache --latency 0.4
+    python speakerManager/benchmark.py tts-chunks --latency 0.3 --failure-rate 0.1
+    python speakerManager/benchmark.py tts-streaming --max-chunks 8
+    python speakerManager/benchmark.py wav-assembly --cases 50
+    python speakerManager/benchmark.py tts-concurrency --requests 40
+    python speakerManager/benchmark.py tts-flood --commands 12
+    python speakerManager/benchmark.py quota-ledger --days 1000
+    python speakerManager/benchmark.py tts-phrases --phrases 10
+    python speakerManager/benchmark.py tts-backends --slow-latency 1.5
+    python speakerManager/benchmark.py spotify-ducking --latency 0.15
+    python speakerManager/benchmark.py librespot-ducking --latency 0.15
+    python speakerManager/benchmark.py volume-burst --messages 200
+    python speakerManager/benchmark.py gain-ramps --ramp 0.05
+    python speakerManager/benchmark.py chromecast-pool --casts 4
+    python speakerManager/benchmark.py chromecast-fan-out --casts 4
+    python speakerManager/benchmark.py audio-server --clients 16
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import wave
+from collections import deque
+from contextlib import closing
+
+import numpy as np
+from zarus_core import CustomLogging
+from controllers.playback_engine import AsyncPlaybackEngine
+from devices.speaker_device import SpeakerDevice
+from services.fake_mqtt_client import FakeMqttBroker, FakeMqttClient
+from services.mqtt_service import MqttService, MqttConfig
+from services.topic_router import TopicRouter, TopicRoute
+from controllers.audio_mixer import AudioMixer, MixerStream
+from controllers.audio_process_manager import PlaybackHandle, AudioProcessManager
+from controllers.tts_stream import TtsStream
+from controllers.tts_cache import TtsCache
+from utils.latency_histogram import LatencyHistogram
+from controllers.room_controller import RoomController
+from controllers.device_registry import DeviceRegistry
+from controllers.audio_speaker_manager import AudioSpeakerManager
+from controllers.playback_channels import PlaybackChannels
+from controllers.tts_controller import TextToSpeechGenerator
+from services.fake_tts_service import FakeTTSService, FakeTTSServer
+from services.local_tts_service import LocalTTSService
+from services.spotify_service import SpotifyService, SpotifyWebClient
+from services.fake_spotify_service import FakeSpotifyServer
+from services.librespot_service import LibreSpotService
+from services.librespot_mixer import LibrespotMixer
+from services.fake_volume_mixer import FakeVolumeMixer
+from controllers.volume_controller import VolumeController
+from services.chromecast_pool import ChromecastPool
+from services.fake_chromecast import FakeCast, FakeCastDiscovery
+from devices.chromecast_device import ChromecastAudioDevice
+from controllers.chromecast_fan_out import ChromecastFanOut
+from services.audio_http_server import AudioHttpServer
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from services.google_tts_service import GoogleTTSService
+from services.tts_backend import ChunkSynthesizer, WavAssembler
+from controllers.pcm_cache import PcmAudio
+from controllers.audio_controller import AudioController, AudioConfig
+from controllers.tts_worker_pool import TtsWorkerPool, TtsJob
+from utils.csv_storage import CSVStorage
+from utils.quota_ledger import QuotaLedger
+from speakerManager import SpeakerManager
+
+logger: CustomLogging = None  # initialised in main()
+failed_checks: list[str] = []
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def check_failed(message: str):
+    # Every violated check ends the run with a non-zero exit status
+    failed_checks.append(message)
+    logger.error(message)
+
+
+def log_latencies(label: str, latencies: list[float]):
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    p95 = latencies_ms[int(len(latencies_ms) * 0.95) - 1] if len(latencies_ms) > 1 else latencies_ms[0]
+    logger.info(
+        f"{label:<12} | n: {len(latencies_ms)} | mean: {statistics.mean(latencies_ms):8.2f} ms"
+        f" | p50: {statistics.median(latencies_ms):8.2f} ms | p95: {p95:8.2f} ms | max: {latencies_ms[-1]:8.2f} ms"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Dispatch latency: MQTT message -> audio process start
+# ---------------------------------------------------------------------------
+
+class FakePopen():
+    def __init__(self, started_at: list, message_time: float):
+        started_at.append(time.perf_counter() - message_time)
+
+
+def run_polling_dispatcher(message_count: int, interval: float) -> list[float]:
+    pending_requests = []
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def loop():
+        while not done.is_set():
+            with lock:
+                requests = pending_requests[:]
+                pending_requests.clear()
+            for message_time in requests:
+                FakePopen(latencies, message_time)
+            time.sleep(0.2)
+
+    worker = threading.Thread(target=loop, daemon=True)
+    worker.start()
+    for _ in range(message_count):
+        time.sleep(random.uniform(0, interval))
+        with lock:
+            pending_requests.append(time.perf_counter())
+    while len(latencies) < message_count:
+        time.sleep(0.01)
+    done.set()
+    return latencies
+
+
+def write_manager_config(sink_file: str):
+    os.makedirs("conf")
+    os.makedirs("logs")
+    os.makedirs("sounds")
+    with open("sounds/chime.wav", "wb") as chime_file:
+        chime_file.write(PcmAudio(bytes(44100 * 2 * 2 // 10), 2, 2, 44100).to_wav_bytes())
+    config_data = {
+        "mqtt": {
+            "brokerAddress": "fake", "mqttUser": "", "mqttPass": "",
+            "subscriptionTopics": [{"topic": "speaker-message/+/play", "commandName": SpeakerManager.CMD_REPRODUCE_SOUND}],
+        },
+        "devices": [],
+        "rooms": [],
+        "chromecasts": {"devices": []},
+        "audios": [{"id": "chime", "file_name": "chime.wav"}],
+        "playback": {"sink": "file", "sinkFile": sink_file},
+        "tts": {"defaultBackend": "fake"},
+    }
+    with open("conf/configuration.json", "w") as config_file:
+        json.dump(config_data, config_file)
+
+
+def run_manager_dispatcher(message_count: int, interval: float) -> list[float]:
+    # Each message targets its own room, so no request waits behind another on a channel
+    broker = FakeMqttBroker()
+    published_at = {}
+    latencies = []
+    all_started = threading.Event()
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            write_manager_config(os.path.join(temp_dir, "sink"))
+            SpeakerManager.mqtt_client = FakeMqttClient(client_id="SpeakerManager", broker=broker)
+            SpeakerManager.use_spotify_service = False
+            manager = SpeakerManager()
+            execute_audio_process = manager.audio_process_manager.execute_audio_process
+
+            def timed_execute_audio_process(audio_config: AudioConfig):
+                room = audio_config.id.split(PlaybackChannels.PLAYBACK_ID_SEPARATOR)[1]
+                latencies.append(time.perf_counter() - published_at[room])
+                execute_audio_process(audio_config)
+                if len(latencies) == message_count:
+                    all_started.set()
+
+            manager.audio_process_manager.execute_audio_process = timed_execute_audio_process
+            threading.Thread(target=manager.run_loop, daemon=True).start()
+
+            publisher = FakeMqttClient(client_id="Publisher", broker=broker)
+            publisher.connect()
+            for i in range(message_count):
+                time.sleep(random.uniform(0, interval))
+                published_at[f"room{i}"] = time.perf_counter()
+                publisher.publish(f"speaker-message/room{i}/play", "chime")
+            if not all_started.wait(timeout=10):
+                check_failed(f"Only {len(latencies)}/{message_count} requests reached the audio process")
+        finally:
+            os.chdir(previous_cwd)
+    return latencies
+
+
+def action_dispatch_latency(message_count: int, interval: float, max_latency: float):
+    logger.info(f"Dispatching {message_count} messages, random spacing up to {interval}s")
+    log_latencies("polling", run_polling_dispatcher(message_count, interval))
+    latencies = run_manager_dispatcher(message_count, interval)
+    log_latencies("event", latencies)
+    slowest = max(latencies) * 1000
+    if slowest > max_latency:
+        check_failed(f"Event dispatch took {slowest:.2f} ms, above the {max_latency:g} ms bound")
+
+
+# ---------------------------------------------------------------------------
+# Async engine: concurrent rooms over an in-process broker
+# ---------------------------------------------------------------------------
+
+def start_fake_tasmota(broker: FakeMqttBroker, relay_delay: float) -> FakeMqttClient:
+    tasmota = FakeMqttClient(client_id="FakeTasmota", broker=broker)
+
+    def on_message(client, userdata, message):
+        speaker_id = message.topic.split("/")[2]
+        time.sleep(relay_delay)
+        client.publish(f"speakers/stat/{speaker_id}/POWER", message.payload)
+
+    tasmota.on_message = on_message
+    tasmota.connect()
+    tasmota.subscribe("speakers/cmnd/+/POWER")
+    tasmota.loop_start()
+    return tasmota
+
+
+def build_offline_speakers(room_count: int, relay_delay: float) -> list[SpeakerDevice]:
+    broker = FakeMqttBroker()
+    speakers: dict[str, SpeakerDevice] = {}
+
+    def on_mqtt_message(topic: str, message: str):
+        speaker = speakers.get(topic)
+        if speaker is not None:
+            speaker.update_status_from_message(message)
+
+    mqtt_config = MqttConfig(broker_address="fake", subscription_topics=[])
+    MqttService(mqtt_config=mqtt_config, process_message=on_mqtt_message, logger=logger, client=FakeMqttClient(client_id="SpeakerManager", broker=broker))
+    start_fake_tasmota(broker, relay_delay)
+    for i in range(room_count):
+        speaker = SpeakerDevice(
+            id=f"speaker{i}", type="TASMOTA", status={"0": "OFF", "1": "ON"}, template="%_v%",
+            publish_topic=f"speakers/cmnd/speaker{i}/POWER", subscribe_topic=f"speakers/stat/speaker{i}/POWER")
+        speakers[speaker.get_subscribe_topic()] = speaker
+    return list(speakers.values())
+
+
+async def simulated_pipeline(speaker: SpeakerDevice, request_index: int, finished: list):
+    acknowledged = asyncio.wrap_future(speaker.wait_for_status(True))
+    speaker.turn_on_speaker()
+    await acknowledged
+    await asyncio.sleep(0.5)  # ducking + playback start
+    finished.append((speaker.get_id(), request_index))
+
+
+def action_async_engine(room_count: int, requests_per_room: int, relay_delay: float):
+    speakers = build_offline_speakers(room_count, relay_delay)
+    engine = AsyncPlaybackEngine(logger=logger)
+    finished = []
+    futures = []
+    started = time.perf_counter()
+    for request_index in range(requests_per_room):
+        for speaker in speakers:
+            job = lambda speaker=speaker, request_index=request_index: simulated_pipeline(speaker, request_index, finished)
+            futures.append(engine.submit([speaker.get_id()], job))
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - started
+    serial_estimate = len(futures) * 0.5
+    logger.info(f"{len(futures)} requests over {room_count} rooms in {elapsed:.2f}s (serial pipeline: >= {serial_estimate:.2f}s)")
+    for speaker in speakers:
+        order = [request_index for speaker_id, request_index in finished if speaker_id == speaker.get_id()]
+        if order != sorted(order):
+            check_failed(f"Ordering violated in room of {speaker.get_id()}: {order}")
+            return
+    logger.info("Per-room ordering preserved")
+
+
+# ---------------------------------------------------------------------------
+# Topic routing: linear scans vs compiled trie
+# ---------------------------------------------------------------------------
+
+class SyntheticSpeaker():
+    def __init__(self, subscribe_topic: str):
+        self.subscribe_topic = subscribe_topic
+
+    def get_subscribe_topic(self):
+        return self.subscribe_topic
+
+
+def linear_route(speakers: list[SyntheticSpeaker], know_commands: list[dict], topic: str):
+    for speaker in speakers:
+        if(topic == speaker.get_subscribe_topic()):
+            return speaker
+    splitted_topic = topic.split("/")
+    for know_command in know_commands:
+        splitted_know_command = know_command["topic"].split("/")
+        if(len(splitted_know_command) == len(splitted_topic)):
+            if all(known == level or known == '+' for known, level in zip(splitted_know_command, splitted_topic)):
+                return know_command["commandName"]
+    return None
+
+
+def action_topic_routing(topic_count: int, speaker_count: int):
+    speakers = [SyntheticSpeaker(f"speakers/stat/{i:06X}/POWER") for i in range(speaker_count)]
+    know_commands = [
+        {"topic": "spotify/event", "commandName": "Spotify Event"},
+        {"topic": "speaker-message/+/reproduce", "commandName": "Reproduce Sound"},
+        {"topic": "speaker-message/+/stop", "commandName": "Stop Sound"},
+        {"topic": "speaker-message/+/tts", "commandName": "Reproduce Tts"},
+        {"topic": "speaker-message/+/tts-es", "commandName": "Reproduce Tts-Es"},
+        {"topic": "speaker-message/set-volume", "commandName": "Set Volume"},
+    ]
+    rooms = ["cocina", "sala", "habitacion", "all", "cocina-sala"]
+    topics = []
+    for _ in range(topic_count):
+        if random.random() < 0.7:
+            topics.append(random.choice(speakers).get_subscribe_topic())
+        else:
+            topics.append(f"speaker-message/{random.choice(rooms)}/{random.choice(['reproduce', 'stop', 'tts', 'tts-es'])}")
+
+    started = time.perf_counter()
+    linear_results = [linear_route(speakers, know_commands, topic) for topic in topics]
+    linear_elapsed = time.perf_counter() - started
+
+    router = TopicRouter.from_subscriptions(speakers, know_commands)
+    started = time.perf_counter()
+    router_results = [router.resolve(topic) for topic in topics]
+    router_elapsed = time.perf_counter() - started
+
+    mismatches = sum(1 for linear, route in zip(linear_results, router_results) if linear != (route.target if route else None))
+    logger.info(f"{topic_count} topics, {speaker_count} speakers, {len(know_commands)} commands")
+    logger.info(f"linear | total: {linear_elapsed * 1000:8.2f} ms | per topic: {linear_elapsed / topic_count * 1e6:6.2f} us")
+    logger.info(f"trie   | total: {router_elapsed * 1000:8.2f} ms | per topic: {router_elapsed / topic_count * 1e6:6.2f} us")
+    if mismatches:
+        check_failed(f"{mismatches} topics routed differently")
+
+
+# ---------------------------------------------------------------------------
+# Mixer CPU cost per mixed second
+# ---------------------------------------------------------------------------
+
+def action_mixer_cpu(seconds: float, channels: int, frame_rate: int):
+    mixer = AudioMixer(channels=channels, frame_rate=frame_rate, logger=logger)
+    total_frames = int(seconds * frame_rate)
+    logger.info(f"Mixing {seconds}s at {frame_rate} Hz, {channels} channels, {mixer.block_frames} frames per block")
+    for stream_count in (1, 4, 8):
+        streams = []
+        for i in range(stream_count):
+            samples = np.random.randint(-12000, 12000, size=(total_frames, channels), dtype=np.int16)
+            streams.append(MixerStream(f"stream{i}", samples, PlaybackHandle(f"stream{i}"), gain=1.0 if i % 2 == 0 else 0.7))
+        started = time.process_time()
+        while not all(stream.is_exhausted() for stream in streams):
+            mixer.mix_block(streams, mixer.block_frames).tobytes()
+        cpu_time = time.process_time() - started
+        logger.info(f"{stream_count} streams | cpu: {cpu_time * 1000:8.2f} ms | per mixed second: {cpu_time / seconds * 1000:6.3f} ms ({cpu_time / seconds * 100:.2f}% of one core)")
+
+    # A TTS stream fed in odd-sized chunks: appends stay cheap, the mix matches the whole
+    # array and played chunks are let go as the position passes them
+    samples = np.random.randint(-12000, 12000, size=(total_frames, channels), dtype=np.int16)
+    chunk_frames = max(1, int(frame_rate * 0.137))
+    streamed = MixerStream("streamed", samples[:0], PlaybackHandle("streamed"), complete=False)
+    started = time.process_time()
+    for offset in range(0, total_frames, chunk_frames):
+        streamed.append(samples[offset:offset + chunk_frames])
+    append_time = time.process_time() - started
+    streamed.complete = True
+    whole = MixerStream("whole", samples, PlaybackHandle("whole"))
+    played_held = 0
+    while not whole.is_exhausted():
+        if not np.array_equal(mixer.mix_block([streamed], mixer.block_frames), mixer.mix_block([whole], mixer.block_frames)):
+            check_failed(f"Chunked stream mixed differently at frame {whole.position}")
+            break
+        played_held = max(played_held, streamed.get_buffered_frames() - (streamed.length - streamed.position))
+    logger.info(f"{-(-total_frames // chunk_frames)} appends in {append_time * 1000:.2f} ms cpu | most played frames still held: {played_held}")
+    if played_held >= chunk_frames:
+        check_failed("Played chunks are kept in memory")
+
+
+# ---------------------------------------------------------------------------
+# Channels load: many rooms at once through the playback channels
+# ---------------------------------------------------------------------------
+
+def build_channel_rooms(room_count: int) -> DeviceRegistry:
+    # Every third room shares a speaker with the previous one, so some rooms group into one channel
+    speakers = build_offline_speakers(room_count, relay_delay=0)
+    config_data = {"rooms": []}
+    for i, speaker in enumerate(speakers):
+        devices = [speaker.get_id()]
+        if i % 3 == 2:
+            devices.append(speakers[i - 1].get_id())
+        config_data["rooms"].append({"name": f"room{i}", "devices": devices})
+    return DeviceRegistry(speakers, RoomController(config_data, logger=logger), logger=logger)
+
+
+def action_channels_load(room_count: int, request_count: int, duration: float, wake_delay: float):
+    registry = build_channel_rooms(room_count)
+    engine = AsyncPlaybackEngine(logger=logger)
+    channels = PlaybackChannels(registry.get_room_groups(), logger=logger)
+    audio_speaker_manager = AudioSpeakerManager(logger=logger)
+    room_names = registry.get_room_names("all")
+    starting_channels: dict[str, str] = {}
+    violations = []
+    finished = []
+    all_finished = threading.Event()
+
+    def finish(playback_id: str, speakers: list):
+        removed = audio_speaker_manager.remove_audio_from_all_speakers(playback_id)
+        if {speaker.get_id() for speaker in removed} != {speaker.get_id() for speaker in speakers}:
+            violations.append(f"{playback_id} released {[s.get_id() for s in removed]}")
+        channels.notify_finished(playback_id)
+        finished.append(playback_id)
+        if len(finished) == request_count:
+            all_finished.set()
+
+    async def simulated_playback(rooms_topic: str, playback_id: str) -> bool:
+        channel_keys = channels.get_channel_keys(registry.get_room_names(rooms_topic))
+        # Channels order starts, a second start on a channel before the first one returned is a violation
+        for key in channel_keys:
+            if key in starting_channels:
+                violations.append(f"{playback_id} started while {starting_channels[key]} was starting on channel {key}")
+            starting_channels[key] = playback_id
+        speakers = registry.get_speakers_for_rooms(rooms_topic)
+        for speaker in speakers:
+            audio_speaker_manager.add_playing_speaker(speaker, playback_id)
+        await asyncio.sleep(wake_delay)
+        for key in channel_keys:
+            starting_channels.pop(key, None)
+        asyncio.get_running_loop().call_later(duration, finish, playback_id, speakers)
+        return True
+
+    started = time.perf_counter()
+    for request_index in range(request_count):
+        rooms_topic = random.choice(room_names)
+        if random.random() < 0.1:
+            rooms_topic = "-".join(random.sample(room_names, 2))
+        job_factory = lambda playback_id, rooms_topic=rooms_topic: simulated_playback(rooms_topic, playback_id)
+        engine.call(channels.submit, registry.get_room_names(rooms_topic), f"audio{request_index}", 0, job_factory)
+    all_finished.wait()
+    elapsed = time.perf_counter() - started
+
+    serial_estimate = request_count * (duration + wake_delay)
+    channel_count = len(set(registry.get_room_groups().values()))
+    logger.info(f"{request_count} requests over {room_count} rooms / {channel_count} channels in {elapsed:.2f}s (single queue: >= {serial_estimate:.2f}s)")
+    leftover = [speaker.get_id() for speaker in registry.get_speakers_for_rooms("all") if speaker not in audio_speaker_manager.get_empty_speakers()]
+    if leftover:
+        violations.append(f"speakers still holding audios: {leftover}")
+    for violation in violations:
+        check_failed(violation)
+    if not violations:
+        logger.info("No channel started two audios at once and speaker bookkeeping is balanced")
+
+
+# ---------------------------------------------------------------------------
+# TTS cache: cache hits vs synthesis through a stub backend
+# ---------------------------------------------------------------------------
+
+def build_offline_tts_generator(sounds_folder: str, tts_backend, tts_config: dict = None, fallback_backend=None) -> TextToSpeechGenerator:
+    # Keeps the character quota of the benchmark away from conf/charactersSended.txt
+    TextToSpeechGenerator.used_chars_filename = os.path.join(sounds_folder, "charactersSended.txt")
+    tts_config = {**(tts_config or {}), "defaultBackend": tts_backend.name}
+    backends = {tts_backend.name: tts_backend}
+    if fallback_backend is not None:
+        tts_config["fallbackBackend"] = TextToSpeechGenerator.BACKEND_LOCAL
+        backends[TextToSpeechGenerator.BACKEND_LOCAL] = fallback_backend
+    return TextToSpeechGenerator(None, sounds_folder=sounds_folder, logger=logger, tts_config=tts_config, backends=backends)
+
+
+class FlakyTTSService(FakeTTSService):
+    # Fails its first request and records how many requests ever overlapped
+    def __init__(self, latency: float):
+        super().__init__(latency=latency)
+        self.failures_left = 1
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_audio(self, text_to_send, filename, language="en"):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failing = self.failures_left > 0
+            self.failures_left -= 1
+        try:
+            if failing:
+                time.sleep(self.latency)
+                raise RuntimeError("backend unavailable")
+            super().generate_audio(text_to_send, filename, language)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def check_synthesis_after_failure(latency: float):
+    # Two requests wait on a failing synthesis, a third arrives while the second one retries
+    flaky_tts = FlakyTTSService(latency=latency)
+    with tempfile.TemporaryDirectory() as sounds_folder:
+        generator = build_offline_tts_generator(sounds_folder, flaky_tts)
+        requests = [threading.Thread(target=generator.generate_audio_file, args=("Se ha abierto la puerta del garaje", "es")) for _ in range(3)]
+        requests[0].start()
+        time.sleep(latency / 4)
+        requests[1].start()
+        time.sleep(latency)
+        requests[2].start()
+        for request in requests:
+            request.join()
+        logger.info(f"Synthesis after a failure: backend requests {flaky_tts.requests + 1} | at once: {flaky_tts.max_in_flight}")
+        if flaky_tts.max_in_flight > 1 or flaky_tts.requests != 1:
+            check_failed(f"Phrase synthesised {flaky_tts.requests} times after a failure, {flaky_tts.max_in_flight} at once")
+
+
+def action_tts_cache(phrase_count: int, repeats: int, latency: float):
+    phrases = [f"Recordatorio numero {i}: es hora de la comida de las gatas." for i in range(phrase_count)]
+    fake_tts = FakeTTSService(latency=latency)
+    with tempfile.TemporaryDirectory() as sounds_folder:
+        generator = build_offline_tts_generator(sounds_folder, fake_tts)
+        miss_latencies, hit_latencies = [], []
+        for round_index in range(repeats):
+            for phrase in phrases:
+                # Whitespace differences must not defeat the cache
+                text = phrase if round_index % 2 == 0 else f"  {phrase.replace(' ', '  ')} "
+                started = time.perf_counter()
+                generator.generate_audio_file(text, "es")
+                (miss_latencies if round_index == 0 else hit_latencies).append(time.perf_counter() - started)
+        log_latencies("synthesis", miss_latencies)
+        log_latencies("cache hit", hit_latencies)
+        logger.info(f"TTS cache: {generator.tts_cache.get_stats()} | backend requests: {fake_tts.requests} | characters charged: {fake_tts.characters}")
+        if fake_tts.requests != phrase_count:
+            check_failed(f"Expected {phrase_count} backend requests, got {fake_tts.requests}")
+    check_synthesis_after_failure(latency)
+
+
+# ---------------------------------------------------------------------------
+# TTS chunks: serial vs parallel chunk synthesis against a local HTTP server
+# ---------------------------------------------------------------------------
+
+class HttpTTSService(GoogleTTSService):
+    # GoogleTTSService with the Google client swapped for the local fake server
+    def __init__(self, url: str, max_workers: int):
+        self.url = url
+        self.chunk_synthesizer = ChunkSynthesizer(logger=logger, max_workers=max_workers, retry_delay=0.05)
+
+    def _synthesize_speech(self, text_to_send, language="en"):
+        request = urllib.request.Request(self.url, data=json.dumps({"text": text_to_send, "language": language}).encode('utf-8'), method="POST")
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.read()
+
+
+def action_tts_chunks(max_chunks: int, latency: float, failure_rate: float, max_workers: int):
+    fake_tts = FakeTTSService(latency=latency, seconds_per_character=0.002)
+    server = FakeTTSServer(fake_tts, failure_rate=failure_rate)
+    server.start()
+    logger.info(f"Fake TTS server at {server.get_url()} | latency: {latency}s | failure rate: {failure_rate:.0%}")
+    services = {"serial": HttpTTSService(server.get_url(), max_workers=1), "parallel": HttpTTSService(server.get_url(), max_workers=max_workers)}
+    with tempfile.TemporaryDirectory() as output_folder:
+        chunk_count = 1
+        while chunk_count <= max_chunks:
+            # One newline-separated paragraph of ~400 bytes per chunk
+            text = "\n".join(f"Parrafo {i}. " + "La puerta del garaje se ha abierto. " * 11 for i in range(chunk_count))
+            results = []
+            for label, tts_service in services.items():
+                output_path = os.path.join(output_folder, f"{label}_{chunk_count}.wav")
+                started = time.perf_counter()
+                tts_service.generate_audio(text, output_path, "es")
+                results.append(f"{label}: {time.perf_counter() - started:6.2f}s")
+            with open(os.path.join(output_folder, f"serial_{chunk_count}.wav"), 'rb') as serial_file, open(os.path.join(output_folder, f"parallel_{chunk_count}.wav"), 'rb') as parallel_file:
+                identical = serial_file.read() == parallel_file.read()
+            logger.info(f"{chunk_count} chunks | {' | '.join(results)} | identical output: {identical}")
+            if not identical:
+                check_failed(f"{chunk_count} chunks: parallel synthesis differs from the serial one")
+            chunk_count *= 2
+    server.stop()
+
+
+# ---------------------------------------------------------------------------
+# TTS streaming: time to first sample, whole file vs streamed chunks
+# ---------------------------------------------------------------------------
+
+def play_tts_stream(audio_process_manager: AudioProcessManager, finished: threading.Event, tts_stream: TtsStream, wait_for_synthesis: bool) -> float:
+    if wait_for_synthesis:
+        tts_stream.wait()
+    audio_process_manager.first_sample_histogram = LatencyHistogram("stream.first_sample")
+    finished.clear()
+    audio_process_manager.execute_audio_process(AudioConfig(id=tts_stream.audio_id, file_name="", stream=tts_stream))
+    finished.wait()
+    return audio_process_manager.first_sample_histogram.get_mean()
+
+
+def action_tts_streaming(max_chunks: int, latency: float):
+    fake_tts = FakeTTSService(latency=latency, seconds_per_character=0.02)
+    finished = threading.Event()
+    with tempfile.TemporaryDirectory() as sink_folder:
+        audio_process_manager = AudioProcessManager("", logger=logger, playback_config={"sink": "file", "sinkFile": os.path.join(sink_folder, "sink")})
+        audio_process_manager.set_finished_listener(lambda audio_id: finished.set())
+        chunk_count = 1
+        while chunk_count <= max_chunks:
+            text = "\n".join(f"Linea {i} del anuncio, la puerta del garaje sigue abierta." for i in range(chunk_count))
+            whole_file = play_tts_stream(audio_process_manager, finished, TtsStream(f"file{chunk_count}", fake_tts.synthesize_chunks(text), logger=logger), True)
+            streamed = play_tts_stream(audio_process_manager, finished, TtsStream(f"stream{chunk_count}", fake_tts.synthesize_chunks(text), logger=logger), False)
+            logger.info(f"{chunk_count} chunks | first sample, whole file: {whole_file * 1000:7.0f} ms | streamed: {streamed * 1000:7.0f} ms")
+            # A single chunk is the whole file either way
+            if chunk_count > 1 and streamed > whole_file:
+                check_failed(f"{chunk_count} chunks: the streamed first sample came after the whole file one")
+            chunk_count *= 2
+
+        # First-sample callbacks run without the mixer lock, another thread can use the mixer meanwhile
+        mixer = audio_process_manager.mixer
+        unlocked = threading.Event()
+        def on_first_sample():
+            other = threading.Thread(target=mixer.set_gain, args=("unlocked", 0.5), daemon=True)
+            other.start()
+            other.join(1.0)
+            if not other.is_alive():
+                unlocked.set()
+        stream = mixer.open_stream("unlocked", PlaybackHandle("unlocked"), on_first_sample=on_first_sample)
+        finished.clear()
+        mixer.append_stream(stream, PcmAudio(bytes(mixer.frame_rate * mixer.channels * 2 // 10), mixer.channels, 2, mixer.frame_rate))
+        mixer.close_stream(stream)
+        finished.wait(5.0)
+        if not unlocked.is_set():
+            check_failed("First-sample callback ran holding the mixer lock")
+
+
+# ---------------------------------------------------------------------------
+# WAV assembly: in-memory assembler vs the file based AudioMerger
+# ---------------------------------------------------------------------------
+
+class AudioMerger:
+    # The file based merge GoogleTTSService used before WavAssembler, kept as the reference output
+    @classmethod
+    def merge_audio_files(cls, file_paths, output_path):
+        output_file = cls._create_output_file(file_paths[0], output_path)
+
+        for file_path in file_paths:
+            input_file = cls._open_input_file(file_path)
+            cls._append_audio_data(output_file, input_file)
+            input_file.close()
+
+        output_file.close()
+
+    @staticmethod
+    def _create_output_file(first_file_path, output_path):
+        with closing(wave.open(first_file_path, 'rb')) as first_file:
+            output_file = wave.open(output_path, 'wb')
+            output_file.setnchannels(first_file.getnchannels())
+            output_file.setsampwidth(first_file.getsampwidth())
+            output_file.setframerate(first_file.getframerate())
+            return output_file
+
+    @staticmethod
+    def _open_input_file(file_path):
+        input_file = wave.open(file_path, 'rb')
+        return input_file
+
+    @staticmethod
+    def _append_audio_data(output_file, input_file):
+        num_frames = input_file.getnframes()
+        audio_data = input_file.readframes(num_frames)
+        output_file.writeframes(audio_data)
+
+
+def random_wav_chunks(chunk_count: int) -> list[bytes]:
+    channels, sample_width, frame_rate = random.choice([(1, 2, 24000), (2, 2, 44100), (1, 1, 8000), (2, 4, 48000)])
+    wav_chunks = []
+    for _ in range(chunk_count):
+        frames = random.choice([0, 1, random.randint(2, 48000)])
+        pcm = np.random.bytes(frames * channels * sample_width)
+        wav_chunks.append(PcmAudio(pcm, channels, sample_width, frame_rate).to_wav_bytes())
+    return wav_chunks
+
+
+def action_wav_assembly(case_count: int):
+    mismatches = 0
+    merger_time = assembler_time = 0.0
+    merger_bytes = assembler_bytes = 0
+    with tempfile.TemporaryDirectory() as temp_folder:
+        for case_index in range(case_count):
+            wav_chunks = random_wav_chunks(random.randint(1, 8))
+            started = time.perf_counter()
+            chunk_paths = []
+            for i, wav_bytes in enumerate(wav_chunks):
+                chunk_paths.append(os.path.join(temp_folder, f"output_temp_{i}.wav"))
+                with open(chunk_paths[-1], 'wb') as chunk_file:
+                    chunk_file.write(wav_bytes)
+            merged_path = os.path.join(temp_folder, "merged.wav")
+            AudioMerger.merge_audio_files(chunk_paths, merged_path)
+            with open(merged_path, 'rb') as merged_file:
+                merged = merged_file.read()
+            merger_time += time.perf_counter() - started
+            merger_bytes += sum(len(wav_bytes) for wav_bytes in wav_chunks) + len(merged)
+
+            started = time.perf_counter()
+            assembled = WavAssembler.assemble(wav_chunks)
+            assembler_time += time.perf_counter() - started
+            assembler_bytes += len(assembled)
+            if assembled != merged:
+                mismatches += 1
+                check_failed(f"Case {case_index}: assembled WAV differs from AudioMerger output ({len(assembled)} vs {len(merged)} bytes)")
+    logger.info(f"AudioMerger  | {merger_time * 1000:8.2f} ms | {merger_bytes / 1024:8.0f} KiB written to disk")
+    logger.info(f"WavAssembler | {assembler_time * 1000:8.2f} ms | {assembler_bytes / 1024:8.0f} KiB written once by the caller")
+    if not mismatches:
+        logger.info(f"All {case_count} cases byte-identical")
+
+
+# ---------------------------------------------------------------------------
+# TTS concurrency: simultaneous announcements get their own ids and files
+# ---------------------------------------------------------------------------
+
+def action_tts_concurrency(request_count: int, phrase_count: int, streaming: bool):
+    fake_tts = FakeTTSService(latency=0.1, seconds_per_character=0.01)
+    audio_controller = AudioController({"audios": [{"id": "tts", "file_name": "output.wav", "priority": 5}]}, logger=logger)
+    phrases = [f"Anuncio {i}: la lavadora ha terminado." for i in range(phrase_count)]
+    registered = {}
+    registered_lock = threading.Lock()
+
+    def announce(request_index: int):
+        text = phrases[request_index % phrase_count]
+        if streaming:
+            tts_audio = generator.generate_audio_stream(text, "es")
+        else:
+            tts_audio = generator.generate_audio_file(text, "es") + (None,)
+        tts_name, file_name, tts_stream = tts_audio
+        audio_id = audio_controller.register_ephemeral_audio(tts_name, file_name, base_audio_id="tts", stream=tts_stream)
+        with registered_lock:
+            registered[audio_id] = (text, tts_stream)
+
+    with tempfile.TemporaryDirectory() as sounds_folder:
+        generator = build_offline_tts_generator(sounds_folder, fake_tts)
+        workers = [threading.Thread(target=announce, args=(i,)) for i in range(request_count)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        for text, tts_stream in registered.values():
+            if tts_stream is not None:
+                tts_stream.wait()
+        time.sleep(0.1)
+        elapsed = time.perf_counter() - started
+
+        errors = []
+        if len(registered) != request_count:
+            errors.append(f"{request_count} requests produced {len(registered)} distinct audio ids")
+        for audio_id, (text, _) in registered.items():
+            audio_config = audio_controller.get_audio_config_by_id(audio_id)
+            audio = PcmAudio.from_wav_file(os.path.join(sounds_folder, audio_config.file_name))
+            expected_frames = int(len(text) * fake_tts.seconds_per_character * fake_tts.frame_rate)
+            if len(audio.pcm) // audio.get_bytes_per_frame() != expected_frames:
+                errors.append(f"{audio_id} holds the audio of another phrase")
+        leftovers = [file_name for file_name in os.listdir(generator.tts_cache.cache_folder) if TtsCache.TEMP_EXTENSION in file_name]
+        if leftovers:
+            errors.append(f"temporary files left behind: {leftovers}")
+        for audio_id in registered:
+            audio_controller.unregister_audio(audio_id)
+        if audio_controller.get_ephemeral_ids():
+            errors.append(f"ephemeral ids not released: {audio_controller.get_ephemeral_ids()}")
+
+        logger.info(f"{request_count} announcements of {phrase_count} phrases in {elapsed:.2f}s | backend requests: {fake_tts.requests} | {generator.tts_cache.get_stats()}")
+        for error in errors:
+            check_failed(error)
+        if not errors:
+            logger.info("Every request got its own id and its own phrase, no temporary files left")
+
+
+# ---------------------------------------------------------------------------
+# TTS flood: speaker status latency while TTS commands pour in
+# ---------------------------------------------------------------------------
+
+def action_tts_flood(command_count: int, latency: float, worker_count: int, max_queue: int):
+    broker = FakeMqttBroker()
+    tts_commands = [{"topic": "speaker-message/+/tts-es", "commandName": "Reproduce Tts-Es"}]
+    handlers = {}
+    status_sent_at = deque()
+    latencies = []
+    mean_latencies = {}
+
+    def on_mqtt_message(topic: str, message: str):
+        route = router.resolve(topic)
+        if route is None:
+            return
+        if route.route_type == TopicRoute.TYPE_SPEAKER:
+            route.target.update_status_from_message(message)
+            # Delivery is in order, so the oldest send time belongs to this message
+            latencies.append(time.perf_counter() - status_sent_at.popleft())
+        else:
+            handlers["tts"](message)
+
+    mqtt_config = MqttConfig(broker_address="fake", subscription_topics=tts_commands)
+    MqttService(mqtt_config=mqtt_config, process_message=on_mqtt_message, logger=logger, client=FakeMqttClient(client_id="SpeakerManager", broker=broker))
+    speaker = SpeakerDevice(id="speaker0", type="TASMOTA", status={"0": "OFF", "1": "ON"}, template="%_v%",
+                            publish_topic="speakers/cmnd/speaker0/POWER", subscribe_topic="speakers/stat/speaker0/POWER")
+    router = TopicRouter.from_subscriptions([speaker], tts_commands)
+    publisher = FakeMqttClient(client_id="Publisher", broker=broker)
+    publisher.connect()
+
+    fake_tts = FakeTTSService(latency=latency, seconds_per_character=0.001)
+    with tempfile.TemporaryDirectory() as sounds_folder:
+        generator = build_offline_tts_generator(sounds_folder, fake_tts)
+        pool = TtsWorkerPool(lambda job: generator.generate_audio_file(job.text, job.language), logger=logger, worker_count=worker_count, max_queue=max_queue)
+        modes = [
+            ("inline", lambda message: generator.generate_audio_file(message, "es")),
+            ("worker pool", lambda message: pool.submit(TtsJob(message, "cocina", "es"))),
+        ]
+        for label, handler in modes:
+            handlers["tts"] = handler
+            latencies.clear()
+            for i in range(command_count):
+                publisher.publish("speaker-message/cocina/tts-es", f"{label}: anuncio numero {i}")
+                status_sent_at.append(time.perf_counter())
+                publisher.publish(speaker.get_subscribe_topic(), "ON" if i % 2 == 0 else "OFF")
+            while len(latencies) < command_count:
+                time.sleep(0.01)
+            log_latencies(label, latencies)
+            mean_latencies[label] = statistics.mean(latencies)
+        while pool.get_metrics()["processed"] + pool.dropped_count + pool.merged_count < command_count:
+            time.sleep(0.05)
+        logger.info(f"Worker pool: {pool.get_metrics()} | backend requests: {fake_tts.requests}")
+        if mean_latencies["worker pool"] > latency / 2:
+            check_failed(f"Speaker status waited for the synthesis with the worker pool: {mean_latencies['worker pool'] * 1000:.0f}ms")
+
+
+# ---------------------------------------------------------------------------
+# Quota ledger: per-request quota cost with a long history, and thread safety
+# ---------------------------------------------------------------------------
+
+def write_quota_history(file_path: str, day_count: int):
+    first_day = datetime.date.today() - datetime.timedelta(days=day_count)
+    with open(file_path, 'w') as history_file:
+        for i in range(day_count):
+            history_file.write(f"{(first_day + datetime.timedelta(days=i)).strftime('%Y-%m-%d')},{random.randint(0, 30000)}\n")
+
+
+def action_quota_ledger(day_count: int, request_count: int, thread_count: int):
+    with tempfile.TemporaryDirectory() as folder:
+        csv_path = os.path.join(folder, "csv.txt")
+        ledger_path = os.path.join(folder, "ledger.txt")
+        write_quota_history(csv_path, day_count)
+        write_quota_history(ledger_path, day_count)
+
+        storage = CSVStorage(csv_path)
+        csv_latencies = []
+        for _ in range(request_count):
+            started = time.perf_counter()
+            # Same calls the generator made per request: check, then charge
+            storage.get_value_for_date()
+            storage.increase_value_for_today_by(40)
+            csv_latencies.append(time.perf_counter() - started)
+        log_latencies(f"CSVStorage ({day_count} days)", csv_latencies)
+
+        started = time.perf_counter()
+        ledger = QuotaLedger(ledger_path)
+        logger.info(f"Ledger loaded in {(time.perf_counter() - started) * 1000:.1f}ms")
+        ledger_latencies = []
+        for _ in range(request_count):
+            started = time.perf_counter()
+            ledger.reserve(40, 10 ** 9, 10 ** 9)
+            ledger_latencies.append(time.perf_counter() - started)
+        log_latencies(f"QuotaLedger ({day_count} days)", ledger_latencies)
+        if storage.get_value_for_date() != ledger.get_today():
+            check_failed(f"Totals differ: csv {storage.get_value_for_date()} vs ledger {ledger.get_today()}")
+
+        # Many threads race for the last characters of the day: exactly the limit must be granted
+        race_path = os.path.join(folder, "race.txt")
+        ledger = QuotaLedger(race_path, compact_every=50)
+        daily_limit = 1000
+        granted = []
+        barrier = threading.Barrier(thread_count)
+
+        def reserve_many():
+            barrier.wait()
+            for _ in range(request_count):
+                if ledger.reserve(7, daily_limit, 10 ** 9):
+                    granted.append(7)
+
+        threads = [threading.Thread(target=reserve_many) for _ in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reloaded = QuotaLedger(race_path).get_today()
+        expected = daily_limit - daily_limit % 7
+        logger.info(f"{thread_count} threads granted {sum(granted)} chars (limit {daily_limit}) | in memory: {ledger.get_today()} | reloaded: {reloaded}")
+        if not (sum(granted) == ledger.get_today() == reloaded == expected):
+            check_failed(f"Quota race lost characters, expected {expected}")
+
+
+# ---------------------------------------------------------------------------
+# TTS phrases: startup warm-up of pre-rendered phrases
+# ---------------------------------------------------------------------------
+
+def action_tts_phrases(phrase_count: int, latency: float, cache_entries: int):
+    phrases_config = [{"id": f"phrase{i}", "text": f"Aviso {i}: la puerta del garaje sigue abierta", "language": "es"} for i in range(phrase_count)]
+    fake_tts = FakeTTSService(latency=latency)
+    with tempfile.TemporaryDirectory() as sounds_folder:
+        # A cache smaller than the phrase library, pinned phrases must survive eviction anyway
+        generator = build_offline_tts_generator(sounds_folder, fake_tts, {"cacheMaxEntries": cache_entries})
+        ready = []
+        started = time.perf_counter()
+        warm_up_thread = generator.warm_up_phrases(phrases_config, on_phrase_ready=lambda phrase_id, file_name: ready.append(phrase_id))
+        logger.info(f"warm_up_phrases returned after {(time.perf_counter() - started) * 1000:.2f}ms")
+
+        miss_latencies = []
+        for i in range(phrase_count):
+            started = time.perf_counter()
+            generator.generate_audio_file(f"Anuncio sin plantilla numero {i}", "es")
+            miss_latencies.append(time.perf_counter() - started)
+        warm_up_thread.join()
+
+        match_latencies = []
+        for phrase in phrases_config:
+            started = time.perf_counter()
+            phrase_audio_id = generator.get_phrase_audio_id(f" {phrase['text']} ", "es")
+            match_latencies.append(time.perf_counter() - started)
+            if phrase_audio_id != phrase["id"]:
+                check_failed(f"Phrase [{phrase['id']}] not matched")
+        log_latencies("synthesised", miss_latencies)
+        log_latencies("phrase match", match_latencies)
+        missing = [phrase["id"] for phrase in phrases_config if generator.tts_cache.get(TtsCache.get_key(phrase["text"], "es", fake_tts.get_voice_signature("es"))) is None]
+        logger.info(f"{len(ready)}/{phrase_count} phrases ready | evicted: {len(missing)} | {generator.tts_cache.get_stats()}")
+        if missing:
+            check_failed(f"Pinned phrases evicted: {missing}")
+
+        # A queued announcement keeps its file however many phrases come after it, until it is released
+        _, file_name = generator.generate_audio_file("Anuncio en cola, la puerta del garaje", "es")
+        generator.pin_audio_file(file_name)
+        for i in range(cache_entries * 2):
+            generator.generate_audio_file(f"Anuncio de relleno numero {i}", "es")
+        if not os.path.exists(os.path.join(sounds_folder, file_name)):
+            check_failed("Queued announcement evicted from the cache")
+        generator.unpin_audio_file(file_name)
+        for i in range(cache_entries * 2):
+            generator.generate_audio_file(f"Segundo anuncio de relleno numero {i}", "es")
+        if os.path.exists(os.path.join(sounds_folder, file_name)):
+            check_failed("Released announcement still pinned")
+
+
+# ---------------------------------------------------------------------------
+# TTS backends: offline throughput and fallback from a slow or exhausted cloud
+# ---------------------------------------------------------------------------
+
+def measure_backend_throughput(label: str, tts_backend, phrases: list[str], output_folder: str):
+    audio_seconds = 0.0
+    started = time.perf_counter()
+    for i, phrase in enumerate(phrases):
+        output_path = os.path.join(output_folder, f"{label}_{i}.wav")
+        tts_backend.generate_audio(phrase, output_path, "es")
+        audio_seconds += PcmAudio.from_wav_file(output_path).get_duration()
+    elapsed = time.perf_counter() - started
+    logger.info(f"{label:>10} | {len(phrases)} phrases in {elapsed:.2f}s | {elapsed / len(phrases) * 1000:.0f}ms per phrase | {audio_seconds / elapsed:.1f}x realtime")
+
+
+def action_tts_backends(request_count: int, slow_latency: float, fallback_timeout: float):
+    phrases = [f"Aviso {i}: la temperatura del invernadero es de {20 + i} grados" for i in range(request_count)]
+    with tempfile.TemporaryDirectory() as sounds_folder:
+        measure_backend_throughput("fake", FakeTTSService(latency=0, metered=False), phrases, sounds_folder)
+        local_tts = LocalTTSService()
+        if local_tts.is_available():
+            measure_backend_throughput(local_tts.engine, local_tts, phrases, sounds_folder)
+        else:
+            logger.info("No local TTS engine installed (espeak-ng), local throughput skipped")
+
+    # Different frame rates give the two fakes different voice signatures, so separate cache keys
+    cloud_tts = FakeTTSService(latency=slow_latency, metered=True)
+    offline_tts = FakeTTSService(latency=0.05, frame_rate=16000, metered=False)
+    tts_config = {"fallbackTimeout": fallback_timeout}
+    for streaming in (False, True):
+        mode = "stream" if streaming else "file"
+        with tempfile.TemporaryDirectory() as sounds_folder:
+            generator = build_offline_tts_generator(sounds_folder, cloud_tts, tts_config, fallback_backend=offline_tts)
+
+            def request(text: str) -> float:
+                started = time.perf_counter()
+                if streaming:
+                    audio_id, file_name, tts_stream = generator.generate_audio_stream(text, "es")
+                    if tts_stream is not None:
+                        tts_stream.wait_first_chunk()
+                else:
+                    generator.generate_audio_file(text, "es")
+                return time.perf_counter() - started
+
+            slow_latencies = [request(phrase) for phrase in phrases]
+            time.sleep(slow_latency + 0.2)
+            late_latencies = [request(phrase) for phrase in phrases]
+            log_latencies(f"{mode} slow cloud", slow_latencies)
+            log_latencies(f"{mode} late cached", late_latencies)
+
+            # With the daily quota used up every request goes straight to the local engine
+            generator.max_characters_per_day = generator.quota_ledger.get_today()
+            cloud_requests = cloud_tts.requests
+            quota_latencies = [request(f"{phrase} (sin cuota)") for phrase in phrases]
+            if cloud_tts.requests != cloud_requests:
+                check_failed(f"{mode}: {cloud_tts.requests - cloud_requests} cloud requests over quota")
+            log_latencies(f"{mode} over quota", quota_latencies)
+            logger.info(f"{mode}: cloud requests {cloud_tts.requests} | local requests {offline_tts.requests} | charged today {generator.quota_ledger.get_today()} | {generator.tts_cache.get_stats()}")
+            # Late cloud results are still being written into this folder
+            time.sleep(slow_latency + 0.2)
+
+
+# ---------------------------------------------------------------------------
+# Spotify ducking: playback-path cost of ducking against a local Web API stub
+# ---------------------------------------------------------------------------
+
+def wait_until(condition, timeout: float = 10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.001)
+
+
+def action_spotify_ducking(announcements: int, latency: float, refresh_interval: float):
+    server = FakeSpotifyServer(device_name="Speaker", latency=latency)
+    server.start()
+    original_volume = server.device["volume_percent"]
+
+    # What every announcement used to wait for: a device lookup, the volume call and a 0.5 s pause
+    client = SpotifyWebClient(server.get_url(), lambda: "token", logger=logger)
+    blocking_latencies = []
+    for _ in range(announcements):
+        client._devices_etag = None
+        started = time.perf_counter()
+        device = client.get_devices()[0]
+        client.set_volume(int(device.volume_percent * 0.8), device.id)
+        time.sleep(0.5)
+        blocking_latencies.append(time.perf_counter() - started)
+        client.set_volume(original_volume, device.id)
+    log_latencies("blocking duck", blocking_latencies)
+
+    config_data = {"spotify": {"librespotName": "Speaker", "refreshInterval": refresh_interval}}
+    librespot = LibreSpotService(logger=logger)
+    librespot.update_status("play")
+    service = SpotifyService(config_data, logger=logger, web_client=SpotifyWebClient(server.get_url(), lambda: "token", logger=logger), librespot=librespot)
+    wait_until(service.is_librespot_playing)
+    call_latencies, applied_latencies = [], []
+    for _ in range(announcements):
+        changes = len(server.volume_changes)
+        started = time.perf_counter()
+        service.decrease_volume_if_necessary()
+        call_latencies.append(time.perf_counter() - started)
+        wait_until(lambda: len(server.volume_changes) > changes)
+        applied_latencies.append(server.volume_changes[-1][0] - started)
+        service.restore_volume()
+        wait_until(lambda: len(server.volume_changes) > changes + 1)
+    log_latencies("async duck call", call_latencies)
+    log_latencies("volume applied", applied_latencies)
+
+    requests_before, not_modified_before = server.requests, server.not_modified
+    time.sleep(refresh_interval * 10)
+    logger.info(f"Refresher over {refresh_interval * 10:.1f}s: {server.requests - requests_before} polls, {server.not_modified - not_modified_before} answered 304")
+
+    # Once librespot stops the refresher polls once more and parks
+    librespot.update_status("stop")
+    service.request_refresh()
+    time.sleep(refresh_interval)
+    requests_before = server.requests
+    time.sleep(refresh_interval * 10)
+    logger.info(f"Refresher with librespot stopped over {refresh_interval * 10:.1f}s: {server.requests - requests_before} polls")
+    if server.requests != requests_before:
+        check_failed("The refresher kept polling while librespot was idle")
+    if server.device["volume_percent"] != original_volume:
+        check_failed(f"Volume not restored: {server.device['volume_percent']} instead of {original_volume}")
+    server.stop()
+
+
+# ---------------------------------------------------------------------------
+# Librespot ducking: local mixer first, Web API only as a fallback
+# ---------------------------------------------------------------------------
+
+class CannedPulseMixer(LibrespotMixer):
+    # Answers pactl from memory, like a PulseAudio with one librespot stream
+    PACTL_OUTPUT = (
+        "Sink Input #12\n\tDriver: protocol-native.c\n\tVolume: front-left: 65536 / {volume}% / 0.00 dB,   front-right: 65536 / {volume}% / 0.00 dB\n"
+        "\tProperties:\n\t\tapplication.name = \"{application}\"\n"
+        "Sink Input #13\n\tVolume: front-left: 65536 / 100% / 0.00 dB\n\tProperties:\n\t\tapplication.name = \"aplay\"\n")
+
+    def __init__(self, logger: CustomLogging, application: str = "librespot"):
+        super().__init__({"type": LibrespotMixer.MIXER_PULSE}, logger=logger)
+        self.application = application
+        self.volume_percent = 70
+        self.volume_changes: list[tuple[float, int]] = []
+
+    def _run(self, command: list[str]) -> str:
+        if command[:2] == ['pactl', 'set-sink-input-volume'] and command[2] == "12":
+            self.volume_percent = int(command[3].rstrip("%"))
+            self.volume_changes.append((time.perf_counter(), self.volume_percent))
+            return ""
+        return self.PACTL_OUTPUT.format(volume=self.volume_percent, application=self.application)
+
+
+def duck_and_restore(service: SpotifyService, volume_changes: list, announcements: int) -> list[float]:
+    applied_latencies = []
+    for _ in range(announcements):
+        changes = len(volume_changes)
+        started = time.perf_counter()
+        service.decrease_volume_if_necessary()
+        wait_until(lambda: len(volume_changes) > changes)
+        applied_latencies.append(volume_changes[-1][0] - started)
+        service.restore_volume()
+        wait_until(lambda: len(volume_changes) > changes + 1)
+    return applied_latencies
+
+
+def action_librespot_ducking(announcements: int, latency: float):
+    amixer_output = "Simple mixer control 'Master',0\n  Limits: Playback 0 - 65536\n  Mono:\n  Front Left: Playback 52428 [80%] [on]\n"
+    if LibrespotMixer.parse_amixer_volume(amixer_output) != 80:
+        check_failed("amixer output not parsed")
+    if LibrespotMixer.parse_pulse_sink_input(CannedPulseMixer.PACTL_OUTPUT.format(volume=55, application="librespot"), "librespot") != ("12", 55):
+        check_failed("pactl output not parsed")
+    shared_mixer = LibrespotMixer({"type": LibrespotMixer.MIXER_ALSA, "card": 0, "control": "Master"}, logger=logger, reserved_controls=[("0", "Master")])
+    if shared_mixer.is_enabled():
+        check_failed("Local mixer accepted the control Set Volume writes")
+
+    server = FakeSpotifyServer(device_name="Speaker", latency=latency)
+    server.start()
+    config_data = {"spotify": {"librespotName": "Speaker"}}
+    librespot = LibreSpotService(logger=logger)
+    librespot.update_status("play")
+
+    local_mixer = CannedPulseMixer(logger)
+    service = SpotifyService(config_data, logger=logger, web_client=SpotifyWebClient(server.get_url(), lambda: "token", logger=logger), librespot=librespot, local_mixer=local_mixer)
+    local_latencies = duck_and_restore(service, local_mixer.volume_changes, announcements)
+    log_latencies("local mixer", local_latencies)
+    logger.info(f"Local mixer: Web API requests {server.requests} | volume back to {local_mixer.volume_percent}")
+
+    # No librespot stream in PulseAudio: the Web API takes over, the hook's volume saves the lookup
+    librespot.update_status(f"{LibreSpotService.VOLUME_EVENT_PREFIX}60")
+    missing_mixer = CannedPulseMixer(logger, application="another-player")
+    service = SpotifyService(config_data, logger=logger, web_client=SpotifyWebClient(server.get_url(), lambda: "token", logger=logger), librespot=librespot, local_mixer=missing_mixer)
+    requests_before = server.requests
+    fallback_latencies = duck_and_restore(service, server.volume_changes, announcements)
+    log_latencies("Web API fallback", fallback_latencies)
+    logger.info(f"Web API fallback: {server.requests - requests_before} requests for {announcements} announcements, device polls included")
+    if server.device["volume_percent"] != 60:
+        check_failed(f"Volume not restored: {server.device['volume_percent']}")
+    server.stop()
+
+
+# ---------------------------------------------------------------------------
+# Volume burst: one fork per message vs a coalescing controller
+# ---------------------------------------------------------------------------
+
+def action_volume_burst(message_count: int, interval: float):
+    # A slider dragged from 0 to 100; "true" through a shell stands for the old amixer fork
+    volumes = [round(index * 100 / max(message_count - 1, 1)) for index in range(message_count)]
+    fork_latencies = []
+    for volume in volumes[:min(message_count, 50)]:
+        started = time.perf_counter()
+        subprocess.run(f"true {volume}", shell=True)
+        fork_latencies.append(time.perf_counter() - started)
+    log_latencies("fork per message", fork_latencies)
+    fork_cost = statistics.median(fork_latencies)
+
+    mixers: dict = {}
+    def mixer_factory(card):
+        mixers[card] = FakeVolumeMixer(card, apply_latency=fork_cost)
+        return mixers[card]
+
+    volume_config = {"card": 0, "control": "Master", "rooms": {"sala": {"card": 1, "control": "PCM"}}}
+    controller = VolumeController(volume_config, logger=logger, mixer_factory=mixer_factory)
+    call_latencies = []
+    for volume in volumes:
+        started = time.perf_counter()
+        controller.set_volume(str(volume))
+        call_latencies.append(time.perf_counter() - started)
+        time.sleep(interval)
+    controller.wait_idle(timeout=5)
+    log_latencies("coalesced set_volume call", call_latencies)
+    writes = len(mixers[0].changes)
+    logger.info(f"{message_count} messages every {interval * 1000:.0f}ms -> {writes} mixer writes | final volume {mixers[0].volumes.get('Master')}")
+    if mixers[0].volumes.get("Master") != volumes[-1]:
+        check_failed(f"Latest volume not applied: {mixers[0].volumes.get('Master')} instead of {volumes[-1]}")
+
+    # Per room: "sala" has its own control, the other rooms share the default one
+    controller.set_volume("35", ["sala"])
+    controller.set_volume("80", ["cocina", "sala"])
+    controller.set_volume("20", ["sala"])
+    controller.wait_idle(timeout=5)
+    logger.info(f"Per room: card 0 Master {mixers[0].volumes.get('Master')} | card 1 PCM {mixers[1].volumes.get('PCM')} | sala reads {controller.get_volume('sala')}")
+    if mixers[0].volumes.get("Master") != 80 or mixers[1].volumes.get("PCM") != 20:
+        check_failed("Per room volumes not applied")
+    if controller.set_volume("loud") or controller.set_volume("150"):
+        check_failed("Invalid volume accepted")
+
+
+# ---------------------------------------------------------------------------
+# Gain ramps: fades and ducking envelopes applied per sample in the mixer
+# ---------------------------------------------------------------------------
+
+def mix_until_exhausted(mixer: AudioMixer, streams: list[MixerStream], max_blocks: int) -> np.ndarray:
+    blocks = []
+    while not all(stream.is_exhausted() for stream in streams) and len(blocks) < max_blocks:
+        blocks.append(mixer.mix_block(streams, mixer.block_frames))
+    return np.concatenate(blocks)
+
+
+def action_gain_ramps(ramp_duration: float, seconds: float):
+    if ramp_duration <= 0:
+        check_failed("The ramp duration has to be positive")
+        return
+    mixer = AudioMixer(channels=2, frame_rate=44100, logger=logger)
+    ramp_frames = mixer.to_frames(ramp_duration)
+    level = 10000
+    samples = np.full((int(seconds * mixer.frame_rate), 2), level, dtype=np.int16)
+
+    # Fade in, duck to 0.3 and fade out on a constant signal, the output is the gain envelope
+    stream = mixer._create_stream("ramped", samples, PlaybackHandle("ramped"), 1.0, ramp_duration, complete=True)
+    mixer._streams.append(stream)
+    envelope = [mixer.mix_block([stream], mixer.block_frames) for _ in range(20)]
+    mixer.set_gain("ramped", 0.3, ramp_duration=ramp_duration)
+    envelope += [mixer.mix_block([stream], mixer.block_frames) for _ in range(20)]
+    fade_started = sum(len(block) for block in envelope)
+    mixer.fade_out("ramped", ramp_duration)
+    envelope.append(mix_until_exhausted(mixer, [stream], 1000))
+    envelope = np.concatenate(envelope)[:, 0].astype(np.int32)
+    max_step = int(np.abs(np.diff(envelope)).max())
+    fade_frames = np.count_nonzero(envelope[fade_started:]) + 1
+    logger.info(f"Ramp of {ramp_frames} frames | largest sample-to-sample step: {max_step} (a gain step would jump {level} on fade, {int(level * 0.7)} on ducking)")
+    logger.info(f"Fade out ended after {fade_frames} frames | last sample {envelope[-1]} | ducked level {envelope[fade_started - 1]}")
+    if envelope[ramp_frames - 1] != level or envelope[fade_started - 1] != int(level * 0.3) or envelope[-1] != 0:
+        check_failed("Envelope did not reach its targets")
+    if abs(fade_frames - ramp_frames) > 1 or max_step > level / ramp_frames + 2:
+        check_failed("Ramps are not sample-accurate")
+
+    # CPU cost with every stream always ramping vs flat gains
+    for ramping in (False, True):
+        streams = [MixerStream(f"stream{i}", np.random.randint(-12000, 12000, size=samples.shape, dtype=np.int16), PlaybackHandle(f"stream{i}"), gain=0.7) for i in range(8)]
+        started = time.process_time()
+        block_index = 0
+        while not all(stream.is_exhausted() for stream in streams):
+            if ramping and block_index % 5 == 0:
+                for stream in streams:
+                    stream.ramp_gain(0.3 if stream.gain > 0.5 else 0.9, ramp_frames)
+            mixer.mix_block(streams, mixer.block_frames)
+            block_index += 1
+        cpu_time = time.process_time() - started
+        logger.info(f"8 streams {'always ramping' if ramping else 'flat gain'} | cpu per mixed second: {cpu_time / seconds * 1000:6.3f} ms")
+
+
+# ---------------------------------------------------------------------------
+# Chromecast pool: background discovery and warm sessions vs per-device lookups
+# ---------------------------------------------------------------------------
+
+def play_with_polling(cast: FakeCast, media_url: str):
+    # What _play_media used to do once the cast was connected
+    media_controller = cast.media_controller
+    media_controller.play_media(media_url, 'audio/wav')
+    while(not media_controller.status.player_is_playing):
+        time.sleep(0.02)
+
+
+def action_chromecast_pool(cast_count: int, discovery_latency: float, play_latency: float, plays: int):
+    names = [f"Cast {i}" for i in range(cast_count)]
+    config_data = {"chromecasts": {"devices": names, "hostPath": "http://127.0.0.1:8000/sounds"}}
+
+    # get_listed_chromecasts blocked for a whole discovery per device, one after another
+    logger.info(f"Sequential lookups would block startup for about {cast_count * discovery_latency * 1000:.0f}ms")
+
+    casts = [FakeCast(name, connect_latency=0.2, play_latency=play_latency) for name in names]
+    pool = ChromecastPool(logger=logger, discovery=FakeCastDiscovery(casts, discovery_latency=discovery_latency), discovery_timeout=discovery_latency * 3 + 1)
+    started = time.perf_counter()
+    devices = ChromecastAudioDevice.list_from_json(config_data, pool)
+    startup = time.perf_counter() - started
+    ready = pool.wait_ready(timeout=discovery_latency * 3 + 1)
+    all_ready = time.perf_counter() - started
+    logger.info(f"Pool startup: {startup * 1000:.2f}ms | all {cast_count} casts connected after {all_ready * 1000:.0f}ms")
+    if not ready:
+        check_failed("Not every cast connected")
+
+    media_url = f"{config_data['chromecasts']['hostPath']}/welcome.wav"
+    polling_latencies = []
+    for _ in range(plays):
+        started = time.perf_counter()
+        play_with_polling(casts[0], media_url)
+        polling_latencies.append(time.perf_counter() - started)
+    log_latencies("time to play, 20ms polling", polling_latencies)
+    callback_latencies = []
+    for _ in range(plays):
+        started = time.perf_counter()
+        if not devices[0].play_audio("welcome.wav"):
+            check_failed("Play failed")
+        callback_latencies.append(time.perf_counter() - started)
+    log_latencies("time to play, status callback", callback_latencies)
+    logger.info(f"Overhead above the cast's own {play_latency * 1000:.0f}ms: polling {(statistics.mean(polling_latencies) - play_latency) * 1000:.2f}ms | callback {(statistics.mean(callback_latencies) - play_latency) * 1000:.2f}ms")
+
+    # A dropped cast is played as soon as it reconnects
+    casts[-1].drop(reconnect_after=0.5)
+    started = time.perf_counter()
+    played = devices[-1].play_audio("welcome.wav")
+    logger.info(f"Play during a drop: {'played' if played else 'FAILED'} after {(time.perf_counter() - started) * 1000:.0f}ms | connections: {pool.get_session(names[-1]).connections}")
+    if not played:
+        check_failed("Play after reconnection failed")
+
+    # Past the discovery window a cast that was never found is skipped without waiting
+    time.sleep(pool.get_startup_wait())
+    started = time.perf_counter()
+    sessions = pool.get_sessions(names + ["Offline cast"], pool.get_startup_wait())
+    lookup = time.perf_counter() - started
+    logger.info(f"Session lookup with an offline cast: {len(sessions)} of {cast_count + 1} found in {lookup * 1000:.2f}ms")
+    if len(sessions) != cast_count or lookup > 0.05:
+        check_failed("The offline cast delayed the lookup")
+    pool.stop()
+
+
+# ---------------------------------------------------------------------------
+# Chromecast fan-out: one cast after another vs parallel load and common start
+# ---------------------------------------------------------------------------
+
+def build_fake_cast_pool(casts: list[FakeCast]) -> tuple[ChromecastPool, list[ChromecastAudioDevice]]:
+    config_data = {"chromecasts": {"devices": [cast.name for cast in casts], "hostPath": "http://127.0.0.1:8000/sounds"}}
+    pool = ChromecastPool(logger=logger, discovery=FakeCastDiscovery(casts, discovery_latency=0.05))
+    devices = ChromecastAudioDevice.list_from_json(config_data, pool)
+    pool.wait_ready(timeout=5)
+    return pool, devices
+
+
+def get_start_skew(casts: list[FakeCast], since: float) -> float:
+    starts = [next(played_at for played_at, _ in cast.played if played_at >= since) for cast in casts]
+    return max(starts) - min(starts)
+
+
+def action_chromecast_fan_out(cast_count: int, max_load_latency: float, tolerance: float):
+    random.seed(7)
+    casts = [FakeCast(f"Cast {i}", play_latency=random.uniform(0.2, max_load_latency), start_latency=random.uniform(0.005, 0.02)) for i in range(cast_count)]
+    pool, devices = build_fake_cast_pool(casts)
+    logger.info(f"Cast load latencies: {', '.join(f'{cast.play_latency * 1000:.0f}ms' for cast in casts)}")
+
+    started = time.monotonic()
+    for device in devices:
+        device.play_audio("welcome.wav")
+    logger.info(f"One after another: {(time.monotonic() - started) * 1000:.0f}ms until the last cast plays | start skew {get_start_skew(casts, started) * 1000:.0f}ms")
+
+    fan_out = ChromecastFanOut(logger=logger, start_tolerance=tolerance, sync_timeout=max_load_latency + 1.0)
+    local_start = []
+    started = time.monotonic()
+    skews = fan_out.play([device.get_session() for device in devices], devices[0].get_media_url("welcome.wav"), on_start=lambda: local_start.append(time.monotonic()))
+    spread = max(skews.values()) - min(skews.values())
+    logger.info(f"Fan-out: {(time.monotonic() - started) * 1000:.0f}ms until the last cast plays | start skew {spread * 1000:.0f}ms | local sink started {(local_start[0] - started) * 1000:.0f}ms in, with the casts")
+    if len(skews) != cast_count or spread > tolerance:
+        check_failed(f"Casts not started together: {skews}")
+
+    # A cast slower than sync_timeout does not hold the others back
+    casts[-1].play_latency = 1.5
+    fan_out.sync_timeout = max_load_latency + 0.2
+    skews = fan_out.play([device.get_session() for device in devices], devices[0].get_media_url("welcome.wav"))
+    logger.info(f"With a slow cast: {len(skews)} of {cast_count} played | late cast skew {skews.get(casts[-1].name, 0) * 1000:.0f}ms")
+    pool.stop()
+
+
+# ---------------------------------------------------------------------------
+# Audio server: embedded in-memory server vs a plain file server
+# ---------------------------------------------------------------------------
+
+def fetch(url: str, headers: dict = None) -> tuple[int, bytes, dict]:
+    request = urllib.request.Request(url, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read(), dict(response.headers)
+    except urllib.error.HTTPError as error:
+        return error.code, error.read(), dict(error.headers)
+
+
+def measure_server_throughput(label: str, urls: list[str], client_count: int, request_count: int):
+    latencies = []
+    transferred = [0]
+    lock = threading.Lock()
+
+    def client(client_index: int):
+        for request_index in range(request_count):
+            started = time.perf_counter()
+            status, body, _ = fetch(urls[(client_index + request_index) % len(urls)])
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                transferred[0] += len(body)
+            if status != 200:
+                check_failed(f"{label}: HTTP {status}")
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(client_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    log_latencies(label, latencies)
+    logger.info(f"{label}: {len(latencies) / elapsed:.0f} req/s | {transferred[0] / elapsed / 1024 / 1024:.0f} MB/s with {client_count} clients")
+
+
+def action_audio_server(client_count: int, request_count: int, file_seconds: float):
+    with tempfile.TemporaryDirectory() as sounds_folder:
+        file_names = []
+        for index in range(4):
+            samples = (np.sin(np.arange(int(44100 * file_seconds)) * (index + 1) * 0.05) * 8000).astype(np.int16)
+            audio = PcmAudio(np.repeat(samples.reshape(-1, 1), 2, axis=1).tobytes(), 2, 2, 44100)
+            file_names.append(f"sound{index}.wav")
+            with open(os.path.join(sounds_folder, file_names[-1]), 'wb') as sound_file:
+                sound_file.write(audio.to_wav_bytes())
+
+        handler = lambda *args, **kwargs: SimpleHTTPRequestHandler(*args, directory=sounds_folder, **kwargs)
+        SimpleHTTPRequestHandler.log_message = lambda *args: None
+        file_server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        file_server.daemon_threads = True
+        threading.Thread(target=file_server.serve_forever, daemon=True).start()
+        file_urls = [f"http://127.0.0.1:{file_server.server_address[1]}/{file_name}" for file_name in file_names]
+        measure_server_throughput("plain file server", file_urls, client_count, request_count)
+        file_server.shutdown()
+
+        audio_server = AudioHttpServer(sounds_folder, logger=logger, server_config={"bindAddress": "127.0.0.1", "port": 0, "advertisedHost": "127.0.0.1"})
+        audio_server.start()
+        urls = [audio_server.get_url(file_name) for file_name in file_names]
+        measure_server_throughput("embedded server", urls, client_count, request_count)
+
+        # Protocol checks a cast relies on
+        with open(os.path.join(sounds_folder, file_names[0]), 'rb') as sound_file:
+            original = sound_file.read()
+        status, body, headers = fetch(urls[0], {"Range": "bytes=1000-1999"})
+        if status != 206 or body != original[1000:2000] or headers.get("Content-Range") != f"bytes 1000-1999/{len(original)}":
+            check_failed(f"Range not served: {status} {headers.get('Content-Range')}")
+        status, body, _ = fetch(urls[0], {"Range": "bytes=-500"})
+        if status != 206 or body != original[-500:]:
+            check_failed("Suffix range not served")
+        status, _, _ = fetch(urls[0], {"Range": f"bytes={len(original)}-"})
+        if status != 416:
+            check_failed(f"Range past the end answered {status}")
+        status, _, _ = fetch(urls[0], {"If-None-Match": headers["ETag"]})
+        if status != 304:
+            check_failed(f"Matching ETag answered {status}")
+        status, _, _ = fetch(f"{audio_server.get_base_url()}{AudioHttpServer.URL_PREFIX}..%2F..%2Fetc%2Fpasswd")
+        if status != 404:
+            check_failed(f"Path outside the sounds folder answered {status}")
+        logger.info("Range, suffix range, 416, ETag 304 and path checks done")
+
+        status, body, headers = fetch(f"{urls[0]}?format={AudioHttpServer.FORMAT_WAV_MONO}")
+        logger.info(f"wavMono transcode: {len(original) / 1024:.0f} KB -> {len(body) / 1024:.0f} KB ({headers.get('Content-Type')})")
+
+        # A TTS file requested while it is still being synthesised
+        def slow_chunks():
+            for _ in range(3):
+                time.sleep(0.2)
+                yield PcmAudio(np.zeros((4410, 1), dtype=np.int16).tobytes(), 1, 2, 44100).to_wav_bytes()
+        audio_server.register_stream("tts_cache/pending.wav", TtsStream("tts-pending", slow_chunks(), logger=logger))
+        started = time.perf_counter()
+        status, body, _ = fetch(audio_server.get_url("tts_cache/pending.wav"))
+        duration = PcmAudio.from_wav_bytes(body).get_duration() if status == 200 else 0
+        logger.info(f"TTS stream served after {(time.perf_counter() - started) * 1000:.0f}ms | HTTP {status} | {duration:.2f}s of audio from memory")
+        if status != 200 or abs(duration - 0.3) > 0.01:
+            check_failed("TTS stream not served")
+        audio_server.stop()
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="SpeakerManager benchmarks — offline measurements of the request and playback paths.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    p = sub.add_parser("dispatch-latency", help="Time from MQTT message to audio process start, old polling loop vs SpeakerManager")
+    p.add_argument("--messages", type=int, default=25, help="Number of simulated MQTT messages")
+    p.add_argument("--interval", type=float, default=0.3, help="Maximum random spacing between messages (s)")
+    p.add_argument("--max-latency", type=float, default=50.0, help="Slowest allowed SpeakerManager dispatch (ms)")
+
+    p = sub.add_parser("async-engine", help="Concurrent per-room pipelines through the async engine and a fake broker")
+    p.add_argument("--rooms", type=int, default=4, help="Number of rooms, one speaker each")
+    p.add_argument("--requests", type=int, default=3, help="Requests queued per room")
+    p.add_argument("--relay-delay", type=float, default=0.05, help="Simulated Tasmota acknowledgement delay (s)")
+
+    p = sub.add_parser("topic-routing", help="Route synthetic topics with linear scans vs the topic trie")
+    p.add_argument("--topics", type=int, default=5000, help="Number of synthetic inbound topics")
+    p.add_argument("--speakers", type=int, default=40, help="Number of synthetic Tasmota speakers")
+
+    p = sub.add_parser("mixer-cpu", help="CPU cost per mixed second with 1, 4 and 8 simultaneous streams")
+    p.add_argument("--seconds", type=float, default=30, help="Seconds of audio mixed per run")
+    p.add_argument("--channels", type=int, default=2, help="Mixer channels")
+    p.add_argument("--rate", type=int, default=44100, help="Mixer frame rate")
+
+    p = sub.add_parser("channels-load", help="Fire requests at many rooms at once through the playback channels")
+    p.add_argument("--rooms", type=int, default=12, help="Number of rooms, every third shares a speaker")
+    p.add_argument("--requests", type=int, default=60, help="Requests fired at random rooms")
+    p.add_argument("--duration", type=float, default=0.3, help="Simulated audio length (s)")
+    p.add_argument("--wake-delay", type=float, default=0.05, help="Simulated speaker wake time (s)")
+
+    p = sub.add_parser("tts-cache", help="Cache-hit latency vs synthesis latency with a stub TTS backend")
+    p.add_argument("--phrases", type=int, default=10, help="Distinct phrases announced")
+    p.add_argument("--repeats", type=int, default=5, help="Times each phrase is announced")
+    p.add_argument("--latency", type=float, default=0.4, help="Simulated synthesis latency (s)")
+
+    p = sub.add_parser("tts-chunks", help="Serial vs parallel chunk synthesis against a local fake TTS server")
+    p.add_argument("--max-chunks", type=int, default=8, help="Largest chunk count, doubling from 1")
+    p.add_argument("--latency", type=float, default=0.3, help="Simulated synthesis latency per request (s)")
+    p.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with a 503")
+    p.add_argument("--workers", type=int, default=4, help="Parallel synthesis workers")
+
+    p = sub.add_parser("tts-streaming", help="Time to first sample, whole-file TTS vs streamed chunks")
+    p.add_argument("--max-chunks", type=int, default=8, help="Largest chunk count, doubling from 1")
+    p.add_argument("--latency", type=float, default=0.3, help="Simulated synthesis latency per chunk (s)")
+
+    p = sub.add_parser("wav-assembly", help="Check the in-memory WAV assembler is byte-identical to AudioMerger")
+    p.add_argument("--cases", type=int, default=50, help="Random chunk sets compared")
+
+    p = sub.add_parser("tts-concurrency", help="Simultaneous TTS requests get unique ids and intact audio")
+    p.add_argument("--requests", type=int, default=40, help="Announcements fired at once")
+    p.add_argument("--phrases", type=int, default=8, help="Distinct phrases among them")
+    p.add_argument("--file", action="store_true", help="Synthesise whole files instead of streams")
+
+    p = sub.add_parser("tts-flood", help="Speaker status latency while TTS commands flood the MQTT thread")
+    p.add_argument("--commands", type=int, default=12, help="TTS commands, each followed by a speaker status message")
+    p.add_argument("--latency", type=float, default=0.3, help="Simulated synthesis latency (s)")
+    p.add_argument("--workers", type=int, default=2, help="TTS worker threads")
+    p.add_argument("--max-queue", type=int, default=8, help="Bounded TTS queue size")
+
+    p = sub.add_parser("quota-ledger", help="Per-request quota cost, CSVStorage vs the in-memory ledger")
+    p.add_argument("--days", type=int, default=1000, help="Days of history already in the file")
+    p.add_argument("--requests", type=int, default=200, help="Requests to charge")
+    p.add_argument("--threads", type=int, default=8, help="Threads racing for the daily limit")
+
+    p = sub.add_parser("tts-phrases", help="Background warm-up of pre-rendered TTS phrases vs live synthesis")
+    p.add_argument("--phrases", type=int, default=10, help="Phrases in the library")
+    p.add_argument("--latency", type=float, default=0.2, help="Simulated synthesis latency (s)")
+    p.add_argument("--cache-entries", type=int, default=4, help="TTS cache size in entries")
+
+    p = sub.add_parser("tts-backends", help="Offline backend throughput and fallback from a slow or exhausted cloud backend")
+    p.add_argument("--requests", type=int, default=6, help="Distinct phrases per run")
+    p.add_argument("--slow-latency", type=float, default=1.5, help="Latency of the slow cloud backend (s)")
+    p.add_argument("--fallback-timeout", type=float, default=0.3, help="Wait before falling back to the local backend (s)")
+
+    p = sub.add_parser("spotify-ducking", help="Playback-path cost of Spotify ducking against a local Web API stub")
+    p.add_argument("--announcements", type=int, default=10, help="Announcements to duck for")
+    p.add_argument("--latency", type=float, default=0.15, help="Web API round-trip latency (s)")
+    p.add_argument("--refresh-interval", type=float, default=0.5, help="Device refresh interval (s)")
+
+    p = sub.add_parser("librespot-ducking", help="Ducking through the local librespot mixer vs the Web API fallback")
+    p.add_argument("--announcements", type=int, default=10, help="Announcements to duck for")
+    p.add_argument("--latency", type=float, default=0.15, help="Web API round-trip latency (s)")
+
+    p = sub.add_parser("volume-burst", help="Set Volume bursts: fork per message vs the coalescing controller")
+    p.add_argument("--messages", type=int, default=200, help="Volume messages in the burst")
+    p.add_argument("--interval", type=float, default=0.0, help="Seconds between messages, 0 replays a queued burst")
+
+    p = sub.add_parser("gain-ramps", help="Sample-accurate fades and ducking envelopes in the mixer")
+    p.add_argument("--ramp", type=float, default=0.05, help="Ramp duration (s)")
+    p.add_argument("--seconds", type=float, default=10.0, help="Audio seconds mixed for the CPU measurement")
+
+    p = sub.add_parser("chromecast-pool", help="Chromecast startup and time-to-play against fake casts")
+    p.add_argument("--casts", type=int, default=4, help="Configured casts")
+    p.add_argument("--discovery-latency", type=float, default=1.5, help="mDNS discovery time per cast (s)")
+    p.add_argument("--play-latency", type=float, default=0.3, help="Time a cast takes to start playing (s)")
+    p.add_argument("--plays", type=int, default=10, help="Plays measured per method")
+
+    p = sub.add_parser("chromecast-fan-out", help="Multi-cast playback: sequential vs parallel load with a common start")
+    p.add_argument("--casts", type=int, default=4, help="Target casts")
+    p.add_argument("--max-load-latency", type=float, default=0.8, help="Slowest cast load time (s)")
+    p.add_argument("--tolerance", type=float, default=0.05, help="Accepted start skew (s)")
+
+    p = sub.add_parser("audio-server", help="Embedded audio server throughput and protocol checks")
+    p.add_argument("--clients", type=int, default=16, help="Concurrent local clients")
+    p.add_argument("--requests", type=int, default=20, help="Requests per client")
+    p.add_argument("--file-seconds", type=float, default=10.0, help="Length of each served sound (s)")
+
+    return parser
+
+
+def main():
+    global logger
+    CustomLogging.configure_project(project_name="benchmark", force_reconfigure=True)
+    logger = CustomLogging(component_name="Benchmark")
+
+    args = build_parser().parse_args()
+
+    if args.action == "dispatch-latency":
+        action_dispatch_latency(args.messages, args.interval, args.max_latency)
+    elif args.action == "async-engine":
+        action_async_engine(args.rooms, args.requests, args.relay_delay)
+    elif args.action == "topic-routing":
+        action_topic_routing(args.topics, args.speakers)
+    elif args.action == "mixer-cpu":
+        action_mixer_cpu(args.seconds, args.channels, args.rate)
+    elif args.action == "channels-load":
+        action_channels_load(args.rooms, args.requests, args.duration, args.wake_delay)
+    elif args.action == "tts-cache":
+        action_tts_cache(args.phrases, args.repeats, args.latency)
+    elif args.action == "tts-chunks":
+        action_tts_chunks(args.max_chunks, args.latency, args.failure_rate, args.workers)
+    elif args.action == "tts-streaming":
+        action_tts_streaming(args.max_chunks, args.latency)
+    elif args.action == "wav-assembly":
+        action_wav_assembly(args.cases)
+    elif args.action == "tts-concurrency":
+        action_tts_concurrency(args.requests, args.phrases, not args.file)
+    elif args.action == "tts-flood":
+        action_tts_flood(args.commands, args.latency, args.workers, args.max_queue)
+    elif args.action == "quota-ledger":
+        action_quota_ledger(args.days, args.requests, args.threads)
+    elif args.action == "tts-phrases":
+        action_tts_phrases(args.phrases, args.latency, args.cache_entries)
+    elif args.action == "tts-backends":
+        action_tts_backends(args.requests, args.slow_latency, args.fallback_timeout)
+    elif args.action == "spotify-ducking":
+        action_spotify_ducking(args.announcements, args.latency, args.refresh_interval)
+    elif args.action == "librespot-ducking":
+        action_librespot_ducking(args.announcements, args.latency)
+    elif args.action == "volume-burst":
+        action_volume_burst(args.messages, args.interval)
+    elif args.action == "gain-ramps":
+        action_gain_ramps(args.ramp, args.seconds)
+    elif args.action == "chromecast-pool":
+        action_chromecast_pool(args.casts, args.discovery_latency, args.play_latency, args.plays)
+    elif args.action == "chromecast-fan-out":
+        action_chromecast_fan_out(args.casts, args.max_load_latency, args.tolerance)
+    elif args.action == "audio-server":
+        action_audio_server(args.clients, args.requests, args.file_seconds)
+
+    if failed_checks:
+        sys.exit(f"{len(failed_checks)} checks failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,45 @@
+import heapq
+import threading
+import time
+from collections import deque
 from zarus_core import CustomLogging
+from utils.latency_histogram import LatencyHistogram
 
 class AudioRequests():
-    def __init__(self,audioId,rooms):
+    def __init__(self,audioId,rooms,priority=0):
         self.audioId = audioId
         self.rooms = rooms
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.coalesced = 0
+
+    def get_coalesce_key(self):
+        return (self.audioId, self.rooms.lower())
 
 class AudioConfig:
-    def __init__(self, id=None, file_name=None):
+    def __init__(self, id=None, file_name=None, gain=1.0, priority=0, preempt=False, stream=None, ramp_duration=None):
         self.id = id
         self.file_name = file_name
+        self.gain = gain
+        self.priority = priority
+        self.preempt = preempt
+        self.stream = stream
+        self.ramp_duration = ramp_duration
 
     @classmethod
     def from_json(cls, audio_data):
         audio_config = AudioConfig(
             id=audio_data['id'],
-            file_name=audio_data['file_name']
+            file_name=audio_data['file_name'],
+            gain=audio_data.get('gain', 1.0),
+            priority=audio_data.get('priority', 0),
+            preempt=audio_data.get('preempt', False),
+            ramp_duration=audio_data.get('rampDuration')
         )
         return audio_config
+
+    def copy_for_playback(self, playback_id):
+        return AudioConfig(id=playback_id, file_name=self.file_name, gain=self.gain, priority=self.priority, preempt=self.preempt, stream=self.stream, ramp_duration=self.ramp_duration)
     
     @classmethod
     def list_from_json(cls,config_data):
@@ -30,44 +53,96 @@ class AudioConfig:
 class AudioController:
     _instance = None
     audios_list: list[AudioConfig]
+    audios_by_id: dict
     queueFilesToReproduce: list
-    queueFilesToStop: list
+    queueFilesToStop: deque
     queue_files_playing: dict
+    pending_requests: dict
+    ephemeral_ids: set
     
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance.audios_list = []
+            cls._instance.audios_by_id = {}
             cls._instance.queueFilesToReproduce = []
-            cls._instance.queueFilesToStop = []
+            cls._instance.queueFilesToStop = deque()
             cls._instance.queue_files_playing = {}
+            cls._instance.pending_requests = {}
+            cls._instance.queue_lock = threading.Lock()
+            cls._instance.queue_sequence = 0
+            cls._instance.wait_time_histogram = LatencyHistogram("queue.wait")
+            cls._instance.coalesced_count = 0
+            cls._instance.ephemeral_ids = set()
+            cls._instance.ephemeral_sequence = 0
+            cls._instance.audios_lock = threading.Lock()
         return cls._instance
     
     def __init__(self, config_data, logger:CustomLogging) -> None:
         self.logger = logger
         self.logger.info("Creating Audio Controller...")
         self.audios_list = AudioConfig.list_from_json(config_data)
+        self.audios_by_id = {}
+        for audio_config in self.audios_list:
+            self.audios_by_id.setdefault(audio_config.id, audio_config)
 
     def get_next_to_reproduce(self):
-        if(len(self.queueFilesToReproduce)>0):
-            return self.queueFilesToReproduce.pop(0)
+        with self.queue_lock:
+            if(len(self.queueFilesToReproduce)>0):
+                return heapq.heappop(self.queueFilesToReproduce)[2]
         return None
+
+    def mark_request_started(self, audioRequests: AudioRequests):
+        # Requests stay coalescable until their playback actually begins
+        with self.queue_lock:
+            if(self.pending_requests.get(audioRequests.get_coalesce_key()) is audioRequests):
+                del self.pending_requests[audioRequests.get_coalesce_key()]
+        wait_time = time.monotonic() - audioRequests.queued_at
+        self.wait_time_histogram.record(wait_time)
+        self.logger.info(f"Audio request started: [{audioRequests.audioId}] | waited: {wait_time * 1000:.0f}ms | queue depth: {self.get_queue_depth()}")
         
     def get_next_to_stop(self):
-        if(len(self.queueFilesToStop)>0):
-            return self.queueFilesToStop.pop(0)
+        with self.queue_lock:
+            if(len(self.queueFilesToStop)>0):
+                return self.queueFilesToStop.popleft()
         return None
     
     def add_next_to_reproduce(self, audioRequests: AudioRequests):
-        self.logger.info(f"Adding new audio to reproduce in queue: [{audioRequests.audioId}] to rooms: [{audioRequests.rooms}]")
-        self.queueFilesToReproduce.append(audioRequests)
+        with self.queue_lock:
+            pending = self.pending_requests.get(audioRequests.get_coalesce_key())
+            if(pending is not None):
+                pending.coalesced += 1
+                self.coalesced_count += 1
+                self.logger.info(f"Coalesced duplicate request: [{audioRequests.audioId}] to rooms: [{audioRequests.rooms}] | duplicates: {pending.coalesced}")
+                return
+            self.logger.info(f"Adding new audio to reproduce in queue: [{audioRequests.audioId}] to rooms: [{audioRequests.rooms}] | priority: {audioRequests.priority}")
+            self.pending_requests[audioRequests.get_coalesce_key()] = audioRequests
+            self.queue_sequence += 1
+            heapq.heappush(self.queueFilesToReproduce, (-audioRequests.priority, self.queue_sequence, audioRequests))
         
     def add_next_to_stop(self, audioRequests: AudioRequests):
         self.logger.info(f"Adding new audio to stop: [{audioRequests.audioId}] to rooms: [{audioRequests.rooms}]")
-        self.queueFilesToStop.append(audioRequests)
+        with self.queue_lock:
+            self.queueFilesToStop.append(audioRequests)
+
+    def get_priority(self, audio_id) -> int:
+        audio_config = self.get_audio_config_by_id(audio_id)
+        return audio_config.priority if audio_config is not None else 0
+
+    def get_queue_depth(self) -> int:
+        with self.queue_lock:
+            return len(self.pending_requests)
+
+    def get_queue_metrics(self) -> dict:
+        return {
+            "depth": self.get_queue_depth(),
+            "coalesced": self.coalesced_count,
+            "wait_mean": self.wait_time_histogram.get_mean(),
+            "wait_p95": self.wait_time_histogram.get_percentile(95)
+        }
 
     def add_new_audio_request(self, audioId, rooms, stop=False):
-        audio_requests = AudioRequests(audioId, rooms)
+        audio_requests = AudioRequests(audioId, rooms, priority=self.get_priority(audioId))
         if(stop):
             self.add_next_to_stop(audio_requests)    
         else:
@@ -88,8 +163,39 @@ class AudioController:
             self.logger.info(f"Audio removed from playing queue: [{audio_id}]")
             del self.queue_files_playing[audio_id]
 
+    def register_audio(self, audio_id, file_name, base_audio_id=None, stream=None) -> AudioConfig:
+        # Audios created at runtime (TTS) inherit gain and priority from a configured audio
+        base_config = self.get_audio_config_by_id(base_audio_id) or AudioConfig()
+        audio_config = AudioConfig(id=audio_id, file_name=file_name, gain=base_config.gain, priority=base_config.priority, preempt=base_config.preempt, stream=stream, ramp_duration=base_config.ramp_duration)
+        with self.audios_lock:
+            self.audios_by_id[audio_id] = audio_config
+        return audio_config
+
+    def register_ephemeral_audio(self, base_name, file_name, base_audio_id=None, stream=None) -> str:
+        # One id per request, dropped again by unregister_audio once it has been played
+        with self.audios_lock:
+            self.ephemeral_sequence += 1
+            audio_id = f"{base_name}-{self.ephemeral_sequence}"
+            self.ephemeral_ids.add(audio_id)
+        self.register_audio(audio_id, file_name, base_audio_id=base_audio_id, stream=stream)
+        return audio_id
+
+    def is_ephemeral(self, audio_id) -> bool:
+        with self.audios_lock:
+            return audio_id in self.ephemeral_ids
+
+    def get_ephemeral_ids(self) -> list:
+        with self.audios_lock:
+            return list(self.ephemeral_ids)
+
+    def unregister_audio(self, audio_id) -> AudioConfig:
+        with self.audios_lock:
+            self.ephemeral_ids.discard(audio_id)
+            return self.audios_by_id.pop(audio_id, None)
+
+    def is_file_in_use(self, file_name) -> bool:
+        with self.audios_lock:
+            return any(audio_config.file_name == file_name for audio_config in self.audios_by_id.values())
+
     def get_audio_config_by_id(self, audio_id):
-        for audio_config in self.audios_list:
-            if audio_config.id == audio_id:
-                return audio_config
-        return None
\ No newline at end of file
+        return self.audios_by_id.get(audio_id)
\ No newline at end of file
@@ -0,0 +1,319 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+from controllers.pcm_cache import PcmAudio
+from services.audio_sink import AudioSink
+from zarus_core import CustomLogging
+
+class MixerStream():
+    # Samples are kept as the chunks they arrived in, a chunk is dropped once
+    # the play position has passed it. position counts every frame mixed so far.
+    def __init__(self, audio_id: str, samples: np.ndarray, playback, gain: float = 1.0, complete: bool = True):
+        self.audio_id = audio_id
+        self._chunks: deque[np.ndarray] = deque()
+        self._empty = samples[:0]
+        self._chunk_offset = 0
+        self.length = 0
+        self.playback = playback
+        self.gain = gain
+        self.complete = complete
+        self.position = 0
+        self.end_frame = None
+        self.underruns = 0
+        self.on_first_sample = None
+        self.ramp_target = None
+        self.ramp_frames_left = 0
+        self.stop_after_ramp = False
+        self.append(samples)
+
+    def append(self, samples: np.ndarray):
+        if self.stop_after_ramp or len(samples) == 0:
+            return
+        self._chunks.append(samples)
+        self.length += len(samples)
+
+    def read(self, frames: int) -> np.ndarray:
+        # Up to frames samples from the play position on, across chunk boundaries
+        parts = []
+        wanted = frames
+        while wanted > 0 and self._chunks:
+            chunk = self._chunks[0]
+            part = chunk[self._chunk_offset:self._chunk_offset + wanted]
+            parts.append(part)
+            wanted -= len(part)
+            self._chunk_offset += len(part)
+            if self._chunk_offset >= len(chunk):
+                self._chunks.popleft()
+                self._chunk_offset = 0
+        self.position += frames - wanted
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return self._empty
+        return np.concatenate(parts)
+
+    def get_buffered_frames(self) -> int:
+        return sum(len(chunk) for chunk in self._chunks)
+
+    def truncate(self):
+        # Nothing past the play position is mixed any more
+        self._chunks.clear()
+        self._chunk_offset = 0
+        self.length = self.position
+
+    def ramp_gain(self, gain: float, ramp_frames: int):
+        if self.ramp_target is not None and gain == self.ramp_target:
+            return
+        if ramp_frames <= 0 or (self.ramp_target is None and gain == self.gain):
+            self.gain = gain
+            self.ramp_target = None
+            self.ramp_frames_left = 0
+            return
+        self.ramp_target = gain
+        self.ramp_frames_left = ramp_frames
+
+    def next_gain_curve(self, frames: int) -> np.ndarray:
+        # Linear per-frame gains for the next frames, None while the gain is flat
+        if self.ramp_target is None or frames == 0:
+            return None
+        steps = min(frames, self.ramp_frames_left)
+        curve = np.full(frames, self.ramp_target, dtype=np.float32)
+        curve[:steps] = self.gain + (self.ramp_target - self.gain) * np.arange(1, steps + 1, dtype=np.float32) / self.ramp_frames_left
+        self.ramp_frames_left -= steps
+        if self.ramp_frames_left == 0:
+            self.gain = self.ramp_target
+            self.ramp_target = None
+        else:
+            self.gain = float(curve[steps - 1])
+        return curve
+
+    def is_ramp_finished(self) -> bool:
+        return self.ramp_target is None
+
+    def is_exhausted(self) -> bool:
+        # Streams fed while playing stay alive until their producer closes them
+        return self.complete and self.position >= self.length
+
+
+class AudioMixer():
+    # Sums every active stream into int16 blocks for a single sink. Blocks are
+    # written write_ahead seconds ahead of the play clock, and a stream is
+    # reported finished once the clock passes its last sample.
+    SAMPLE_WIDTH = 2
+    INT16_MIN = -32768
+    INT16_MAX = 32767
+
+    def __init__(self, channels: int, frame_rate: int, logger:CustomLogging, block_duration: float = 0.02, write_ahead: float = 0.1):
+        self.logger = logger
+        self.channels = channels
+        self.frame_rate = frame_rate
+        self.block_frames = max(1, int(frame_rate * block_duration))
+        self.write_ahead = write_ahead
+        self.sink: AudioSink = None
+        self.on_stream_finished = None
+        self._streams: list[MixerStream] = []
+        self._draining: list[MixerStream] = []
+        self._condition = threading.Condition()
+        self._thread: threading.Thread = None
+
+    def get_format(self) -> tuple[int, int, int]:
+        return (self.channels, self.SAMPLE_WIDTH, self.frame_rate)
+
+    def set_sink(self, sink: AudioSink):
+        self.sink = sink
+
+    def set_finished_listener(self, on_stream_finished):
+        self.on_stream_finished = on_stream_finished
+
+    def prepare(self, audio: PcmAudio) -> PcmAudio:
+        if audio.get_format() == self.get_format():
+            return audio
+        samples = self._to_int16(audio)
+        samples = self._remix_channels(samples)
+        samples = self._resample(samples, audio.frame_rate)
+        return PcmAudio(samples.tobytes(), self.channels, self.SAMPLE_WIDTH, self.frame_rate)
+
+    @staticmethod
+    def _to_int16(audio: PcmAudio) -> np.ndarray:
+        if audio.sample_width == 1:
+            samples = (np.frombuffer(audio.pcm, dtype=np.uint8).astype(np.int16) - 128) << 8
+        elif audio.sample_width == 2:
+            samples = np.frombuffer(audio.pcm, dtype='<i2')
+        elif audio.sample_width == 4:
+            samples = (np.frombuffer(audio.pcm, dtype='<i4') >> 16).astype(np.int16)
+        else:
+            raise ValueError(f"Unsupported sample width: {audio.sample_width}")
+        return samples.reshape(-1, audio.channels)
+
+    def _remix_channels(self, samples: np.ndarray) -> np.ndarray:
+        source_channels = samples.shape[1]
+        if source_channels == self.channels:
+            return samples
+        if source_channels == 1:
+            return np.repeat(samples, self.channels, axis=1)
+        mono = samples.mean(axis=1, dtype=np.float32).astype(np.int16).reshape(-1, 1)
+        return mono if self.channels == 1 else np.repeat(mono, self.channels, axis=1)
+
+    def _resample(self, samples: np.ndarray, source_rate: int) -> np.ndarray:
+        if source_rate == self.frame_rate or len(samples) == 0:
+            return np.ascontiguousarray(samples, dtype=np.int16)
+        target_frames = int(round(len(samples) * self.frame_rate / source_rate))
+        source_positions = np.arange(len(samples), dtype=np.float64)
+        target_positions = np.linspace(0, len(samples) - 1, target_frames)
+        resampled = np.empty((target_frames, samples.shape[1]), dtype=np.int16)
+        for channel in range(samples.shape[1]):
+            resampled[:, channel] = np.interp(target_positions, source_positions, samples[:, channel]).astype(np.int16)
+        return resampled
+
+    def _to_samples(self, audio: PcmAudio) -> np.ndarray:
+        audio = self.prepare(audio)
+        return np.frombuffer(audio.pcm, dtype=np.int16).reshape(-1, self.channels)
+
+    def to_frames(self, duration: float) -> int:
+        return int(round(duration * self.frame_rate))
+
+    def _create_stream(self, audio_id: str, samples: np.ndarray, playback, gain: float, fade_in: float, complete: bool) -> MixerStream:
+        stream = MixerStream(audio_id, samples, playback, gain if fade_in <= 0 else 0.0, complete=complete)
+        stream.ramp_gain(gain, self.to_frames(fade_in))
+        return stream
+
+    def add_stream(self, audio_id: str, audio: PcmAudio, playback, gain: float = 1.0, fade_in: float = 0.0):
+        samples = self._to_samples(audio)
+        with self._condition:
+            self._streams.append(self._create_stream(audio_id, samples, playback, gain, fade_in, complete=True))
+            self._ensure_thread()
+            self._condition.notify()
+
+    def open_stream(self, audio_id: str, playback, gain: float = 1.0, on_first_sample=None, fade_in: float = 0.0) -> MixerStream:
+        # The stream joins the mix on its first append_stream call
+        stream = self._create_stream(audio_id, np.zeros((0, self.channels), dtype=np.int16), playback, gain, fade_in, complete=False)
+        stream.on_first_sample = on_first_sample
+        return stream
+
+    def append_stream(self, stream: MixerStream, audio: PcmAudio):
+        samples = self._to_samples(audio)
+        with self._condition:
+            stream.append(samples)
+            if stream not in self._streams and stream.position == 0 and not stream.playback.is_killed():
+                self._streams.append(stream)
+                self._ensure_thread()
+            self._condition.notify()
+
+    def close_stream(self, stream: MixerStream):
+        with self._condition:
+            stream.complete = True
+            if stream not in self._streams and stream.position == 0:
+                self._streams.append(stream)
+                self._ensure_thread()
+            self._condition.notify()
+
+    def set_gain(self, audio_id: str, gain: float, ramp_duration: float = 0.0):
+        with self._condition:
+            for stream in self._streams:
+                if stream.audio_id == audio_id and not stream.stop_after_ramp:
+                    stream.ramp_gain(gain, self.to_frames(ramp_duration))
+
+    def fade_out(self, audio_id: str, ramp_duration: float) -> bool:
+        # The stream ends by itself once its gain reaches zero, False if it is not mixing yet
+        faded = False
+        with self._condition:
+            for stream in self._streams:
+                if stream.audio_id == audio_id:
+                    stream.ramp_gain(0.0, self.to_frames(ramp_duration))
+                    stream.stop_after_ramp = True
+                    stream.complete = True
+                    faded = True
+            self._condition.notify()
+        return faded
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify()
+
+    def get_active_audio_ids(self) -> list[str]:
+        with self._condition:
+            return [stream.audio_id for stream in self._streams + self._draining]
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="AudioMixer", daemon=True)
+            self._thread.start()
+
+    def mix_block(self, streams: list[MixerStream], frames: int) -> np.ndarray:
+        mixed = np.zeros((frames, self.channels), dtype=np.int32)
+        for stream in streams:
+            chunk = stream.read(frames)
+            if len(chunk) < frames and not stream.complete:
+                stream.underruns += 1
+            gain_curve = stream.next_gain_curve(len(chunk))
+            if gain_curve is not None:
+                mixed[:len(chunk)] += (chunk * gain_curve[:, None]).astype(np.int32)
+            elif stream.gain == 1.0:
+                mixed[:len(chunk)] += chunk
+            elif stream.gain != 0.0:
+                mixed[:len(chunk)] += (chunk * np.float32(stream.gain)).astype(np.int32)
+            if stream.stop_after_ramp and stream.is_ramp_finished():
+                stream.truncate()
+        np.clip(mixed, self.INT16_MIN, self.INT16_MAX, out=mixed)
+        return mixed.astype(np.int16)
+
+    def _finish(self, streams: list[MixerStream]):
+        for stream in streams:
+            stream.playback.mark_finished()
+            if self.on_stream_finished is not None:
+                self.on_stream_finished(stream.audio_id, stream.playback)
+
+    def _run(self):
+        clock_start = None
+        frames_written = 0
+        while True:
+            with self._condition:
+                killed = [stream for stream in self._streams + self._draining if stream.playback.is_killed()]
+                self._streams = [stream for stream in self._streams if stream not in killed]
+                self._draining = [stream for stream in self._draining if stream not in killed]
+                if not self._streams and not self._draining and not killed:
+                    self._condition.wait()
+                    clock_start = None
+                    continue
+                streams = self._streams[:]
+            self._finish(killed)
+
+            if clock_start is None:
+                clock_start = time.monotonic()
+                frames_written = 0
+            played_frames = (time.monotonic() - clock_start) * self.frame_rate
+            with self._condition:
+                drained = [stream for stream in self._draining if stream.end_frame <= played_frames]
+                self._draining = [stream for stream in self._draining if stream not in drained]
+                next_drain = min((stream.end_frame for stream in self._draining), default=None)
+            self._finish(drained)
+
+            if not streams:
+                # Nothing is written during the gap, keep the write position on the clock
+                frames_written = max(frames_written, int(played_frames))
+                if next_drain is not None:
+                    with self._condition:
+                        self._condition.wait(max(0.0, (next_drain - played_frames) / self.frame_rate))
+                continue
+
+            wait_time = clock_start + frames_written / self.frame_rate - self.write_ahead - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            with self._condition:
+                starting = [stream for stream in streams if stream.position == 0 and stream.on_first_sample is not None]
+                block = self.mix_block(streams, self.block_frames)
+                exhausted = [stream for stream in streams if stream.is_exhausted()]
+                for stream in exhausted:
+                    stream.end_frame = frames_written + self.block_frames
+                    self._streams.remove(stream)
+                    self._draining.append(stream)
+            # Called without the lock, a callback may use the mixer again
+            for stream in starting:
+                if stream.position > 0:
+                    stream.on_first_sample()
+            try:
+                self.sink.write(block.tobytes())
+            except Exception as error:
+                self.logger.error(f"[Mixer Error]: Unable to write to sink: {error}")
+            frames_written += self.block_frames
@@ -1,78 +1,199 @@
 import threading
 import os
-from subprocess import Popen
+import time
 from zarus_core import CustomLogging
+from utils.latency_histogram import LatencyHistogram
+from controllers.pcm_cache import PcmCache
+from controllers.audio_mixer import AudioMixer
+from services.audio_sink import AudioSinkPool
+from controllers.audio_controller import AudioConfig
 
-class AudioConfig:
-    def __init__(self, id=None, file_name=None):
-        self.id = id
-        self.file_name = file_name
+class PlaybackHandle():
+    # Stands in for the old aplay Popen: kill() stops the stream, poll()/wait() report its end
+    def __init__(self, audio_id: str):
+        self.audio_id = audio_id
+        self._killed = threading.Event()
+        self._finished = threading.Event()
+
+    def kill(self):
+        self._killed.set()
+
+    def is_killed(self) -> bool:
+        return self._killed.is_set()
+
+    def mark_finished(self):
+        self._finished.set()
+
+    def poll(self):
+        return 0 if self._finished.is_set() else None
+
+    def wait(self, timeout: float = None):
+        self._finished.wait(timeout)
+        return self.poll()
 
 class AudioProcessManager():
     _instance = None
     subprocess_playing: dict
-    subprocess_queue: list[AudioConfig]
+    playing_configs: dict
     lock: threading.Lock
     sounds_folder: str
+    on_audio_finished = None
+    pcm_cache: PcmCache
+    sink_pool: AudioSinkPool
+    mixer: AudioMixer
+    duck_gain = 0.3
+    ramp_duration = 0.05
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance.subprocess_playing = {}
-            cls._instance.subprocess_queue = []
+            cls._instance.playing_configs = {}
             cls._instance.lock = threading.Lock()
             cls._instance.sounds_folder = ""
+            cls._instance.pcm_cache = None
+            cls._instance.sink_pool = None
+            cls._instance.mixer = None
+            cls._instance.first_sample_histogram = LatencyHistogram("stream.first_sample")
             os.environ["PULSE_SERVER"] = "unix:/run/user/1000/pulse/native"
             os.environ["XDG_RUNTIME_DIR"] = "/run/user/1000"
         return cls._instance
-    
-    def __init__(self, sounds_folder: str, logger:CustomLogging) -> None:
+
+    def __init__(self, sounds_folder: str, logger:CustomLogging, playback_config: dict = None) -> None:
         self.logger = logger
         self.logger.info("Creating AudioProcess Manager...")
         self.sounds_folder = sounds_folder
+        playback_config = playback_config or {}
+        self.duck_gain = playback_config.get("duckGain", self.duck_gain)
+        self.ramp_duration = playback_config.get("rampDuration", self.ramp_duration)
+        if self.mixer is None:
+            self.mixer = AudioMixer(
+                channels=playback_config.get("mixerChannels", 2),
+                frame_rate=playback_config.get("mixerRate", 44100),
+                logger=self.logger)
+            self.mixer.set_finished_listener(self._on_stream_finished)
+        cache_size_mb = playback_config.get("pcmCacheSizeMb", 32)
+        if self.pcm_cache is None:
+            self.pcm_cache = PcmCache(cache_size_mb * 1024 * 1024, logger=self.logger, transform=self.mixer.prepare)
+        else:
+            self.pcm_cache.max_bytes = cache_size_mb * 1024 * 1024
+        sink_type = playback_config.get("sink", AudioSinkPool.SINK_APLAY)
+        if self.sink_pool is None or self.sink_pool.sink_type != sink_type:
+            if self.sink_pool is not None:
+                self.sink_pool.close()
+            self.sink_pool = AudioSinkPool(sink_type, logger=self.logger, sink_file=playback_config.get("sinkFile", "logs/audio_sink"))
+        self.mixer.set_sink(self.sink_pool.get(self.mixer.get_format()))
 
-    def _play_audio(self, audio_config: AudioConfig):
-        while audio_config:
-            file_path = self.sounds_folder + audio_config.file_name
-            print(f"Executing path in Aplay: {file_path}")
-            audio_subprocess = Popen(['aplay', file_path])
-            with self.lock:
-                self.subprocess_playing[audio_config.id] = audio_subprocess
-                
-            audio_subprocess.wait()
-
-            with self.lock:
-                self.subprocess_playing.pop(audio_config.id, None)
-                if self.subprocess_queue:
-                    audio_config = self.subprocess_queue.pop(0)
-                else:
-                    audio_config = None
+    def set_finished_listener(self, on_audio_finished):
+        self.on_audio_finished = on_audio_finished
 
-    def execute_audio_process(self, audio_config: AudioConfig):
+    def _notify_audio_finished(self, audio_id: str):
+        if(self.on_audio_finished is not None):
+            self.on_audio_finished(audio_id)
+
+    def preload_audios(self, audios_list: list[AudioConfig]):
+        file_paths = [self.sounds_folder + audio_config.file_name for audio_config in audios_list]
+        threading.Thread(target=self.pcm_cache.preload, args=(file_paths,), name="PcmPreload", daemon=True).start()
+
+    def _on_stream_finished(self, audio_id: str, playback: PlaybackHandle):
+        with self.lock:
+            if self.subprocess_playing.get(audio_id) is playback:
+                self.subprocess_playing.pop(audio_id, None)
+                self.playing_configs.pop(audio_id, None)
+        self._apply_ducking()
+        self._notify_audio_finished(audio_id)
+
+    def get_ramp_duration(self, audio_config: AudioConfig) -> float:
+        # Fades and ducking envelopes use the audio's rampDuration, or the playback one
+        return self.ramp_duration if audio_config.ramp_duration is None else audio_config.ramp_duration
+
+    def _apply_ducking(self):
+        # Audios below the highest playing priority are ramped down to duck_gain
         with self.lock:
-            if not self.subprocess_playing:
-                threading.Thread(target=self._play_audio, args=(audio_config,)).start()
-            else:
-                self.subprocess_queue.append(audio_config)
+            playing_configs = list(self.playing_configs.values())
+        if not playing_configs:
+            return
+        top_priority = max(audio_config.priority for audio_config in playing_configs)
+        for audio_config in playing_configs:
+            gain = audio_config.gain
+            if audio_config.priority < top_priority:
+                gain = gain * self.duck_gain
+            self.mixer.set_gain(audio_config.id, gain, ramp_duration=self.get_ramp_duration(audio_config))
+
+    def _preempt_lower_priority(self, audio_config: AudioConfig):
+        with self.lock:
+            preempted = [playing.id for playing in self.playing_configs.values() if playing.priority < audio_config.priority]
+        for audio_id in preempted:
+            self.logger.info(f"Audio [{audio_id}] preempted by [{audio_config.id}]")
+            self.kill_audio_process(audio_id)
+
+    def _register_playback(self, audio_config: AudioConfig) -> PlaybackHandle:
+        if audio_config.preempt:
+            self._preempt_lower_priority(audio_config)
+        playback = PlaybackHandle(audio_config.id)
+        with self.lock:
+            self.subprocess_playing[audio_config.id] = playback
+            self.playing_configs[audio_config.id] = audio_config
+        return playback
+
+    def execute_audio_process(self, audio_config: AudioConfig):
+        if audio_config.stream is not None:
+            self.execute_audio_stream(audio_config)
+            return
+        file_path = self.sounds_folder + audio_config.file_name
+        playback = self._register_playback(audio_config)
+        try:
+            audio = self.pcm_cache.get(file_path)
+        except Exception as error:
+            self.logger.error(f"[Mixer Error]: Unable to load {file_path}: {error}")
+            playback.mark_finished()
+            self._on_stream_finished(audio_config.id, playback)
+            return
+        self.logger.info(f"Mixing audio: {file_path}")
+        self.mixer.add_stream(audio_config.id, audio, playback, gain=audio_config.gain, fade_in=self.get_ramp_duration(audio_config))
+        self._apply_ducking()
+
+    def execute_audio_stream(self, audio_config: AudioConfig):
+        # Plays PCM chunks as the stream produces them, starting on the first one
+        playback = self._register_playback(audio_config)
+        audio_stream = audio_config.stream
+        on_first_sample = lambda: self._record_first_sample(audio_config.id, audio_stream.created_at)
+        mixer_stream = self.mixer.open_stream(audio_config.id, playback, gain=audio_config.gain, on_first_sample=on_first_sample, fade_in=self.get_ramp_duration(audio_config))
+        self.logger.info(f"Streaming audio: {audio_config.id}")
+        threading.Thread(target=self._feed_stream, args=(audio_stream, mixer_stream, playback), name="AudioStreamFeeder", daemon=True).start()
+        self._apply_ducking()
+
+    def _feed_stream(self, audio_stream, mixer_stream, playback: PlaybackHandle):
+        try:
+            for audio in audio_stream.iter_pcm():
+                if playback.is_killed() or mixer_stream.stop_after_ramp:
+                    break
+                self.mixer.append_stream(mixer_stream, audio)
+        except Exception as error:
+            self.logger.error(f"[Mixer Error]: Audio stream {playback.audio_id} failed: {error}")
+        self.mixer.close_stream(mixer_stream)
+        if mixer_stream.underruns:
+            self.logger.warning(f"Audio stream {playback.audio_id} ran dry for {mixer_stream.underruns} blocks")
+
+    def _record_first_sample(self, audio_id: str, requested_at: float):
+        self.first_sample_histogram.record(time.monotonic() - requested_at)
+        self.logger.info(f"First sample of [{audio_id}] mixed | {self.first_sample_histogram.summary()}")
+
+    def forget_audio(self, file_name: str):
+        self.pcm_cache.remove(self.sounds_folder + file_name)
 
     def kill_audio_process(self, audio_id: str):
         with self.lock:
-            if audio_id in self.subprocess_playing:
-                self.subprocess_playing[audio_id].kill()
-                self.subprocess_playing.pop(audio_id, None)
-            else:
-                for audio_config in self.subprocess_queue:
-                    if audio_config.id == audio_id:
-                        self.subprocess_queue.remove(audio_config)
-                        break
+            playback = self.subprocess_playing.pop(audio_id, None)
+            audio_config = self.playing_configs.pop(audio_id, None)
+        if playback is not None:
+            # A stream already in the mix fades out, the mixer reports its end
+            ramp_duration = self.get_ramp_duration(audio_config)
+            if ramp_duration <= 0 or not self.mixer.fade_out(audio_id, ramp_duration):
+                playback.kill()
+                self.mixer.wake()
+            self._apply_ducking()
 
     def subprocess_ended(self, audio_id: str) -> bool:
-        subprocess_playing_aux = self.subprocess_playing
-        subprocess_queue_aux = self.subprocess_queue[:]
-        if audio_id in subprocess_playing_aux:
-            return False
-        else:
-            for audio_config in subprocess_queue_aux:
-                if audio_config.id == audio_id:
-                    return False
-            return True
+        with self.lock:
+            return audio_id not in self.subprocess_playing
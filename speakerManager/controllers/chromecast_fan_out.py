@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from zarus_core import CustomLogging
+from services.chromecast_pool import CastSession
+
+class ChromecastFanOut():
+    # Every target cast buffers the media paused in parallel, then all of them
+    # get "play" at the same instant. A cast still loading after sync_timeout
+    # starts on its own once loaded, and its skew shows it.
+    def __init__(self, logger:CustomLogging, start_tolerance: float = 0.05, sync_timeout: float = 3.0, load_timeout: float = 10.0, max_workers: int = 8):
+        self.logger = logger
+        self.start_tolerance = start_tolerance
+        self.sync_timeout = sync_timeout
+        self.load_timeout = load_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="CastFanOut")
+
+    def play(self, sessions: list[CastSession], media_url: str, content_type: str = 'audio/wav', on_start=None) -> dict[str, float]:
+        # Returns the start skew of each cast that played, in seconds after the common start
+        loads = {self.executor.submit(session.load, media_url, content_type, self.load_timeout): session for session in sessions}
+        done, late = wait(loads, timeout=self.sync_timeout)
+        ready = [loads[load] for load in done if load.result()]
+
+        started_at = time.monotonic()
+        if on_start is not None:
+            on_start()
+        for session in ready:
+            session.play_loaded()
+        for load in late:
+            self.logger.warning(f"[Chromecast] {loads[load].friendly_name} still loading after {self.sync_timeout}s, it will start late")
+            load.add_done_callback(lambda load, session=loads[load]: load.result() and session.play_loaded())
+
+        skews = {}
+        deadline = started_at + self.load_timeout
+        for session in ready + [loads[load] for load in late]:
+            if session.playing.wait(max(0.0, deadline - time.monotonic())) and session.playing_at is not None:
+                skews[session.friendly_name] = session.playing_at - started_at
+            else:
+                self.logger.warning(f"[Chromecast] {session.friendly_name} did not start playing")
+        self._report(skews)
+        return skews
+
+    def _report(self, skews: dict[str, float]):
+        if not skews:
+            return
+        spread = max(skews.values()) - min(skews.values())
+        detail = " | ".join(f"{name}: {skew * 1000:.0f}ms" for name, skew in skews.items())
+        if spread > self.start_tolerance:
+            self.logger.warning(f"[Chromecast] Start skew {spread * 1000:.0f}ms above {self.start_tolerance * 1000:.0f}ms | {detail}")
+        else:
+            self.logger.info(f"[Chromecast] Start skew {spread * 1000:.0f}ms | {detail}")
@@ -0,0 +1,86 @@
+from devices.speaker_interface import Speaker
+from controllers.room_controller import RoomController
+from zarus_core import CustomLogging
+
+class DeviceRegistry():
+    ALL_ROOMS_ALIAS = "all"
+    ROOMS_SEPARATOR = "-"
+    max_cached_topics = 256
+
+    def __init__(self, devices: list[Speaker], room_controller: RoomController, logger:CustomLogging):
+        self.logger = logger
+        self.logger.info("Creating Device Registry...")
+        self.room_controller = room_controller
+        self.devices_by_id: dict[str, Speaker] = {}
+        for device in devices:
+            self.devices_by_id.setdefault(device.id, device)
+        self._speakers_by_room: dict[str, list[Speaker]] = {}
+        self._fan_out: dict[str, tuple[list[str], list[Speaker]]] = {}
+        self._build_fan_out()
+
+    def _build_fan_out(self):
+        for room in self.room_controller.rooms:
+            speakers = []
+            for speaker_id in room.speakers:
+                speaker_found = self.devices_by_id.get(speaker_id)
+                if (speaker_found is None):
+                    self.logger.warning(f"No speaker {speaker_id} found for room {room.name}")
+                else:
+                    speakers.append(speaker_found)
+            self._speakers_by_room[room.name] = speakers
+            self._fan_out[room.name] = ([room.name], self._unique(speakers))
+        all_room_names = [room.name for room in self.room_controller.rooms]
+        self._fan_out[self.ALL_ROOMS_ALIAS] = (all_room_names, self._collect(all_room_names))
+
+    def _collect(self, room_names: list[str]) -> list[Speaker]:
+        speakers = []
+        for room_name in room_names:
+            speakers.extend(self._speakers_by_room.get(room_name, []))
+        return self._unique(speakers)
+
+    @staticmethod
+    def _unique(speakers: list[Speaker]) -> list[Speaker]:
+        return list({id(speaker): speaker for speaker in speakers}.values())
+
+    def _resolve(self, rooms_topic: str) -> tuple[list[str], list[Speaker]]:
+        rooms_topic = rooms_topic.lower()
+        resolved = self._fan_out.get(rooms_topic)
+        if resolved is not None:
+            return resolved
+        # Multi-room topics like "cocina-sala" are resolved once and then memoised
+        room_names = []
+        for room_name in rooms_topic.split(self.ROOMS_SEPARATOR):
+            if(room_name == self.ALL_ROOMS_ALIAS):
+                return self._fan_out[self.ALL_ROOMS_ALIAS]
+            if(room_name in self._speakers_by_room and room_name not in room_names):
+                room_names.append(room_name)
+        resolved = (room_names, self._collect(room_names))
+        if(len(self._fan_out) < self.max_cached_topics):
+            self._fan_out[rooms_topic] = resolved
+        return resolved
+
+    def get_room_groups(self) -> dict[str, str]:
+        # Rooms sharing a speaker, directly or through other rooms, land in the same group
+        parents = {room_name: room_name for room_name in self._speakers_by_room}
+        def find(room_name):
+            while parents[room_name] != room_name:
+                parents[room_name] = parents[parents[room_name]]
+                room_name = parents[room_name]
+            return room_name
+        rooms_by_speaker: dict[int, str] = {}
+        for room_name, speakers in self._speakers_by_room.items():
+            for speaker in speakers:
+                other_room = rooms_by_speaker.setdefault(id(speaker), room_name)
+                root, other_root = find(room_name), find(other_room)
+                if root != other_root:
+                    parents[max(root, other_root)] = min(root, other_root)
+        return {room_name: find(room_name) for room_name in parents}
+
+    def get_device(self, device_id: str) -> Speaker:
+        return self.devices_by_id.get(device_id)
+
+    def get_speakers_for_rooms(self, rooms_topic: str) -> list[Speaker]:
+        return self._resolve(rooms_topic)[1][:]
+
+    def get_room_names(self, rooms_topic: str) -> list[str]:
+        return self._resolve(rooms_topic)[0][:]
@@ -0,0 +1,125 @@
+import io
+import os
+import threading
+import wave
+from collections import OrderedDict
+from zarus_core import CustomLogging
+
+class PcmAudio():
+    pcm: bytes
+    channels: int
+    sample_width: int
+    frame_rate: int
+
+    def __init__(self, pcm: bytes, channels: int, sample_width: int, frame_rate: int):
+        self.pcm = pcm
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+
+    def get_format(self) -> tuple[int, int, int]:
+        return (self.channels, self.sample_width, self.frame_rate)
+
+    def get_bytes_per_frame(self) -> int:
+        return self.channels * self.sample_width
+
+    def get_bytes_per_second(self) -> int:
+        return self.get_bytes_per_frame() * self.frame_rate
+
+    def get_duration(self) -> float:
+        return len(self.pcm) / self.get_bytes_per_second()
+
+    def get_size(self) -> int:
+        return len(self.pcm)
+
+    def to_wav_bytes(self) -> bytes:
+        wav_buffer = io.BytesIO()
+        with wave.open(wav_buffer, 'wb') as wave_writer:
+            wave_writer.setnchannels(self.channels)
+            wave_writer.setsampwidth(self.sample_width)
+            wave_writer.setframerate(self.frame_rate)
+            wave_writer.writeframes(self.pcm)
+        return wav_buffer.getvalue()
+
+    @classmethod
+    def concatenate(cls, audios: list['PcmAudio']) -> 'PcmAudio':
+        first_audio = audios[0]
+        return cls(b"".join(audio.pcm for audio in audios), first_audio.channels, first_audio.sample_width, first_audio.frame_rate)
+
+    @classmethod
+    def from_wave_reader(cls, wave_reader: wave.Wave_read):
+        pcm = wave_reader.readframes(wave_reader.getnframes())
+        return cls(pcm, wave_reader.getnchannels(), wave_reader.getsampwidth(), wave_reader.getframerate())
+
+    @classmethod
+    def from_wav_file(cls, file_path: str):
+        with wave.open(file_path, 'rb') as wave_reader:
+            return cls.from_wave_reader(wave_reader)
+
+    @classmethod
+    def from_wav_bytes(cls, wav_bytes: bytes):
+        with wave.open(io.BytesIO(wav_bytes), 'rb') as wave_reader:
+            return cls.from_wave_reader(wave_reader)
+
+
+class PcmCache():
+    max_bytes: int
+    _entries: OrderedDict
+    _size: int
+    _lock: threading.Lock
+
+    def __init__(self, max_bytes: int, logger:CustomLogging, transform=None):
+        self.logger = logger
+        self.max_bytes = max_bytes
+        self.transform = transform
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_path: str) -> PcmAudio:
+        with self._lock:
+            audio = self._entries.get(file_path)
+            if audio is not None:
+                self._entries.move_to_end(file_path)
+                return audio
+        audio = PcmAudio.from_wav_file(file_path)
+        if self.transform is not None:
+            audio = self.transform(audio)
+        self.put(file_path, audio)
+        return audio
+
+    def put(self, key: str, audio: PcmAudio):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous.get_size()
+            self._entries[key] = audio
+            self._size += audio.get_size()
+            self._evict()
+
+    def remove(self, key: str):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous.get_size()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, audio = self._entries.popitem(last=False)
+            self._size -= audio.get_size()
+            self.logger.debug(f"PCM cache evicted: {key}")
+
+    def preload(self, file_paths: list[str]):
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                self.logger.warning(f"Unable to preload missing audio file: {file_path}")
+                continue
+            try:
+                self.get(file_path)
+            except (wave.Error, EOFError) as error:
+                self.logger.error(f"Unable to decode audio file {file_path}: {error}")
+        self.logger.info(f"PCM cache preloaded {len(self._entries)} audios | {self._size / 1024:.0f} KiB")
+
+    def get_size(self) -> int:
+        with self._lock:
+            return self._size
@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+from zarus_core import CustomLogging
+
+class ChannelJob():
+    def __init__(self, audio_id: str, priority: int, channel_keys: list[str], job_factory):
+        self.audio_id = audio_id
+        self.priority = priority
+        self.channel_keys = channel_keys
+        self.job_factory = job_factory
+        self.playback_id = PlaybackChannels.get_playback_id(audio_id, channel_keys)
+
+
+class PlaybackChannel():
+    # One worker per channel: jobs start by priority, one at a time. The channel
+    # is only held while a job starts, overlapping audios are left to the mixer
+    # and to the ducking of lower priorities.
+    def __init__(self, key: str, manager: 'PlaybackChannels'):
+        self.key = key
+        self.manager = manager
+        self.lock = asyncio.Lock()
+        self._jobs = []
+        self._sequence = 0
+        self._worker: asyncio.Task = None
+
+    def put(self, job: ChannelJob):
+        self._sequence += 1
+        heapq.heappush(self._jobs, (-job.priority, self._sequence, job))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._work())
+
+    def remove_pending(self, audio_id: str, channel_keys: list[str]) -> int:
+        remaining = [entry for entry in self._jobs if not (entry[2].audio_id == audio_id and set(entry[2].channel_keys) & set(channel_keys))]
+        removed = len(self._jobs) - len(remaining)
+        if removed:
+            self._jobs = remaining
+            heapq.heapify(self._jobs)
+        return removed
+
+    def get_pending_count(self) -> int:
+        return len(self._jobs)
+
+    def has_pending(self, audio_id: str) -> bool:
+        return any(entry[2].audio_id == audio_id for entry in self._jobs)
+
+    def _pop(self) -> ChannelJob:
+        return heapq.heappop(self._jobs)[2]
+
+    async def _work(self):
+        while self._jobs:
+            job = self._pop()
+            locks = self.manager.get_locks(job.channel_keys)
+            for lock in locks:
+                await lock.acquire()
+            try:
+                await self._start(job)
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+
+    async def _start(self, job: ChannelJob):
+        # Registered before the job runs so a very short audio cannot finish unseen
+        self.manager.add_playing(job.playback_id, job.channel_keys)
+        try:
+            started = await job.job_factory(job.playback_id)
+        except Exception as error:
+            self.manager.logger.error(f"Playback job failed on channel {self.key}: {error}")
+            started = False
+        if not started:
+            self.manager.notify_finished(job.playback_id)
+
+
+class PlaybackChannels():
+    # Rooms that share a speaker belong to the same channel. Requests spanning
+    # several channels start on a dedicated worker that takes every channel lock,
+    # always acquired in key order so channels can never deadlock each other.
+    PLAYBACK_ID_SEPARATOR = "@"
+    CHANNEL_SEPARATOR = "+"
+    MULTI_CHANNEL_KEY = "multi"
+
+    def __init__(self, room_groups: dict[str, str], logger:CustomLogging):
+        self.logger = logger
+        self.room_groups = room_groups
+        self.channels: dict[str, PlaybackChannel] = {}
+        self.multi_channel: PlaybackChannel = None
+        self.playing: dict[str, list[str]] = {}
+
+    @classmethod
+    def get_playback_id(cls, audio_id: str, channel_keys: list[str]) -> str:
+        return f"{audio_id}{cls.PLAYBACK_ID_SEPARATOR}{cls.CHANNEL_SEPARATOR.join(channel_keys)}"
+
+    @classmethod
+    def get_audio_id(cls, playback_id: str) -> str:
+        return playback_id.split(cls.PLAYBACK_ID_SEPARATOR)[0]
+
+    def get_channel_keys(self, room_names: list[str]) -> list[str]:
+        return sorted({self.room_groups.get(room_name, room_name) for room_name in room_names})
+
+    def get_channel(self, key: str) -> PlaybackChannel:
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = PlaybackChannel(key, self)
+            self.channels[key] = channel
+        return channel
+
+    def get_locks(self, channel_keys: list[str]) -> list[asyncio.Lock]:
+        return [self.get_channel(key).lock for key in sorted(channel_keys)]
+
+    def submit(self, room_names: list[str], audio_id: str, priority: int, job_factory):
+        # Must run on the playback engine loop
+        channel_keys = self.get_channel_keys(room_names)
+        job = ChannelJob(audio_id, priority, channel_keys, job_factory)
+        if len(channel_keys) == 1:
+            self.get_channel(channel_keys[0]).put(job)
+        else:
+            if self.multi_channel is None:
+                self.multi_channel = PlaybackChannel(self.MULTI_CHANNEL_KEY, self)
+            self.multi_channel.put(job)
+        self.logger.info(f"Audio [{audio_id}] queued on channels {channel_keys} | pending: {self.get_pending_count()}")
+
+    def add_playing(self, playback_id: str, channel_keys: list[str]):
+        self.playing[playback_id] = channel_keys
+
+    def notify_finished(self, playback_id: str):
+        self.playing.pop(playback_id, None)
+
+    def cancel(self, audio_id: str, room_names: list[str]) -> list[str]:
+        # Drops queued jobs for the audio and returns the playback ids to stop
+        channel_keys = self.get_channel_keys(room_names)
+        removed = sum(channel.remove_pending(audio_id, channel_keys) for channel in self.get_all_channels())
+        if removed:
+            self.logger.info(f"Removed {removed} queued requests for [{audio_id}] on channels {channel_keys}")
+        return [playback_id for playback_id, playing_keys in self.playing.items()
+                if self.get_audio_id(playback_id) == audio_id and set(playing_keys) & set(channel_keys)]
+
+    def is_audio_active(self, audio_id: str) -> bool:
+        if any(self.get_audio_id(playback_id) == audio_id for playback_id in self.playing):
+            return True
+        return any(channel.has_pending(audio_id) for channel in self.get_all_channels())
+
+    def get_all_channels(self) -> list[PlaybackChannel]:
+        channels = list(self.channels.values())
+        if self.multi_channel is not None:
+            channels.append(self.multi_channel)
+        return channels
+
+    def get_pending_count(self) -> int:
+        return sum(channel.get_pending_count() for channel in self.get_all_channels())
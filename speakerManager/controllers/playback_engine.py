@@ -0,0 +1,66 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from zarus_core import CustomLogging
+
+class AsyncPlaybackEngine():
+    _instance = None
+    loop: asyncio.AbstractEventLoop
+    _room_tails: dict
+    _thread: threading.Thread
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.loop = None
+            cls._instance._room_tails = {}
+            cls._instance._thread = None
+        return cls._instance
+
+    def __init__(self, logger:CustomLogging) -> None:
+        self.logger = logger
+        if self.loop is None:
+            self.logger.info("Creating Async Playback Engine...")
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run_loop, name="AsyncPlaybackEngine", daemon=True)
+            self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, room_keys: list[str], job_factory) -> Future:
+        # Jobs sharing a room key run in submission order, jobs on disjoint rooms run concurrently
+        future = Future()
+        self.loop.call_soon_threadsafe(self._schedule, list(room_keys), job_factory, future)
+        return future
+
+    def call(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def _schedule(self, room_keys: list[str], job_factory, future: Future):
+        previous_tasks = {self._room_tails[key] for key in room_keys if key in self._room_tails}
+        task = self.loop.create_task(self._run_after(previous_tasks, job_factory))
+        for key in room_keys:
+            self._room_tails[key] = task
+        task.add_done_callback(lambda finished_task: self._on_task_done(room_keys, finished_task, future))
+
+    async def _run_after(self, previous_tasks: set, job_factory):
+        if previous_tasks:
+            await asyncio.wait(previous_tasks)
+        result = job_factory()
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    def _on_task_done(self, room_keys: list[str], task: asyncio.Task, future: Future):
+        for key in room_keys:
+            if self._room_tails.get(key) is task:
+                del self._room_tails[key]
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            self.logger.error(f"Playback job failed for rooms {room_keys}: {task.exception()}")
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
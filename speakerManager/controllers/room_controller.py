@@ -14,6 +14,7 @@ class Room:
 class RoomController:
     __instance = None
     rooms: list
+    rooms_by_name: dict
 
     def __new__(cls, *args, **kwargs):
         if not cls.__instance:
@@ -29,6 +30,7 @@ class RoomController:
             
     def _configuration(self):
         self.rooms = []
+        self.rooms_by_name = {}
 
     def add_room(self, room_name: str) -> Room:
         room_name = room_name.lower()
@@ -36,6 +38,7 @@ class RoomController:
         if(found_room is None):
             room = Room(room_name)
             self.rooms.append(room)
+            self.rooms_by_name[room.name] = room
             return room
 
     def add_speaker_id_to_room(self, room_name: str, speaker_id: str):
@@ -45,11 +48,7 @@ class RoomController:
         found_room.add_speaker(speaker_id)
 
     def find_existing_room_by_name(self,room_name: str) -> Room:
-        room_name = room_name.lower()
-        for room_aux in self.rooms:
-            if room_aux.name == room_name:
-                return room_aux
-        return None
+        return self.rooms_by_name.get(room_name.lower())
 
     def get_rooms_from_topic(self,topic: str) -> list[Room]:
         final_list = []
@@ -0,0 +1,131 @@
+import hashlib
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from zarus_core import CustomLogging
+
+class TtsCache():
+    # Synthesised phrases stored as <sha256>.wav, keyed by text, language, voice
+    # and audio config. The LRU order survives restarts through file mtimes.
+    FILE_EXTENSION = ".wav"
+    TEMP_EXTENSION = ".tmp"
+    cache_folder: str
+    max_bytes: int
+    max_entries: int
+    _entries: OrderedDict
+    _size: int
+    _lock: threading.Lock
+
+    def __init__(self, cache_folder: str, max_bytes: int, logger:CustomLogging, max_entries: int = 500):
+        self.logger = logger
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pinned: dict[str, int] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._temp_sequence = itertools.count()
+        os.makedirs(self.cache_folder, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def normalise_text(text: str) -> str:
+        return " ".join(text.split())
+
+    @classmethod
+    def get_key(cls, text: str, language: str, voice_signature: str) -> str:
+        key_source = "\n".join([cls.normalise_text(text), language, voice_signature])
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_folder, key + self.FILE_EXTENSION)
+
+    @classmethod
+    def get_key_from_path(cls, file_path: str) -> str:
+        return os.path.basename(file_path)[:-len(cls.FILE_EXTENSION)]
+
+    def get_temp_path(self, key: str) -> str:
+        # Unique per call, concurrent syntheses of one phrase never share a temp file
+        return os.path.join(self.cache_folder, f"{key}.{next(self._temp_sequence)}{self.TEMP_EXTENSION}{self.FILE_EXTENSION}")
+
+    def _load_index(self):
+        entries = []
+        for file_name in os.listdir(self.cache_folder):
+            file_path = os.path.join(self.cache_folder, file_name)
+            if self.TEMP_EXTENSION in file_name:
+                os.remove(file_path)
+            elif file_name.endswith(self.FILE_EXTENSION):
+                stat = os.stat(file_path)
+                entries.append((stat.st_mtime, file_name[:-len(self.FILE_EXTENSION)], stat.st_size))
+        with self._lock:
+            for _, key, size in sorted(entries):
+                self._entries[key] = size
+                self._size += size
+            self._evict()
+        self.logger.info(f"TTS cache loaded {len(self._entries)} phrases | {self._size / 1024:.0f} KiB")
+
+    def get(self, key: str) -> str:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        file_path = self.get_path(key)
+        try:
+            os.utime(file_path)
+        except FileNotFoundError:
+            self.remove(key)
+            return None
+        return file_path
+
+    def put(self, key: str, source_path: str) -> str:
+        # Moves a freshly synthesised file into the cache
+        file_path = self.get_path(key)
+        os.replace(source_path, file_path)
+        size = os.path.getsize(file_path)
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._size += size
+            self._evict()
+        return file_path
+
+    def remove(self, key: str):
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+        if os.path.exists(self.get_path(key)):
+            os.remove(self.get_path(key))
+
+    def pin(self, key: str):
+        # Pinned phrases are never evicted, they back configured audio ids and
+        # queued announcements. Pins are counted, each unpin() drops one.
+        with self._lock:
+            self._pinned[key] = self._pinned.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        with self._lock:
+            pins = self._pinned.pop(key, 0) - 1
+            if pins > 0:
+                self._pinned[key] = pins
+
+    def _evict(self):
+        # The newest entry is never evicted, it is the one just put or read
+        for key in list(self._entries)[:-1]:
+            if not (self._size > self.max_bytes or len(self._entries) > self.max_entries):
+                break
+            if key in self._pinned:
+                continue
+            size = self._entries.pop(key)
+            self._size -= size
+            if os.path.exists(self.get_path(key)):
+                os.remove(self.get_path(key))
+            self.logger.debug(f"TTS cache evicted: {key}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
@@ -1,59 +1,294 @@
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from services.tts_backend import TtsBackend
 from services.google_tts_service import GoogleTTSService
-from utils.csv_storage import CSVStorage
+from services.local_tts_service import LocalTTSService
+from services.fake_tts_service import FakeTTSService
+from controllers.tts_cache import TtsCache
+from controllers.tts_stream import TtsStream
+from controllers.pcm_cache import PcmAudio
+from utils.quota_ledger import QuotaLedger
 from zarus_core import CustomLogging
 
 class TextToSpeechGenerator:
-    tts_handler = None
     max_characters_per_requests = 1500
     max_characters_per_day = 30000
     max_characters_per_month = 900000
     used_chars_filename = 'conf/charactersSended.txt'
     audio_output_filename = "output.wav"
+    audio_id_prefix = "tts-"
+    phrase_id_prefix = "tts-phrase-"
 
-    def __init__(self, config_file, sounds_folder:str, logger:CustomLogging):
+    BACKEND_GOOGLE = "google"
+    BACKEND_LOCAL = "local"
+    BACKEND_FAKE = "fake"
+
+    def __init__(self, config_file, sounds_folder:str, logger:CustomLogging, tts_config:dict = None, backends:dict[str, TtsBackend] = None):
         self.logger = logger
         self.logger.info("Creating TextToSpeechGenerator Controller...")
         self.sounds_folder = sounds_folder
-        self.set_google_as_tts_handler(config_file)
-        self.storage_characters_used = CSVStorage(self.used_chars_filename)
+        tts_config = tts_config or {}
+        self.set_backends(config_file, tts_config, backends or {})
+        self.quota_ledger = QuotaLedger(self.used_chars_filename)
+        self.streaming = tts_config.get("streaming", False)
+        self.fallback_timeout = tts_config.get("fallbackTimeout", 4.0)
+        self.backend_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="TtsBackend")
+        self._streams_in_flight: dict[str, TtsStream] = {}
+        self._slow_calls: dict[str, Future] = {}
+        self._streams_lock = threading.Lock()
+        self._synthesis_locks: dict[str, list] = {}
+        self.phrases: dict[tuple, str] = {}
+        self.phrase_audio_ids: dict[tuple, str] = {}
+        self._phrases_lock = threading.Lock()
+        self.tts_cache = TtsCache(
+            os.path.join(sounds_folder, tts_config.get("cacheFolder", "tts_cache/")),
+            max_bytes=tts_config.get("cacheSizeMb", 64) * 1024 * 1024,
+            logger=self.logger,
+            max_entries=tts_config.get("cacheMaxEntries", 500))
+
+    def set_backends(self, config_file, tts_config:dict, backends:dict[str, TtsBackend]):
+        self.default_backend = tts_config.get("defaultBackend", self.BACKEND_GOOGLE)
+        self.language_backends: dict[str, str] = tts_config.get("languageBackends", {})
+        self.fallback_backend = tts_config.get("fallbackBackend")
+        self.backends = dict(backends)
+        backend_names = {self.default_backend, *self.language_backends.values()}
+        if(self.fallback_backend is not None):
+            backend_names.add(self.fallback_backend)
+        for backend_name in backend_names:
+            if(backend_name not in self.backends):
+                self.backends[backend_name] = self._create_backend(backend_name, config_file, tts_config)
+        if(self.fallback_backend is not None and not self.backends[self.fallback_backend].is_available()):
+            self.logger.warning(f"TTS fallback backend [{self.fallback_backend}] is not available, fallback disabled")
+            self.fallback_backend = None
+        self.logger.info(f"TTS backends: default [{self.default_backend}] | per language: {self.language_backends} | fallback: [{self.fallback_backend}]")
 
-    def set_google_as_tts_handler(self,config_file):
-        self.max_characters_per_requests = 1500
-        self.max_characters_per_day = 30000
-        self.max_characters_per_month = 900000
-        self.tts_handler = GoogleTTSService(config_file)
+    def _create_backend(self, backend_name, config_file, tts_config:dict) -> TtsBackend:
+        if(backend_name == self.BACKEND_LOCAL):
+            return LocalTTSService(tts_config.get("local", {}))
+        if(backend_name == self.BACKEND_FAKE):
+            return FakeTTSService(latency=0, metered=False)
+        return GoogleTTSService(config_file, logger=self.logger)
 
+    def get_backend(self, language="en") -> TtsBackend:
+        return self.backends[self.language_backends.get(language, self.default_backend)]
 
-    def can_synthesize_audio(self, text_to_send):
+    def get_fallback(self, backend:TtsBackend) -> TtsBackend:
+        fallback = self.backends.get(self.fallback_backend)
+        if(fallback is backend): return None
+        return fallback
 
+    def reserve_chars(self, text_to_send, backend:TtsBackend):
+        # Charged before synthesis so concurrent requests cannot overrun the quota together
+        if(not backend.metered): return True
         character_count = len(text_to_send)
         if(character_count > self.max_characters_per_requests): return False
+        return self.quota_ledger.reserve(character_count, self.max_characters_per_day, self.max_characters_per_month)
 
-        # Read current character count from file
-        current_count = self.storage_characters_used.get_value_for_date()
-        total_character_count = character_count + current_count
+    def release_chars(self, text_to_send, backend:TtsBackend):
+        if(not backend.metered): return
+        self.quota_ledger.release(len(text_to_send))
 
-        if(total_character_count > self.max_characters_per_day): return False
+    def _get_synthesis_lock(self, cache_key) -> threading.Lock:
+        # Counted per user, the entry stays while anyone holds or waits on the lock
+        with self._streams_lock:
+            entry = self._synthesis_locks.setdefault(cache_key, [threading.Lock(), 0])
+            entry[1] += 1
+            return entry[0]
 
-        if(total_character_count > self.max_characters_per_month): return False
-        
-        return True
-        
-    def update_amount_used_chars(self,text_to_send):
-        character_count = len(text_to_send)
-        self.storage_characters_used.increase_value_for_today_by(character_count)
+    def _release_synthesis_lock(self, cache_key):
+        with self._streams_lock:
+            entry = self._synthesis_locks[cache_key]
+            entry[1] -= 1
+            if(entry[1] == 0):
+                del self._synthesis_locks[cache_key]
+
+    def get_cache_key(self, text_to_send, language, backend:TtsBackend):
+        return TtsCache.get_key(text_to_send, language, backend.get_voice_signature(language))
 
     def generate_audio_file(self,text_to_send,language="en"):
-        output_filename = f"{self.sounds_folder}/{self.audio_output_filename}"
-        if(not self.can_synthesize_audio(text_to_send)):
-            print("Cannot synthesize audio. Character limit reached.")
-            return False
-        print("Generating audio from text")
+        # Returns (audio_id, file_name relative to the sounds folder), or None if nothing can be played
+        backend = self.get_backend(language)
+        fallback = self.get_fallback(backend)
+        tts_audio = self._generate_audio_file_with(backend, text_to_send, language, self.fallback_timeout if fallback else None)
+        if(tts_audio is None and fallback is not None):
+            self.logger.warning(f"TTS falling back from [{backend.name}] to [{fallback.name}]")
+            tts_audio = self._generate_audio_file_with(fallback, text_to_send, language, None)
+        return tts_audio
+
+    def _generate_audio_file_with(self, backend:TtsBackend, text_to_send, language, timeout):
+        cache_key = self.get_cache_key(text_to_send, language, backend)
+        # Requests for a phrase already being synthesised wait for it and then hit the cache
         try:
-            self.tts_handler.generate_audio(text_to_send, output_filename,language)
-            self.update_amount_used_chars(text_to_send)
-            return True
-        except:
-            print("Cannot synthesize audio. Google Error.")
-            return False
\ No newline at end of file
+            with self._get_synthesis_lock(cache_key):
+                return self._generate_audio_file(backend, text_to_send, language, cache_key, timeout)
+        finally:
+            self._release_synthesis_lock(cache_key)
+
+    def _generate_audio_file(self, backend:TtsBackend, text_to_send, language, cache_key, timeout):
+        cached_path = self.tts_cache.get(cache_key)
+        if(cached_path is not None):
+            self.logger.info(f"TTS cache hit: {cache_key[:12]} | {self.tts_cache.get_stats()}")
+            return self._get_tts_audio(cache_key, cached_path)
+        with self._streams_lock:
+            # A slow call for this phrase is still running, it is cached once it arrives
+            if(cache_key in self._slow_calls): return None
+        if(not self.reserve_chars(text_to_send, backend)):
+            self.logger.warning("Cannot synthesize audio. Character limit reached.")
+            return None
+        self.logger.info(f"Generating audio from text with [{backend.name}]")
+        temp_filename = self.tts_cache.get_temp_path(cache_key)
+        try:
+            self._call_backend(backend, text_to_send, temp_filename, language, cache_key, timeout)
+        except TimeoutError:
+            self.logger.warning(f"TTS backend [{backend.name}] slower than {timeout}s: {cache_key[:12]}")
+            return None
+        except Exception as error:
+            self.logger.error(f"Cannot synthesize audio. {backend.name} error: {error}")
+            self.release_chars(text_to_send, backend)
+            if(os.path.exists(temp_filename)):
+                os.remove(temp_filename)
+            return None
+        cached_path = self.tts_cache.put(cache_key, temp_filename)
+        self.logger.info(f"TTS cache miss: {cache_key[:12]} | {self.tts_cache.get_stats()}")
+        return self._get_tts_audio(cache_key, cached_path)
+
+    def _call_backend(self, backend:TtsBackend, text_to_send, temp_filename, language, cache_key, timeout):
+        if(timeout is None):
+            backend.generate_audio(text_to_send, temp_filename, language)
+            return
+        call = self.backend_executor.submit(backend.generate_audio, text_to_send, temp_filename, language)
+        try:
+            call.result(timeout)
+        except TimeoutError:
+            # Left running, a late result still ends up in the cache
+            with self._streams_lock:
+                self._slow_calls[cache_key] = call
+            call.add_done_callback(lambda call: self._finish_slow_call(backend, text_to_send, temp_filename, cache_key, call))
+            raise
+
+    def _finish_slow_call(self, backend:TtsBackend, text_to_send, temp_filename, cache_key, call:Future):
+        with self._streams_lock:
+            self._slow_calls.pop(cache_key, None)
+        if(call.exception() is not None):
+            self.release_chars(text_to_send, backend)
+            if(os.path.exists(temp_filename)):
+                os.remove(temp_filename)
+            return
+        self.tts_cache.put(cache_key, temp_filename)
+        self.logger.info(f"Late TTS result from [{backend.name}] cached: {cache_key[:12]}")
+
+    def generate_audio_stream(self, text_to_send, language="en"):
+        # Returns (audio_id, file_name, stream), stream is None when the phrase is already cached
+        backend = self.get_backend(language)
+        fallback = self.get_fallback(backend)
+        tts_audio = self._generate_audio_stream(backend, text_to_send, language)
+        if(tts_audio is not None and tts_audio[2] is not None and fallback is not None and not tts_audio[2].wait_first_chunk(self.fallback_timeout)):
+            # The slow stream keeps going and caches itself, this request plays the fallback
+            self.logger.warning(f"TTS backend [{backend.name}] gave no audio within {self.fallback_timeout}s")
+            tts_audio = None
+        if(tts_audio is None and fallback is not None):
+            self.logger.warning(f"TTS falling back from [{backend.name}] to [{fallback.name}]")
+            tts_audio = self._generate_audio_stream(fallback, text_to_send, language)
+        return tts_audio
+
+    def _generate_audio_stream(self, backend:TtsBackend, text_to_send, language):
+        cache_key = self.get_cache_key(text_to_send, language, backend)
+        audio_id, file_name = self._get_tts_audio(cache_key, self.tts_cache.get_path(cache_key))
+        with self._streams_lock:
+            # The same phrase requested while it is still being synthesised reads the same chunks
+            tts_stream = self._streams_in_flight.get(cache_key)
+            if(tts_stream is not None and not tts_stream.has_failed()):
+                self.logger.info(f"TTS stream shared: {cache_key[:12]}")
+                return (audio_id, file_name, tts_stream)
+            self._streams_in_flight.pop(cache_key, None)
+        cached_path = self.tts_cache.get(cache_key)
+        if(cached_path is not None):
+            self.logger.info(f"TTS cache hit: {cache_key[:12]} | {self.tts_cache.get_stats()}")
+            return (audio_id, file_name, None)
+        if(not self.reserve_chars(text_to_send, backend)):
+            self.logger.warning("Cannot synthesize audio. Character limit reached.")
+            return None
+        self.logger.info(f"Streaming audio from text with [{backend.name}]")
+        on_complete = lambda chunks: self._store_stream(cache_key, chunks)
+        on_failed = lambda: self.release_chars(text_to_send, backend)
+        with self._streams_lock:
+            # Another request may have started the same phrase since the check above
+            shared_stream = self._streams_in_flight.get(cache_key)
+            if(shared_stream is not None and not shared_stream.has_failed()):
+                self.release_chars(text_to_send, backend)
+                return (audio_id, file_name, shared_stream)
+            tts_stream = TtsStream(audio_id, backend.synthesize_chunks(text_to_send, language), logger=self.logger, on_complete=on_complete, on_failed=on_failed)
+            self._streams_in_flight[cache_key] = tts_stream
+        return (audio_id, file_name, tts_stream)
+
+    def _store_stream(self, cache_key, chunks: list[PcmAudio]):
+        if(not chunks): return
+        temp_filename = self.tts_cache.get_temp_path(cache_key)
+        with open(temp_filename, 'wb') as output_file:
+            output_file.write(PcmAudio.concatenate(chunks).to_wav_bytes())
+        self.tts_cache.put(cache_key, temp_filename)
+        with self._streams_lock:
+            self._streams_in_flight.pop(cache_key, None)
+        self.logger.info(f"TTS stream stored: {cache_key[:12]} | {self.tts_cache.get_stats()}")
+
+    def _get_tts_audio(self, cache_key, cached_path):
+        return (self.audio_id_prefix + cache_key[:12], os.path.relpath(cached_path, self.sounds_folder))
+
+    @staticmethod
+    def get_phrase_key(text_to_send, language):
+        return (TtsCache.normalise_text(text_to_send), language)
+
+    def warm_up_phrases(self, phrases_config: list[dict], on_phrase_ready=None) -> threading.Thread:
+        # Only builds the phrase table here, synthesis runs in the background
+        phrases = {}
+        for phrase in phrases_config:
+            phrase_key = self.get_phrase_key(phrase["text"], phrase.get("language", "en"))
+            phrases[phrase_key] = phrase.get("id") or self.phrase_id_prefix + TtsCache.get_key(*phrase_key, "")[:12]
+        with self._phrases_lock:
+            self.phrases = phrases
+            self.phrase_audio_ids = {}
+        self.logger.info(f"TTS warm-up started for {len(phrases)} phrases")
+        warm_up_thread = threading.Thread(target=self._warm_up, args=(phrases, on_phrase_ready), name="TtsWarmUp", daemon=True)
+        warm_up_thread.start()
+        return warm_up_thread
+
+    def _warm_up(self, phrases: dict[tuple, str], on_phrase_ready):
+        started = time.monotonic()
+        cache_hits = self.tts_cache.hits
+        ready_count = 0
+        for phrase_key, phrase_id in phrases.items():
+            text_to_send, language = phrase_key
+            # Pinned before synthesis so storing it cannot evict it again
+            self.tts_cache.pin(self.get_cache_key(text_to_send, language, self.get_backend(language)))
+            tts_audio = self.generate_audio_file(text_to_send, language)
+            if(tts_audio is None):
+                self.logger.warning(f"TTS phrase [{phrase_id}] could not be pre-rendered")
+                continue
+            # Rendered by the fallback backend, which has its own cache key
+            self.tts_cache.pin(TtsCache.get_key_from_path(tts_audio[1]))
+            # The audio is registered before the phrase is matched, so a match always finds it
+            if(on_phrase_ready is not None):
+                on_phrase_ready(phrase_id, tts_audio[1])
+            with self._phrases_lock:
+                if(self.phrases is not phrases): return
+                self.phrase_audio_ids[phrase_key] = phrase_id
+            ready_count += 1
+        self.logger.info(f"TTS warm-up: {ready_count}/{len(phrases)} phrases ready in {time.monotonic() - started:.2f}s | already cached: {self.tts_cache.hits - cache_hits}")
+
+    def pin_audio_file(self, file_name):
+        # Kept in the cache while an announcement that plays it is registered
+        self.tts_cache.pin(TtsCache.get_key_from_path(file_name))
+
+    def unpin_audio_file(self, file_name):
+        self.tts_cache.unpin(TtsCache.get_key_from_path(file_name))
+
+    def get_phrase_audio_id(self, text_to_send, language="en") -> str:
+        # Audio id of a pre-rendered phrase, None while it is unknown or not ready yet
+        with self._phrases_lock:
+            return self.phrase_audio_ids.get(self.get_phrase_key(text_to_send, language))
+
+    def get_phrase_ids(self) -> list[str]:
+        with self._phrases_lock:
+            return list(self.phrase_audio_ids.values())
@@ -0,0 +1,70 @@
+import threading
+import time
+from controllers.pcm_cache import PcmAudio
+from zarus_core import CustomLogging
+
+class TtsStream():
+    # Synthesises chunks in the background and buffers them in order, so any
+    # number of readers can start playing as soon as chunk 0 is available
+    def __init__(self, audio_id: str, wav_chunks, logger:CustomLogging, on_complete=None, on_failed=None):
+        self.logger = logger
+        self.audio_id = audio_id
+        self.created_at = time.monotonic()
+        self.first_chunk_at = None
+        self.on_complete = on_complete
+        self.on_failed = on_failed
+        self._chunks: list[PcmAudio] = []
+        self._done = False
+        self._error: Exception = None
+        self._condition = threading.Condition()
+        threading.Thread(target=self._produce, args=(wav_chunks,), name="TtsStream", daemon=True).start()
+
+    def _produce(self, wav_chunks):
+        try:
+            for wav_bytes in wav_chunks:
+                audio = PcmAudio.from_wav_bytes(wav_bytes)
+                with self._condition:
+                    if self.first_chunk_at is None:
+                        self.first_chunk_at = time.monotonic()
+                        self.logger.info(f"TTS stream [{self.audio_id}] first chunk after {(self.first_chunk_at - self.created_at) * 1000:.0f}ms")
+                    self._chunks.append(audio)
+                    self._condition.notify_all()
+        except Exception as error:
+            self.logger.error(f"TTS stream [{self.audio_id}] failed: {error}")
+            self._error = error
+        with self._condition:
+            self._done = True
+            self._condition.notify_all()
+        if self._error is None and self.on_complete is not None:
+            self.on_complete(self._chunks[:])
+        elif self._error is not None and self.on_failed is not None:
+            self.on_failed()
+
+    def iter_pcm(self):
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._chunks) and not self._done:
+                    self._condition.wait()
+                if index >= len(self._chunks):
+                    return
+                audio = self._chunks[index]
+            index += 1
+            yield audio
+
+    def wait(self, timeout: float = None) -> bool:
+        with self._condition:
+            self._condition.wait_for(lambda: self._done, timeout)
+            return self._done and self._error is None
+
+    def wait_first_chunk(self, timeout: float = None) -> bool:
+        with self._condition:
+            self._condition.wait_for(lambda: self._chunks or self._done, timeout)
+            return len(self._chunks) > 0
+
+    def has_failed(self) -> bool:
+        return self._error is not None
+
+    def is_done(self) -> bool:
+        with self._condition:
+            return self._done
@@ -0,0 +1,77 @@
+import threading
+from collections import deque
+from zarus_core import CustomLogging
+
+class TtsJob():
+    def __init__(self, text: str, rooms: str, language: str = "en"):
+        self.text = text
+        self.rooms = rooms
+        self.language = language
+        self.merged = 0
+
+    def get_merge_key(self):
+        return (" ".join(self.text.split()), self.language, self.rooms.lower())
+
+
+class TtsWorkerPool():
+    # Synthesis runs on a few worker threads fed by a bounded queue. submit()
+    # never blocks the caller: a job identical to a pending one is merged into
+    # it, and a new job is dropped while the queue is full.
+    def __init__(self, process_job, logger:CustomLogging, worker_count: int = 2, max_queue: int = 8):
+        self.logger = logger
+        self.process_job = process_job
+        self.max_queue = max_queue
+        self._jobs: deque[TtsJob] = deque()
+        self._pending: dict = {}
+        self._condition = threading.Condition()
+        self.merged_count = 0
+        self.dropped_count = 0
+        self.processed_count = 0
+        self._workers = [threading.Thread(target=self._work, name=f"TtsWorker-{i}", daemon=True) for i in range(worker_count)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, job: TtsJob) -> bool:
+        with self._condition:
+            pending = self._pending.get(job.get_merge_key())
+            if pending is not None:
+                pending.merged += 1
+                self.merged_count += 1
+                self.logger.info(f"TTS request merged into a pending one | queue depth: {len(self._jobs)}")
+                return True
+            if len(self._jobs) >= self.max_queue:
+                self.dropped_count += 1
+                self.logger.warning(f"TTS queue full ({self.max_queue}), request dropped | dropped: {self.dropped_count}")
+                return False
+            self._jobs.append(job)
+            self._pending[job.get_merge_key()] = job
+            self._condition.notify()
+            self.logger.info(f"TTS request queued | queue depth: {len(self._jobs)}")
+            return True
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._jobs:
+                    self._condition.wait()
+                job = self._jobs.popleft()
+                self._pending.pop(job.get_merge_key(), None)
+            try:
+                self.process_job(job)
+            except Exception as error:
+                self.logger.error(f"TTS job failed: {error}")
+            with self._condition:
+                self.processed_count += 1
+
+    def get_queue_depth(self) -> int:
+        with self._condition:
+            return len(self._jobs)
+
+    def get_metrics(self) -> dict:
+        with self._condition:
+            return {
+                "depth": len(self._jobs),
+                "processed": self.processed_count,
+                "merged": self.merged_count,
+                "dropped": self.dropped_count
+            }
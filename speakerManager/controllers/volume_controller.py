@@ -1,23 +1,120 @@
-import subprocess
+import threading
+from zarus_core import CustomLogging
+from services.volume_mixer import VolumeMixer, AlsaAudioMixer, AmixerSessionMixer, PulseMixer
 
 class VolumeController:
-    audio_card_index = 0
+    # "Set Volume" messages only record the wanted level per mixer control. A
+    # dedicated thread applies the latest level of each control through a mixer
+    # handle kept open per card, so a burst from a slider ends in one write.
+    MIXER_AUTO = "auto"
+    MIXER_ALSAAUDIO = "alsaaudio"
+    MIXER_AMIXER = "amixer"
+    MIXER_PULSE = "pulse"
+    default_card = 0
+    default_control = "Master"
 
-    @staticmethod
-    def _execute_command(volume):
-        #command = f"amixer -c {VolumeController.audio_card_index} set 'Master' {volume}%"
-        command = f"amixer set 'Master' {volume}%"
-        subprocess.run(command, shell=True)
+    def __init__(self, volume_config: dict, logger:CustomLogging, mixer_factory=None):
+        self.logger = logger
+        volume_config = volume_config or {}
+        self.mixer_type = volume_config.get("mixer", self.MIXER_AUTO)
+        default_control = PulseMixer.default_control if self.mixer_type == self.MIXER_PULSE else self.default_control
+        self.default_target = (volume_config.get("card", self.default_card), volume_config.get("control", default_control))
+        self.room_targets: dict[str, tuple] = {}
+        for room_name, room_config in volume_config.get("rooms", {}).items():
+            self.room_targets[room_name.lower()] = (room_config.get("card", self.default_target[0]), room_config.get("control", self.default_target[1]))
+        self.mixer_factory = mixer_factory or self._create_mixer
+        self._mixers: dict = {}
+        self._pending: dict[tuple, int] = {}
+        self.volumes: dict[tuple, int] = {}
+        self._condition = threading.Condition()
+        self._applying = False
+        self.requested_count = 0
+        self.applied_count = 0
+        self._worker = threading.Thread(target=self._apply_pending, name="VolumeController", daemon=True)
+        self._worker.start()
+
+    def _create_mixer(self, card) -> VolumeMixer:
+        mixer_type = self.mixer_type
+        if mixer_type == self.MIXER_AUTO:
+            mixer_type = self.MIXER_ALSAAUDIO if AlsaAudioMixer.is_available() else self.MIXER_AMIXER
+        self.logger.info(f"Opening {mixer_type} mixer for card {card}")
+        if mixer_type == self.MIXER_ALSAAUDIO:
+            return AlsaAudioMixer(card, logger=self.logger)
+        if mixer_type == self.MIXER_PULSE:
+            return PulseMixer(logger=self.logger)
+        return AmixerSessionMixer(card, logger=self.logger)
 
     @staticmethod
-    def set_volume(volume):
+    def parse_volume(volume) -> int:
         try:
-            volume_float = float(volume)
-            volume_int = round(volume_float)
-            if 0 <= volume_int <= 100:
-                VolumeController._execute_command(volume_int)
-        except:
-            pass
-            
-            
-            
\ No newline at end of file
+            volume_int = round(float(volume))
+        except (TypeError, ValueError):
+            return None
+        if 0 <= volume_int <= 100:
+            return volume_int
+        return None
+
+    def get_targets(self, room_names: list[str] = None) -> list[tuple]:
+        # Rooms without their own control share the default one
+        if not room_names:
+            return [self.default_target]
+        targets = []
+        for room_name in room_names:
+            target = self.room_targets.get(room_name.lower(), self.default_target)
+            if target not in targets:
+                targets.append(target)
+        return targets
+
+    def get_all_targets(self) -> list[tuple]:
+        return self.get_targets(list(self.room_targets)) + [self.default_target]
+
+    def set_volume(self, volume, room_names: list[str] = None) -> bool:
+        volume_int = self.parse_volume(volume)
+        if volume_int is None:
+            self.logger.warning(f"Invalid volume value: {volume}")
+            return False
+        with self._condition:
+            for target in self.get_targets(room_names):
+                self._pending[target] = volume_int
+            self.requested_count += 1
+            self._condition.notify_all()
+        return True
+
+    def get_volume(self, room_name: str = None) -> int:
+        target = self.get_targets([room_name] if room_name else None)[0]
+        with self._condition:
+            return self._pending.get(target, self.volumes.get(target))
+
+    def _apply_pending(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                pending = self._pending
+                self._pending = {}
+                self._applying = True
+            for (card, control), volume_int in pending.items():
+                mixer = self._mixers.get(card)
+                if mixer is None:
+                    mixer = self.mixer_factory(card)
+                    self._mixers[card] = mixer
+                try:
+                    applied = mixer.set_volume(control, volume_int)
+                except Exception as error:
+                    self.logger.error(f"Volume change failed on card {card} [{control}]: {error}")
+                    applied = False
+                with self._condition:
+                    if applied:
+                        self.volumes[(card, control)] = volume_int
+                    self.applied_count += 1
+            with self._condition:
+                self._applying = False
+                self._condition.notify_all()
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._applying, timeout)
+
+    def get_metrics(self) -> dict:
+        with self._condition:
+            return {"requested": self.requested_count, "applied": self.applied_count}
@@ -1,38 +1,50 @@
-import pychromecast
-import time
 from devices.speaker_interface import Speaker
+from services.chromecast_pool import ChromecastPool, CastSession
+from services.audio_http_server import AudioHttpServer
 
 class ChromecastAudioDevice(Speaker):
-    def __init__(self, friendly_name, filespath):
+    content_type = 'audio/wav'
+    play_timeout = 10.0
+
+    def __init__(self, friendly_name, filespath, pool: ChromecastPool, audio_server: AudioHttpServer = None):
         self.id = friendly_name
-        self.cast = self._get_chromecast(friendly_name)
+        self.pool = pool
         self.filespath = filespath
+        self.audio_server = audio_server
 
-    def _get_chromecast(self, friendly_name):
-        chromecasts, browser = pychromecast.get_listed_chromecasts(friendly_names=[friendly_name])
-        return chromecasts[0] if chromecasts else None
-    
-    def play_audio(self, filename):
-        if not self.cast:
+    @property
+    def cast(self):
+        session = self.pool.get_session(self.id)
+        return session.cast if session else None
+
+    def get_session(self) -> CastSession:
+        # Discovery may still be running right after startup
+        return self.pool.get_session(self.id, timeout=self.pool.get_startup_wait())
+
+    def get_media_url(self, filename) -> str:
+        # The embedded server when enabled, otherwise the external one at hostPath
+        if self.audio_server is not None:
+            return self.audio_server.get_url(filename)
+        return f"{self.filespath}/{filename}"
+
+    def get_content_type(self) -> str:
+        if self.audio_server is not None:
+            return self.audio_server.get_content_type()
+        return self.content_type
+
+    def play_audio(self, filename) -> bool:
+        session = self.get_session()
+        if not session:
             print("No se encontró el dispositivo Chromecast.")
-            return
-        media_url = f"{self.filespath}/{filename}"
-        self._play_media(media_url)
-    
-    def _play_media(self, media_url):
-        self.cast.wait()
-        media_controller = self.cast.media_controller
-        media_controller.play_media(media_url, 'audio/wav')
-        media_controller.block_until_active()
-        media_controller.play()
-        while(not media_controller.status.player_is_playing):
-            time.sleep(0.02)
+            return False
+        return session.play(self.get_media_url(filename), self.get_content_type(), self.play_timeout)
 
     def stop(self):
-        if not self.cast:
+        session = self.pool.get_session(self.id)
+        if not session:
             print("No se encontró el dispositivo Chromecast.")
             return
-        self.cast.media_controller.stop()
+        session.stop()
 
     def get_id(self):
         return self.id 
@@ -54,11 +66,12 @@ class ChromecastAudioDevice(Speaker):
         return None
 
     @staticmethod
-    def list_from_json(json_data):
+    def list_from_json(json_data, pool: ChromecastPool, audio_server: AudioHttpServer = None):
         devices = json_data["chromecasts"]["devices"]
-        host_path = json_data["chromecasts"]["hostPath"]
+        host_path = json_data["chromecasts"].get("hostPath")
         chromecast_devices = []
         for device_name in devices:
-            device = ChromecastAudioDevice(device_name, host_path)
+            device = ChromecastAudioDevice(device_name, host_path, pool, audio_server)
             chromecast_devices.append(device)
+        pool.start(devices)
         return chromecast_devices
\ No newline at end of file
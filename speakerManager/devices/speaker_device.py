@@ -1,6 +1,7 @@
 from devices.speaker_interface import Speaker
 from services.mqtt_service import MqttService
 from zarus_core import CustomLogging
+from concurrent.futures import Future
 import threading
 import time
 
@@ -17,6 +18,7 @@ class SpeakerDevice(Speaker):
         self.audio_list = []
         self._action_lock = threading.Lock()
         self._turn_on_requested = None
+        self._status_waiters: list[tuple[bool, Future]] = []
         self.logger = CustomLogging(component_name=f"Speaker.{id or 'unknown'}")
         self.mqtt_service = MqttService()
         self.mqtt_service.add_subscription(self.subscribe_topic)
@@ -47,6 +49,23 @@ class SpeakerDevice(Speaker):
     def get_status(self):
         return self.speaker_status
 
+    def wait_for_status(self, expected_status: bool = True) -> Future:
+        future = Future()
+        with self._action_lock:
+            if self.speaker_status == expected_status:
+                future.set_result(expected_status)
+            else:
+                self._status_waiters.append((expected_status, future))
+        return future
+
+    def _resolve_status_waiters(self):
+        with self._action_lock:
+            resolved = [(status, future) for status, future in self._status_waiters if status == self.speaker_status]
+            self._status_waiters = [(status, future) for status, future in self._status_waiters if status != self.speaker_status and not future.done()]
+        for status, future in resolved:
+            if future.set_running_or_notify_cancel():
+                future.set_result(status)
+
     def parse_speaker_status(self,new_status):
         aux_status = False
         if new_status == '0':
@@ -93,6 +112,7 @@ class SpeakerDevice(Speaker):
                 new_status = key
                 break
         actual_status = self.parse_speaker_status(new_status)
+        self._resolve_status_waiters()
         return actual_status
     
     def get_id(self):
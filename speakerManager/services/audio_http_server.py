@@ -0,0 +1,255 @@
+import hashlib
+import os
+import re
+import shutil
+import socket
+import subprocess
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, unquote
+from zarus_core import CustomLogging
+from controllers.pcm_cache import PcmAudio
+from controllers.audio_mixer import AudioMixer
+
+class ServedAudio():
+    def __init__(self, data: bytes, content_type: str, version=None):
+        self.data = data
+        self.content_type = content_type
+        self.version = version
+        self.etag = f'"{hashlib.sha1(data).hexdigest()[:20]}"'
+
+
+class AudioThreadingServer(ThreadingHTTPServer):
+    # Several casts and retries connect at once, the default backlog of 5 drops SYNs
+    request_queue_size = 64
+    daemon_threads = True
+
+
+class AudioHttpServer():
+    # Serves the sound library and TTS streams to the casts from memory. Files
+    # are read once and kept while they fit in the cache, a changed file is
+    # read again. Ranges and ETags are honoured, casts seek and revalidate.
+    FORMAT_WAV = "wav"
+    FORMAT_MP3 = "mp3"
+    FORMAT_WAV_MONO = "wavMono"
+    CONTENT_TYPES = {FORMAT_WAV: "audio/wav", FORMAT_MP3: "audio/mpeg", FORMAT_WAV_MONO: "audio/wav"}
+    RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+    URL_PREFIX = "/sounds/"
+
+    def __init__(self, sounds_folder: str, logger:CustomLogging, server_config: dict = None):
+        self.logger = logger
+        server_config = server_config or {}
+        self.sounds_folder = os.path.realpath(sounds_folder)
+        self.max_bytes = server_config.get("cacheSizeMb", 32) * 1024 * 1024
+        self.stream_timeout = server_config.get("streamTimeout", 30.0)
+        self.transcode_format = self._get_transcode_format(server_config.get("transcode"))
+        self._cache: OrderedDict[tuple, ServedAudio] = OrderedDict()
+        self._cache_bytes = 0
+        self._streams: dict = {}
+        self._lock = threading.Lock()
+        self.server = AudioThreadingServer((server_config.get("bindAddress", "0.0.0.0"), server_config.get("port", 8000)), self._build_handler())
+        self.advertised_host = server_config.get("advertisedHost") or self.detect_local_address()
+        self._thread = None
+
+    def _get_transcode_format(self, transcode_format: str) -> str:
+        if transcode_format is None or transcode_format == self.FORMAT_WAV:
+            return None
+        if transcode_format == self.FORMAT_MP3 and shutil.which("ffmpeg") is None:
+            self.logger.warning("ffmpeg not found, casts get the original wav files")
+            return None
+        if transcode_format not in self.CONTENT_TYPES:
+            self.logger.warning(f"Unknown transcode format: {transcode_format}")
+            return None
+        return transcode_format
+
+    @staticmethod
+    def detect_local_address() -> str:
+        # The address of the interface that routes outside, nothing is sent
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            try:
+                probe.connect(("10.255.255.255", 1))
+                return probe.getsockname()[0]
+            except OSError:
+                return "127.0.0.1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="AudioHttpServer", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Audio server listening on {self.get_base_url()}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_base_url(self) -> str:
+        return f"http://{self.advertised_host}:{self.server.server_address[1]}"
+
+    def get_url(self, file_name: str) -> str:
+        return f"{self.get_base_url()}{self.URL_PREFIX}{quote(file_name)}"
+
+    def get_content_type(self) -> str:
+        return self.CONTENT_TYPES[self.transcode_format or self.FORMAT_WAV]
+
+    def register_stream(self, file_name: str, tts_stream):
+        # Casts asking for a TTS file still being synthesised get it once the stream ends
+        with self._lock:
+            self._streams[file_name] = tts_stream
+
+    def forget(self, file_name: str):
+        with self._lock:
+            self._streams.pop(file_name, None)
+            for key in [key for key in self._cache if key[0] == file_name]:
+                self._cache_bytes -= len(self._cache.pop(key).data)
+
+    def _resolve_path(self, file_name: str) -> str:
+        file_path = os.path.realpath(os.path.join(self.sounds_folder, file_name))
+        if not file_path.startswith(self.sounds_folder + os.sep):
+            return None
+        return file_path
+
+    def get_audio(self, file_name: str, audio_format: str = None) -> ServedAudio:
+        audio_format = audio_format or self.transcode_format or self.FORMAT_WAV
+        if audio_format == self.FORMAT_MP3 and shutil.which("ffmpeg") is None:
+            audio_format = self.FORMAT_WAV
+        key = (file_name, audio_format)
+        with self._lock:
+            tts_stream = self._streams.get(file_name)
+        file_path = self._resolve_path(file_name)
+        version = None
+        if tts_stream is None:
+            if file_path is None or not os.path.isfile(file_path):
+                return None
+            stat = os.stat(file_path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            served_audio = self._cache.get(key)
+            if served_audio is not None and served_audio.version == version:
+                self._cache.move_to_end(key)
+                return served_audio
+        if tts_stream is not None:
+            if not tts_stream.wait(self.stream_timeout):
+                return None
+            wav_bytes = PcmAudio.concatenate(list(tts_stream.iter_pcm())).to_wav_bytes()
+        else:
+            with open(file_path, 'rb') as audio_file:
+                wav_bytes = audio_file.read()
+        served_audio = ServedAudio(self.transcode(wav_bytes, audio_format), self.CONTENT_TYPES[audio_format], version)
+        self._put(key, served_audio)
+        return served_audio
+
+    def _put(self, key: tuple, served_audio: ServedAudio):
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cache_bytes -= len(previous.data)
+            if len(served_audio.data) > self.max_bytes:
+                return
+            self._cache[key] = served_audio
+            self._cache_bytes += len(served_audio.data)
+            while self._cache_bytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted.data)
+
+    def transcode(self, wav_bytes: bytes, audio_format: str) -> bytes:
+        if audio_format == self.FORMAT_MP3:
+            return subprocess.run(['ffmpeg', '-loglevel', 'error', '-i', 'pipe:0', '-f', 'mp3', '-b:a', '96k', 'pipe:1'],
+                                  input=wav_bytes, capture_output=True, timeout=30, check=True).stdout
+        if audio_format == self.FORMAT_WAV_MONO:
+            # Voice announcements lose nothing audible in mono at 22.05 kHz, a quarter of the bytes
+            mixer = AudioMixer(channels=1, frame_rate=22050, logger=self.logger)
+            return mixer.prepare(PcmAudio.from_wav_bytes(wav_bytes)).to_wav_bytes()
+        return wav_bytes
+
+    @classmethod
+    def parse_range(cls, range_header: str, size: int) -> tuple[int, int]:
+        # Inclusive (start, end) of a single byte range, None when it cannot be served
+        match = cls.RANGE_PATTERN.match(range_header.strip())
+        if match is None or size == 0:
+            return None
+        start, end = match.groups()
+        if start == "":
+            if end == "" or int(end) == 0:
+                return None
+            return (max(0, size - int(end)), size - 1)
+        start = int(start)
+        end = size - 1 if end == "" else min(int(end), size - 1)
+        if start > end:
+            return None
+        return (start, end)
+
+    def _build_handler(self):
+        audio_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                return
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def _serve(self, send_body: bool):
+                parsed_url = urlparse(self.path)
+                if not parsed_url.path.startswith(audio_server.URL_PREFIX):
+                    self._send_status(404)
+                    return
+                file_name = unquote(parsed_url.path[len(audio_server.URL_PREFIX):])
+                audio_format = parse_qs(parsed_url.query).get("format", [None])[0]
+                if audio_format is not None and audio_format not in audio_server.CONTENT_TYPES:
+                    self._send_status(400)
+                    return
+                try:
+                    served_audio = audio_server.get_audio(file_name, audio_format)
+                except Exception as error:
+                    audio_server.logger.error(f"Audio server failed on {file_name}: {error}")
+                    self._send_status(500)
+                    return
+                if served_audio is None:
+                    self._send_status(404)
+                    return
+                if self.headers.get("If-None-Match") == served_audio.etag:
+                    self.send_response(304)
+                    self.send_header("ETag", served_audio.etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                data = served_audio.data
+                byte_range = None
+                range_header = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if range_header is not None and (if_range is None or if_range == served_audio.etag):
+                    byte_range = audio_server.parse_range(range_header, len(data))
+                    if byte_range is None:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(data)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                if byte_range is not None:
+                    start, end = byte_range
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                    body = memoryview(data)[start:end + 1]
+                else:
+                    self.send_response(200)
+                    body = memoryview(data)
+                self.send_header("Content-Type", served_audio.content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("ETag", served_audio.etag)
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            def _send_status(self, status: int):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        return Handler
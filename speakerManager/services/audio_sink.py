@@ -0,0 +1,112 @@
+import threading
+from abc import ABC, abstractmethod
+from subprocess import Popen, PIPE, DEVNULL
+from zarus_core import CustomLogging
+
+class AudioSink(ABC):
+    pcm_format: tuple[int, int, int]
+
+    def __init__(self, pcm_format: tuple[int, int, int]):
+        self.pcm_format = pcm_format
+
+    @abstractmethod
+    def write(self, data: bytes):
+        pass
+
+    def close(self):
+        return None
+
+
+class ProcessAudioSink(AudioSink):
+    # Long-lived aplay/pacat reading raw PCM from stdin, restarted if it dies
+    ALSA_FORMATS = {1: "U8", 2: "S16_LE", 3: "S24_3LE", 4: "S32_LE"}
+    PULSE_FORMATS = {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
+
+    def __init__(self, pcm_format: tuple[int, int, int], player: str, logger:CustomLogging):
+        super().__init__(pcm_format)
+        self.player = player
+        self.logger = logger
+        self.process: Popen = None
+
+    def _build_command(self) -> list[str]:
+        channels, sample_width, frame_rate = self.pcm_format
+        if self.player == "pacat":
+            return ['pacat', '--playback', '--raw', f'--format={self.PULSE_FORMATS[sample_width]}',
+                    f'--rate={frame_rate}', f'--channels={channels}', '--latency-msec=100']
+        return ['aplay', '-q', '-t', 'raw', '-f', self.ALSA_FORMATS[sample_width],
+                '-r', str(frame_rate), '-c', str(channels), '--buffer-time=200000']
+
+    def _ensure_process(self):
+        if self.process is None or self.process.poll() is not None:
+            command = self._build_command()
+            self.logger.info(f"Starting audio sink: {' '.join(command)}")
+            self.process = Popen(command, stdin=PIPE, stdout=DEVNULL)
+
+    def write(self, data: bytes):
+        self._ensure_process()
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.logger.warning(f"Audio sink {self.player} closed its input, restarting")
+            self.process = None
+            self._ensure_process()
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.process.wait()
+            self.process = None
+
+
+class FileAudioSink(AudioSink):
+    # Appends the raw PCM stream to a file, used instead of a sound card in tests
+    def __init__(self, pcm_format: tuple[int, int, int], file_path: str):
+        super().__init__(pcm_format)
+        channels, sample_width, frame_rate = pcm_format
+        self.file_path = f"{file_path}.{frame_rate}hz_{channels}ch_{sample_width * 8}bit.raw"
+        self.file = open(self.file_path, 'ab')
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class AudioSinkPool():
+    SINK_APLAY = "aplay"
+    SINK_PACAT = "pacat"
+    SINK_FILE = "file"
+
+    def __init__(self, sink_type: str, logger:CustomLogging, sink_file: str = "logs/audio_sink"):
+        self.sink_type = sink_type
+        self.sink_file = sink_file
+        self.logger = logger
+        self._sinks: dict[tuple, AudioSink] = {}
+        self._lock = threading.Lock()
+
+    def get(self, pcm_format: tuple[int, int, int]) -> AudioSink:
+        with self._lock:
+            sink = self._sinks.get(pcm_format)
+            if sink is None:
+                sink = self._create(pcm_format)
+                self._sinks[pcm_format] = sink
+            return sink
+
+    def _create(self, pcm_format: tuple[int, int, int]) -> AudioSink:
+        if self.sink_type == self.SINK_FILE:
+            return FileAudioSink(pcm_format, self.sink_file)
+        return ProcessAudioSink(pcm_format, self.sink_type, self.logger)
+
+    def close(self):
+        with self._lock:
+            for sink in self._sinks.values():
+                sink.close()
+            self._sinks.clear()
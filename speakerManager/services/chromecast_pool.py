@@ -0,0 +1,197 @@
+import threading
+import time
+import pychromecast
+import zeroconf
+from pychromecast.socket_client import CONNECTION_STATUS_CONNECTED
+from zarus_core import CustomLogging
+
+class CastSession():
+    # One connected cast. Readiness and playback come from pychromecast's status
+    # callbacks; the socket client reconnects by itself after a drop.
+    def __init__(self, friendly_name: str, cast, logger:CustomLogging):
+        self.friendly_name = friendly_name
+        self.cast = cast
+        self.logger = logger
+        self.connected = threading.Event()
+        self.playing = threading.Event()
+        self.loaded = threading.Event()
+        self.load_failed = None
+        self.playing_at = None
+        self.connections = 0
+        self.found_at = time.monotonic()
+        self.connected_at = None
+        cast.register_connection_listener(self)
+        cast.media_controller.register_status_listener(self)
+
+    def start(self):
+        self.cast.start()
+
+    def new_connection_status(self, status):
+        if status.status == CONNECTION_STATUS_CONNECTED:
+            self.connections += 1
+            if self.connected_at is None:
+                self.connected_at = time.monotonic()
+            if self.connections > 1:
+                self.logger.info(f"[Chromecast] {self.friendly_name} reconnected")
+            self.connected.set()
+        else:
+            if self.connected.is_set():
+                self.logger.warning(f"[Chromecast] {self.friendly_name} connection {status.status}")
+            self.connected.clear()
+
+    def new_media_status(self, status):
+        if status.player_is_playing and not self.playing.is_set():
+            self.playing_at = time.monotonic()
+            self.playing.set()
+        elif status.player_is_paused:
+            self.loaded.set()
+
+    def load_media_failed(self, item, error_code):
+        self.load_failed = error_code
+        self.loaded.set()
+        self.playing.set()
+
+    def is_connected(self) -> bool:
+        return self.connected.is_set()
+
+    def play(self, media_url: str, content_type: str, timeout: float) -> bool:
+        if not self.connected.wait(timeout):
+            self.logger.warning(f"[Chromecast] {self.friendly_name} not connected after {timeout}s")
+            return False
+        self.playing.clear()
+        self.load_failed = None
+        self.playing_at = None
+        self.cast.media_controller.play_media(media_url, content_type)
+        if not self.playing.wait(timeout):
+            self.logger.warning(f"[Chromecast] {self.friendly_name} did not start playing after {timeout}s")
+            return False
+        if self.load_failed is not None:
+            self.logger.error(f"[Chromecast] {self.friendly_name} failed to load {media_url}: {self.load_failed}")
+            return False
+        return True
+
+    def load(self, media_url: str, content_type: str, timeout: float) -> bool:
+        # Buffers the media paused, play_loaded() then starts it with a single message
+        if not self.connected.wait(timeout):
+            self.logger.warning(f"[Chromecast] {self.friendly_name} not connected after {timeout}s")
+            return False
+        self.loaded.clear()
+        self.playing.clear()
+        self.load_failed = None
+        self.playing_at = None
+        self.cast.media_controller.play_media(media_url, content_type, autoplay=False)
+        if not self.loaded.wait(timeout):
+            self.logger.warning(f"[Chromecast] {self.friendly_name} did not load {media_url} after {timeout}s")
+            return False
+        return self.load_failed is None
+
+    def play_loaded(self):
+        self.cast.media_controller.play()
+
+    def stop(self):
+        if self.connected.is_set():
+            self.cast.media_controller.stop()
+
+    def close(self):
+        self.cast.disconnect(blocking=False)
+
+
+class ZeroconfCastDiscovery():
+    # A single mDNS browser for every configured cast, it keeps running so a
+    # cast that comes back with a new address replaces its session
+    def __init__(self, logger:CustomLogging):
+        self.logger = logger
+        self.zconf = None
+        self.browser = None
+
+    def start_discovery(self, on_cast_found):
+        self.zconf = zeroconf.Zeroconf()
+        def add_cast(uuid, _service):
+            cast_info = self.browser.devices[uuid]
+            on_cast_found(cast_info.friendly_name, lambda: pychromecast.get_chromecast_from_cast_info(cast_info, self.zconf, tries=None))
+        self.browser = pychromecast.CastBrowser(pychromecast.SimpleCastListener(add_callback=add_cast, update_callback=add_cast), self.zconf)
+        self.browser.start_discovery()
+
+    def stop_discovery(self):
+        if self.browser is not None:
+            self.browser.stop_discovery()
+        if self.zconf is not None:
+            self.zconf.close()
+
+
+class ChromecastPool():
+    # Discovery runs in the background from startup, every configured cast is
+    # connected as soon as it is found and kept connected afterwards.
+    def __init__(self, logger:CustomLogging, discovery=None, discovery_timeout: float = 10.0):
+        self.logger = logger
+        self.discovery_timeout = discovery_timeout
+        self.discovery = discovery or ZeroconfCastDiscovery(logger=logger)
+        self.friendly_names: set[str] = set()
+        self.sessions: dict[str, CastSession] = {}
+        self._condition = threading.Condition()
+        self.started_at = None
+
+    def start(self, friendly_names: list[str]):
+        self.friendly_names = set(friendly_names)
+        if not self.friendly_names:
+            return
+        self.started_at = time.monotonic()
+        self.logger.info(f"[Chromecast] Discovering {len(self.friendly_names)} casts in the background")
+        threading.Thread(target=self.discovery.start_discovery, args=(self._on_cast_found,), name="CastDiscovery", daemon=True).start()
+
+    def _on_cast_found(self, friendly_name: str, cast_factory):
+        if friendly_name not in self.friendly_names:
+            return
+        with self._condition:
+            session = self.sessions.get(friendly_name)
+        if session is not None and session.is_connected():
+            return
+        try:
+            new_session = CastSession(friendly_name, cast_factory(), logger=self.logger)
+        except Exception as error:
+            self.logger.error(f"[Chromecast] Unable to create {friendly_name}: {error}")
+            return
+        new_session.start()
+        with self._condition:
+            self.sessions[friendly_name] = new_session
+            self._condition.notify_all()
+        if session is not None:
+            session.close()
+        self.logger.info(f"[Chromecast] Found {friendly_name} after {(time.monotonic() - self.started_at) * 1000:.0f}ms")
+
+    def get_session(self, friendly_name: str, timeout: float = 0) -> CastSession:
+        with self._condition:
+            self._condition.wait_for(lambda: friendly_name in self.sessions, timeout)
+            return self.sessions.get(friendly_name)
+
+    def get_startup_wait(self) -> float:
+        # Only requests right after startup wait for discovery, later a missing cast is skipped at once
+        if self.started_at is None:
+            return 0.0
+        return max(0.0, self.started_at + self.discovery_timeout - time.monotonic())
+
+    def get_sessions(self, friendly_names: list[str], timeout: float = 0) -> dict[str, CastSession]:
+        # One deadline shared by every cast, missing ones are left out
+        deadline = time.monotonic() + timeout
+        sessions = {}
+        for friendly_name in friendly_names:
+            session = self.get_session(friendly_name, max(0.0, deadline - time.monotonic()))
+            if session is not None:
+                sessions[friendly_name] = session
+        return sessions
+
+    def wait_ready(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        for friendly_name in self.friendly_names:
+            session = self.get_session(friendly_name, max(0.0, deadline - time.monotonic()))
+            if session is None or not session.connected.wait(max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def stop(self):
+        self.discovery.stop_discovery()
+        with self._condition:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+        for session in sessions:
+            session.close()
@@ -0,0 +1,100 @@
+import threading
+import time
+from pychromecast.socket_client import ConnectionStatus, NetworkAddress, CONNECTION_STATUS_CONNECTING, CONNECTION_STATUS_CONNECTED, CONNECTION_STATUS_LOST
+
+class FakeMediaStatus():
+    def __init__(self, player_state: str = "IDLE", content_id: str = None):
+        self.player_state = player_state
+        self.content_id = content_id
+
+    @property
+    def player_is_playing(self) -> bool:
+        return self.player_state == "PLAYING"
+
+    @property
+    def player_is_paused(self) -> bool:
+        return self.player_state == "PAUSED"
+
+
+class FakeMediaController():
+    def __init__(self, cast):
+        self.cast = cast
+        self.status = FakeMediaStatus()
+        self.listeners = []
+
+    def register_status_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _set_status(self, player_state: str, content_id: str):
+        self.status = FakeMediaStatus(player_state, content_id)
+        if player_state == "PLAYING":
+            self.cast.played.append((time.monotonic(), content_id))
+        for listener in self.listeners:
+            listener.new_media_status(self.status)
+
+    def _after(self, delay: float, player_state: str, content_id: str):
+        threading.Timer(delay, self._set_status, args=(player_state, content_id)).start()
+
+    def play_media(self, url: str, content_type: str, autoplay: bool = True):
+        self.status = FakeMediaStatus()
+        self._after(self.cast.play_latency, "PLAYING" if autoplay else "PAUSED", url)
+
+    def play(self):
+        self._after(self.cast.start_latency, "PLAYING", self.status.content_id)
+
+    def stop(self):
+        self.status = FakeMediaStatus()
+
+
+class FakeCast():
+    # Stand-in for pychromecast.Chromecast: connects after connect_latency and
+    # reports media and connection changes through the same listener calls
+    def __init__(self, name: str, connect_latency: float = 0.2, play_latency: float = 0.3, start_latency: float = 0.01):
+        self.name = name
+        self.connect_latency = connect_latency
+        self.play_latency = play_latency
+        self.start_latency = start_latency
+        self.connection_listeners = []
+        self.media_controller = FakeMediaController(self)
+        self.played: list[tuple[float, str]] = []
+        self.disconnected = False
+
+    def register_connection_listener(self, listener):
+        self.connection_listeners.append(listener)
+
+    def _notify_connection(self, status: str):
+        for listener in self.connection_listeners:
+            listener.new_connection_status(ConnectionStatus(status, NetworkAddress("127.0.0.1", 8009)))
+
+    def _connect(self, delay: float):
+        self._notify_connection(CONNECTION_STATUS_CONNECTING)
+        time.sleep(delay)
+        if not self.disconnected:
+            self._notify_connection(CONNECTION_STATUS_CONNECTED)
+
+    def start(self):
+        threading.Thread(target=self._connect, args=(self.connect_latency,), daemon=True).start()
+
+    def drop(self, reconnect_after: float):
+        # Like a socket loss, the reconnection follows on its own
+        self._notify_connection(CONNECTION_STATUS_LOST)
+        threading.Thread(target=self._connect, args=(reconnect_after,), daemon=True).start()
+
+    def disconnect(self, timeout=None, blocking=True):
+        self.disconnected = True
+
+
+class FakeCastDiscovery():
+    # Announces each cast after its own mDNS delay, all of them concurrently
+    def __init__(self, casts: list[FakeCast], discovery_latency: float = 1.0):
+        self.casts = casts
+        self.discovery_latency = discovery_latency
+        self.stopped = False
+
+    def start_discovery(self, on_cast_found):
+        for index, cast in enumerate(self.casts):
+            delay = self.discovery_latency * (0.5 + 0.5 * index / max(len(self.casts) - 1, 1))
+            threading.Timer(delay, lambda cast=cast: self.stopped or on_cast_found(cast.name, lambda: cast)).start()
+
+    def stop_discovery(self):
+        self.stopped = True
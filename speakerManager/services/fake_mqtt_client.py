@@ -0,0 +1,114 @@
+import queue
+import threading
+
+class FakeMqttMessage():
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+
+
+class FakeMqttBroker():
+    _instance = None
+    _clients: list
+    _lock: threading.Lock
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._clients = []
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    def register(self, client):
+        with self._lock:
+            if client not in self._clients:
+                self._clients.append(client)
+
+    def unregister(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def publish(self, topic: str, payload: bytes):
+        with self._lock:
+            clients = self._clients[:]
+        for client in clients:
+            if client.is_subscribed(topic):
+                client.deliver(FakeMqttMessage(topic, payload))
+
+    @staticmethod
+    def topic_matches(topic_filter: str, topic: str) -> bool:
+        filter_levels = topic_filter.split("/")
+        topic_levels = topic.split("/")
+        for i, filter_level in enumerate(filter_levels):
+            if filter_level == "#":
+                return True
+            if i >= len(topic_levels):
+                return False
+            if filter_level != "+" and filter_level != topic_levels[i]:
+                return False
+        return len(filter_levels) == len(topic_levels)
+
+
+class FakeMqttClient():
+    # In-process stand-in for paho's mqtt.Client, messages are delivered on a
+    # background thread like paho's network loop does.
+    def __init__(self, client_id: str = "", broker: FakeMqttBroker = None):
+        self.client_id = client_id
+        self.broker = broker if broker is not None else FakeMqttBroker()
+        self.on_message = None
+        self.subscriptions = []
+        self.published = []
+        self._inbox = queue.Queue()
+        self._loop_thread = None
+        self._subscriptions_lock = threading.Lock()
+
+    def username_pw_set(self, username=None, password=None):
+        return None
+
+    def connect(self, host=None, *args, **kwargs):
+        self.broker.register(self)
+        return 0
+
+    def disconnect(self):
+        self.broker.unregister(self)
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        with self._subscriptions_lock:
+            if topic not in self.subscriptions:
+                self.subscriptions.append(topic)
+        return (0, 0)
+
+    def is_subscribed(self, topic: str) -> bool:
+        with self._subscriptions_lock:
+            subscriptions = self.subscriptions[:]
+        return any(FakeMqttBroker.topic_matches(topic_filter, topic) for topic_filter in subscriptions if topic_filter)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self.published.append((topic, payload))
+        self.broker.publish(topic, payload or b"")
+
+    def deliver(self, message: FakeMqttMessage):
+        self._inbox.put(message)
+
+    def loop_start(self):
+        if self._loop_thread is None:
+            self._loop_thread = threading.Thread(target=self._network_loop, name=f"FakeMqtt.{self.client_id}", daemon=True)
+            self._loop_thread.start()
+
+    def loop_stop(self):
+        if self._loop_thread is not None:
+            self._inbox.put(None)
+            self._loop_thread.join()
+            self._loop_thread = None
+
+    def _network_loop(self):
+        while True:
+            message = self._inbox.get()
+            if message is None:
+                return
+            if self.on_message is not None:
+                self.on_message(self, None, message)
@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+class FakeSpotifyServer():
+    # Local stand-in for the two Web API endpoints the service uses. The device
+    # list carries an ETag that changes with it, If-None-Match answers 304.
+    def __init__(self, device_name: str, latency: float = 0.15, volume_percent: int = 60):
+        self.latency = latency
+        self.device = {"id": "librespot0", "is_active": True, "is_private_session": False, "is_restricted": False,
+                       "name": device_name, "type": "Speaker", "volume_percent": volume_percent}
+        self.version = 1
+        self.requests = 0
+        self.not_modified = 0
+        self.volume_changes: list[tuple[float, int]] = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._build_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def get_url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def get_etag(self) -> str:
+        return f'"{self.version}"'
+
+    def _build_handler(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: bytes = b"", headers: dict = None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                time.sleep(fake_server.latency)
+                with fake_server._lock:
+                    fake_server.requests += 1
+                    if urlparse(self.path).path != "/v1/me/player/devices":
+                        self._reply(404)
+                        return
+                    if self.headers.get("If-None-Match") == fake_server.get_etag():
+                        fake_server.not_modified += 1
+                        self._reply(304, headers={"ETag": fake_server.get_etag()})
+                        return
+                    body = json.dumps({"devices": [fake_server.device]}).encode('utf-8')
+                    etag = fake_server.get_etag()
+                self._reply(200, body, {"Content-Type": "application/json", "ETag": etag})
+
+            def do_PUT(self):
+                time.sleep(fake_server.latency)
+                url = urlparse(self.path)
+                with fake_server._lock:
+                    fake_server.requests += 1
+                    if url.path != "/v1/me/player/volume":
+                        self._reply(404)
+                        return
+                    volume_percent = int(parse_qs(url.query)["volume_percent"][0])
+                    fake_server.device["volume_percent"] = volume_percent
+                    fake_server.version += 1
+                    fake_server.volume_changes.append((time.perf_counter(), volume_percent))
+                self._reply(204)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="FakeSpotifyServer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,97 @@
+import io
+import json
+import math
+import random
+import struct
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from services.tts_backend import TtsBackend
+
+class FakeTTSService(TtsBackend):
+    # Stands in for GoogleTTSService offline: waits latency seconds per request
+    # and writes a tone whose length follows the text
+    name = "fake"
+
+    def __init__(self, latency: float = 0.3, frame_rate: int = 24000, seconds_per_character: float = 0.06, metered: bool = True):
+        self.latency = latency
+        self.metered = metered
+        self.frame_rate = frame_rate
+        self.seconds_per_character = seconds_per_character
+        self.requests = 0
+        self.characters = 0
+
+    def get_voice_signature(self, language="en"):
+        return f"fake|{language}|{self.frame_rate}"
+
+    def synthesize_pcm(self, text_to_send, language="en") -> bytes:
+        time.sleep(self.latency)
+        self.requests += 1
+        self.characters += len(text_to_send)
+        frames = int(len(text_to_send) * self.seconds_per_character * self.frame_rate)
+        frequency = 440 if language == "en" else 520
+        return b"".join(struct.pack('<h', int(8000 * math.sin(2 * math.pi * frequency * i / self.frame_rate))) for i in range(frames))
+
+    def synthesize_wav(self, text_to_send, language="en") -> bytes:
+        wav_buffer = io.BytesIO()
+        with wave.open(wav_buffer, 'wb') as output_file:
+            output_file.setnchannels(1)
+            output_file.setsampwidth(2)
+            output_file.setframerate(self.frame_rate)
+            output_file.writeframes(self.synthesize_pcm(text_to_send, language))
+        return wav_buffer.getvalue()
+
+    def synthesize_chunks(self, text_to_send, language="en"):
+        for line in text_to_send.split("\n"):
+            if line.strip():
+                yield self.synthesize_wav(line, language)
+
+    def generate_audio(self, text_to_send, filename, language="en"):
+        with open(filename, 'wb') as output_file:
+            output_file.write(self.synthesize_wav(text_to_send, language))
+
+
+class FakeTTSServer():
+    # Local HTTP endpoint answering POST /synthesize {"text", "language"} with a WAV
+    # after the backend latency. failure_rate answers some requests with a 503.
+    def __init__(self, tts_service: FakeTTSService, failure_rate: float = 0.0):
+        self.tts_service = tts_service
+        self.failure_rate = failure_rate
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._build_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def get_url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/synthesize"
+
+    def _build_handler(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if random.random() < fake_server.failure_rate:
+                    time.sleep(fake_server.tts_service.latency)
+                    self.send_error(503)
+                    return
+                wav_bytes = fake_server.tts_service.synthesize_wav(request["text"], request.get("language", "en"))
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Content-Length", str(len(wav_bytes)))
+                self.end_headers()
+                self.wfile.write(wav_bytes)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="FakeTTSServer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
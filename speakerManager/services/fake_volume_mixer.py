@@ -0,0 +1,21 @@
+import threading
+import time
+from services.volume_mixer import VolumeMixer
+
+class FakeVolumeMixer(VolumeMixer):
+    # Records every change instead of touching a sound card. apply_latency
+    # stands for the cost of one mixer write.
+    def __init__(self, card, apply_latency: float = 0.0):
+        self.card = card
+        self.apply_latency = apply_latency
+        self.volumes: dict[str, int] = {}
+        self.changes: list[tuple[float, str, int]] = []
+        self._lock = threading.Lock()
+
+    def set_volume(self, control: str, volume_percent: int) -> bool:
+        if self.apply_latency:
+            time.sleep(self.apply_latency)
+        with self._lock:
+            self.volumes[control] = volume_percent
+            self.changes.append((time.monotonic(), control, volume_percent))
+        return True
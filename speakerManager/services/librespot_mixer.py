@@ -0,0 +1,74 @@
+import re
+import subprocess
+from zarus_core import CustomLogging
+
+class LibrespotMixer():
+    # Changes the librespot volume on this machine, either through its PulseAudio
+    # sink input or through a softvol ALSA control only librespot plays into.
+    # No network involved. A control shared with announcements or Set Volume is
+    # refused, ducking it would duck them too and the restore would undo them.
+    MIXER_ALSA = "alsa"
+    MIXER_PULSE = "pulse"
+    default_alsa_control = "Librespot"
+    PERCENT_PATTERN = re.compile(r"(\d+)%")
+    AMIXER_PATTERN = re.compile(r"\[(\d+)%\]")
+
+    def __init__(self, mixer_config: dict, logger:CustomLogging, reserved_controls: list[tuple] = None):
+        self.logger = logger
+        mixer_config = mixer_config or {}
+        self.mixer_type = mixer_config.get("type")
+        self.alsa_card = mixer_config.get("card", 0)
+        self.alsa_control = mixer_config.get("control", self.default_alsa_control)
+        self.pulse_application = mixer_config.get("application", "librespot")
+        self.timeout = mixer_config.get("timeout", 2.0)
+        reserved = {(str(card), control) for card, control in reserved_controls or []}
+        if self.mixer_type == self.MIXER_ALSA and (str(self.alsa_card), self.alsa_control) in reserved:
+            self.logger.error(f"Local mixer control [{self.alsa_control}] on card {self.alsa_card} is the one Set Volume uses, ducking falls back to the Web API")
+            self.mixer_type = None
+
+    def is_enabled(self) -> bool:
+        return self.mixer_type in (self.MIXER_ALSA, self.MIXER_PULSE)
+
+    def _run(self, command: list[str]) -> str:
+        return subprocess.run(command, capture_output=True, text=True, timeout=self.timeout, check=True).stdout
+
+    def get_volume(self) -> int:
+        # None when the control or the librespot stream cannot be found
+        try:
+            if self.mixer_type == self.MIXER_ALSA:
+                return self.parse_amixer_volume(self._run(['amixer', '-c', str(self.alsa_card), 'sget', self.alsa_control]))
+            sink_input = self.parse_pulse_sink_input(self._run(['pactl', 'list', 'sink-inputs']), self.pulse_application)
+            return sink_input[1] if sink_input is not None else None
+        except (OSError, subprocess.SubprocessError) as error:
+            self.logger.error(f"Not able to read the librespot volume: {error}")
+            return None
+
+    def set_volume(self, volume_percent: int) -> bool:
+        try:
+            if self.mixer_type == self.MIXER_ALSA:
+                self._run(['amixer', '-q', '-c', str(self.alsa_card), 'sset', self.alsa_control, f"{volume_percent}%"])
+                return True
+            sink_input = self.parse_pulse_sink_input(self._run(['pactl', 'list', 'sink-inputs']), self.pulse_application)
+            if sink_input is None:
+                return False
+            self._run(['pactl', 'set-sink-input-volume', sink_input[0], f"{volume_percent}%"])
+            return True
+        except (OSError, subprocess.SubprocessError) as error:
+            self.logger.error(f"Not able to set the librespot volume: {error}")
+            return False
+
+    @classmethod
+    def parse_amixer_volume(cls, amixer_output: str) -> int:
+        match = cls.AMIXER_PATTERN.search(amixer_output)
+        return int(match.group(1)) if match else None
+
+    @classmethod
+    def parse_pulse_sink_input(cls, pactl_output: str, application: str) -> tuple[str, int]:
+        # (sink input index, volume percent) of the first stream of the application
+        for block in pactl_output.split("Sink Input #")[1:]:
+            if f'application.name = "{application}"' not in block and f'application.process.binary = "{application}"' not in block:
+                continue
+            volume_line = next((line for line in block.splitlines() if line.strip().startswith("Volume:")), "")
+            match = cls.PERCENT_PATTERN.search(volume_line)
+            return (block.split()[0], int(match.group(1)) if match else None)
+        return None
@@ -7,6 +7,10 @@ class LibreSpotService:
     _is_active: bool
     _last_modified: datetime
     _last_active_signal: datetime
+    _inactivity_timeout_seconds: int = 3600
+    _volume_percent: int = None
+    _volume_last_modified: datetime = None
+    VOLUME_EVENT_PREFIX = "volume_changed:"
 
     def __init__(self, status = "stop", is_active = False, logger=CustomLogging(component_name="LibreSpot")) -> None:
         self.logger = logger
@@ -17,6 +21,10 @@ class LibreSpotService:
         self._last_active_signal = datetime.now()
 
     def update_status(self, message_recieved: str) -> bool:
+        # Volume events come from the librespot event hook as "volume_changed:<percent>"
+        if(message_recieved.startswith(self.VOLUME_EVENT_PREFIX)):
+            self.update_volume(message_recieved[len(self.VOLUME_EVENT_PREFIX):])
+            return False
         new_active_state = None
         self._status = message_recieved
         if(message_recieved=="stop"):
@@ -34,6 +42,23 @@ class LibreSpotService:
             return True
         return False
     
+    def update_volume(self, volume_message: str):
+        try:
+            volume_percent = int(volume_message)
+        except ValueError:
+            self.logger.warning(f"Invalid LibreSpot volume: {volume_message}")
+            return
+        if(0 <= volume_percent <= 100 and volume_percent != self._volume_percent):
+            self._volume_percent = volume_percent
+            self._volume_last_modified = datetime.now()
+            self.logger.info(f"New LibreSpot Volume: {volume_percent}")
+
+    def get_volume_percent(self) -> int:
+        return self._volume_percent
+
+    def get_volume_last_modified(self) -> datetime:
+        return self._volume_last_modified
+
     def get_audio_id(self) -> str:
         return self._audio_id
 
@@ -46,11 +71,19 @@ class LibreSpotService:
     def get_last_modified(self) -> datetime:
         return self._last_modified
     
+    def _can_time_out(self) -> bool:
+        return self._is_active and self._status != "start" and self._status != "play"
+
+    def get_seconds_until_timeout(self):
+        if(not self._can_time_out()): return None
+        time_difference = datetime.now() - self._last_active_signal
+        return max(0.0, self._inactivity_timeout_seconds - time_difference.total_seconds())
+
     def activity_status_timed_out(self) -> bool:
-        if(self._is_active and self._status != "start" and self._status != "play"):
+        if(self._can_time_out()):
             current_time = datetime.now()
             time_difference = current_time - self._last_active_signal
-            if time_difference.total_seconds() >= 3600:
+            if time_difference.total_seconds() >= self._inactivity_timeout_seconds:
                 self.logger.info(f"LibreSpot stopping due timed out | Status: {self._status} | Last_active_signal: {self._last_active_signal}")
                 self.execute_time_out()
                 return True
@@ -0,0 +1,63 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from services.tts_backend import TtsBackend, SpeechSplitter, WavAssembler
+
+class LocalTTSService(TtsBackend):
+    # Runs an offline engine as a subprocess per chunk. espeak-ng works with its
+    # built-in voices, piper needs a model path per language in "voices".
+    ENGINE_ESPEAK = "espeak-ng"
+    ENGINE_PIPER = "piper"
+    DEFAULT_VOICES = {ENGINE_ESPEAK: {"en": "en-us", "es": "es-419"}, ENGINE_PIPER: {}}
+    name = "local"
+    metered = False
+
+    def __init__(self, local_config: dict = None):
+        local_config = local_config or {}
+        self.engine = local_config.get("engine") or self.detect_engine()
+        self.voices = {**self.DEFAULT_VOICES.get(self.engine, {}), **local_config.get("voices", {})}
+        self.timeout = local_config.get("timeout", 20)
+
+    @classmethod
+    def detect_engine(cls) -> str:
+        if shutil.which(cls.ENGINE_ESPEAK) is not None:
+            return cls.ENGINE_ESPEAK
+        return None
+
+    def is_available(self) -> bool:
+        return self.engine is not None and shutil.which(self.engine) is not None
+
+    def _get_voice(self, language="en"):
+        return self.voices.get(language) or self.voices.get("en")
+
+    def get_voice_signature(self, language="en"):
+        return f"local|{self.engine}|{self._get_voice(language)}"
+
+    def _build_command(self, output_path, language="en") -> list[str]:
+        # Both engines read the text from stdin
+        voice = self._get_voice(language)
+        if self.engine == self.ENGINE_PIPER:
+            return ['piper', '--model', voice, '--output_file', output_path]
+        return ['espeak-ng', '-v', voice, '-w', output_path, '--stdin']
+
+    def _synthesize_speech(self, text_to_send, language="en") -> bytes:
+        if not self.is_available():
+            raise RuntimeError(f"Local TTS engine not available: {self.engine}")
+        file_descriptor, output_path = tempfile.mkstemp(suffix=".wav")
+        os.close(file_descriptor)
+        try:
+            subprocess.run(self._build_command(output_path, language), input=text_to_send.encode('utf-8'),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=self.timeout, check=True)
+            with open(output_path, 'rb') as output_file:
+                return output_file.read()
+        finally:
+            os.remove(output_path)
+
+    def synthesize_chunks(self, text_to_send, language="en"):
+        for speech_line in SpeechSplitter.divide_text_by_newline(text_to_send):
+            yield self._synthesize_speech(speech_line, language)
+
+    def generate_audio(self, text_to_send, filename, language="en"):
+        with open(filename, 'wb') as out:
+            out.write(WavAssembler.assemble(self.synthesize_chunks(text_to_send, language)))
@@ -1,5 +1,6 @@
 from zarus_core import CustomLogging
 import paho.mqtt.client as mqtt
+from services.topic_router import TopicRouter
 
 class MqttConfig:
     broker_address:str
@@ -32,22 +33,25 @@ class MqttService:
             cls.__instance = super().__new__(cls)
         return cls.__instance
 
-    def __init__(self, mqtt_config:MqttConfig=None, process_message=None, client_id="SpeakerManager", logger=CustomLogging(component_name="Mqtt")):
+    def __init__(self, mqtt_config:MqttConfig=None, process_message=None, client_id="SpeakerManager", logger=CustomLogging(component_name="Mqtt"), client=None):
         if not hasattr(self, 'client'):
             if mqtt_config is None or process_message is None or client_id is None:
                 raise ValueError('MQTT configuration not found at object creation')
             logger.info("Creating New Mqtt Service...")
-            self._configuration(mqtt_config, process_message, client_id, logger)
+            self._configuration(mqtt_config, process_message, client_id, logger, client)
 
-    def _configuration(self, mqtt_config:MqttConfig, process_message, client_id:str, logger:CustomLogging):
+    def _configuration(self, mqtt_config:MqttConfig, process_message, client_id:str, logger:CustomLogging, client=None):
         self.logger = logger
         self.logger.info("Configuring Mqtt...")
         self.process_message = process_message
-        self.client = mqtt.Client(client_id=client_id, clean_session=False, userdata=None, protocol=mqtt.MQTTv311, transport="tcp")
+        if client is None:
+            client = mqtt.Client(client_id=client_id, clean_session=False, userdata=None, protocol=mqtt.MQTTv311, transport="tcp")
+        self.client = client
         self.client.on_message = self.on_message
         self.client.username_pw_set(username=mqtt_config.mqtt_user, password=mqtt_config.mqtt_pass)
         self.client.connect(mqtt_config.broker_address)
         self.know_commands = mqtt_config.subscription_topics
+        self.command_router = TopicRouter.from_subscriptions([], self.know_commands)
         self.subscribe_know_topics()
         self.logger.info("Mqtt client created.")
         self.client.loop_start()
@@ -70,17 +74,9 @@ class MqttService:
         self.client.publish(topic,message,qos=1,retain=False)
 
     def get_command_from_topic(self, topic:str) -> str:
-        splitted_topic = topic.split("/")
-        for know_command in self.know_commands:
-            founded = True
-            splitted_know_command = know_command["topic"].split("/")
-            if(len(splitted_know_command) == len(splitted_topic)):
-                for i in range(len(splitted_know_command)):
-                    if(splitted_know_command[i] != splitted_topic[i] and splitted_know_command[i] != '+'):
-                        founded = False
-                if(founded):
-                    return know_command["commandName"]
-        return None
+        route = self.command_router.resolve(topic)
+        if(route is None): return None
+        return route.target
 
     def extract_topic_and_payload(self, message):
         topic = message.topic
@@ -1,8 +1,11 @@
 import spotipy
+import requests
 from spotipy.oauth2 import SpotifyOAuth
 from zarus_core import CustomLogging
 from datetime import datetime
-import time
+from collections import deque
+from services.librespot_service import LibreSpotService
+from services.librespot_mixer import LibrespotMixer
 import threading
 
 class SpotifyDevice:
@@ -34,27 +37,93 @@ class SpotifyConfig:
         self.client_secret = spotify_dict.get('clientSecret', None)
         self.redirect_url = spotify_dict.get('redirectUrl', None)
         self.home_spotify_name = spotify_dict.get('librespotName', None)
+        self.api_url = spotify_dict.get('apiUrl', "https://api.spotify.com/v1")
+        self.refresh_interval = spotify_dict.get('refreshInterval', 2.0)
+        self.local_mixer = spotify_dict.get('localMixer', {})
         self.scope = "user-read-playback-state user-modify-playback-state user-top-read user-read-recently-played"
 
     @classmethod
     def from_json(cls, config_data):
         return SpotifyConfig(config_data.get('spotify', {}))
 
+class SpotifyWebClient:
+    # One pooled session for the Web API calls. Device polls are conditional,
+    # an unchanged device list costs a 304 without a body.
+    def __init__(self, api_url: str, token_provider, logger:CustomLogging, timeout: float = 3.0):
+        self.logger = logger
+        self.api_url = api_url.rstrip("/")
+        self.token_provider = token_provider
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.requests_count = 0
+        self.not_modified_count = 0
+        self._devices_etag = None
+        self._devices: list[SpotifyDevice] = []
+
+    def _get_headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token_provider()}"}
+
+    def get_devices(self) -> list[SpotifyDevice]:
+        headers = self._get_headers()
+        if(self._devices_etag is not None):
+            headers["If-None-Match"] = self._devices_etag
+        response = self.session.get(f"{self.api_url}/me/player/devices", headers=headers, timeout=self.timeout)
+        self.requests_count += 1
+        if(response.status_code == 304):
+            self.not_modified_count += 1
+            return self._devices
+        response.raise_for_status()
+        self._devices = SpotifyDevice.from_json_list(response.json())
+        self._devices_etag = response.headers.get("ETag")
+        return self._devices
+
+    def set_volume(self, volume_percent: int, device_id: str = None):
+        params = {"volume_percent": volume_percent}
+        if(device_id is not None):
+            params["device_id"] = device_id
+        response = self.session.put(f"{self.api_url}/me/player/volume", params=params, headers=self._get_headers(), timeout=self.timeout)
+        self.requests_count += 1
+        response.raise_for_status()
+
+
 class SpotifyService:
     _is_spotify_playing: bool = False
     _playing_last_modified: datetime = None
     _librespot_device = None
     _device_last_modified: datetime = None
 
-    def __init__(self, config_data, logger=CustomLogging(component_name="Spotify")):
+    CMD_DECREASE_VOLUME = "decreaseVolume"
+    CMD_RESTORE_VOLUME = "restoreVolume"
+    DECREASED_LOCALLY = "local"
+    DECREASED_WITH_WEB_API = "webApi"
+
+    def __init__(self, config_data, logger=CustomLogging(component_name="Spotify"), web_client: SpotifyWebClient = None, librespot: LibreSpotService = None, local_mixer: LibrespotMixer = None):
         self.logger = logger
         self.logger.info("Creating Spotify Service...")
         self.config = SpotifyConfig.from_json(config_data)
         self.home_spotify_name = self.config.home_spotify_name
         self.volume_decreased = False
+        self.volume_decreased_with = None
         self.last_volume = 0
         self.volume_decrease_value = 0.8
-        self.sp = self._get_spotify_object()
+        self.librespot = librespot
+        self.local_mixer = local_mixer or LibrespotMixer(self.config.local_mixer, logger=self.logger)
+        if(web_client is None):
+            self.sp = self._get_spotify_object()
+            web_client = SpotifyWebClient(self.config.api_url, self._get_access_token, logger=self.logger)
+        self.web_client = web_client
+        # Volume changes run on their own thread in order, so nothing on the
+        # playback path waits for them. The Web API device state is only kept
+        # warm while the Web API is the way to duck and librespot is playing.
+        self._refresh_requested = threading.Event()
+        self._refresher_started = False
+        self._volume_writes = 0
+        self._commands = deque()
+        self._commands_condition = threading.Condition()
+        self._decrease_requested = False
+        if(not self.local_mixer.is_enabled()):
+            self._start_refresher()
+        threading.Thread(target=self._command_loop, name="SpotifyCommands", daemon=True).start()
 
     def _get_spotify_object(self) -> spotipy.Spotify:
         sp = None
@@ -67,6 +136,9 @@ class SpotifyService:
         except:
             self.logger.error(f"Not able to authorize spotify profile")
         return sp
+
+    def _get_access_token(self) -> str:
+        return self.sp.auth_manager.get_access_token(as_dict=False)
     
     def _update_is_playing(self, sp: spotipy.Spotify) -> bool:
         if(not self._can_update(self._playing_last_modified,1)): return self._is_spotify_playing
@@ -83,47 +155,48 @@ class SpotifyService:
         self._is_spotify_playing = isPlaying  
         return isPlaying
     
-    def _get_devices(self, sp: spotipy.Spotify) -> list[SpotifyDevice]:
-        spotifyDevice_list = []
-        try:
-            devices_list = sp.devices()
-            spotifyDevice_list = SpotifyDevice.from_json_list(devices_list)
-        except:
-            self.logger.error(f"Not able to get spotify devices")
-        return spotifyDevice_list
-    
-    def _update_librespot_device(self, sp: spotipy.Spotify) -> SpotifyDevice:
-        if(not self._can_update(self._device_last_modified,1)): return self._librespot_device
+    def _start_refresher(self):
+        with self._commands_condition:
+            if(self._refresher_started): return
+            self._refresher_started = True
+        threading.Thread(target=self._refresh_loop, name="SpotifyRefresher", daemon=True).start()
 
-        self.logger.info(f"Updating Spotify librespot_device object")
-        spotifyDevice_list = self._get_devices(sp)
+    def request_refresh(self):
+        self._refresh_requested.set()
+
+    def _refresh_loop(self):
+        refresh_interval = self.config.refresh_interval
+        while True:
+            if(self.librespot is not None and not self.librespot.is_active()):
+                # Nothing plays on librespot, parked until one of its events asks for a refresh
+                self._refresh_requested.wait()
+                self._refresh_requested.clear()
+            if(self._refresh_librespot_device()):
+                refresh_interval = self.config.refresh_interval
+            else:
+                # Back off while the API is unreachable or not authorized
+                refresh_interval = min(refresh_interval * 2, 60)
+            self._refresh_requested.wait(refresh_interval)
+            self._refresh_requested.clear()
+
+    def _refresh_librespot_device(self) -> bool:
+        volume_writes = self._volume_writes
+        try:
+            spotifyDevice_list = self.web_client.get_devices()
+        except Exception as error:
+            self.logger.error(f"Not able to get spotify devices: {error}")
+            return False
+        if(volume_writes != self._volume_writes):
+            # One of our volume changes overlapped the poll, its answer may predate it
+            self._refresh_requested.set()
+            return True
+        librespot_device = None
         for spotifyDevice in spotifyDevice_list:
             if(spotifyDevice.name == self.home_spotify_name):
-                self._device_last_modified = datetime.now()
-                self._librespot_device = spotifyDevice
-                return spotifyDevice
+                librespot_device = spotifyDevice
+        self._librespot_device = librespot_device
         self._device_last_modified = datetime.now()
-        self._librespot_device = None
-        return None
-    
-    def _update_device_with_event(self, sp, event):
-        self._update_librespot_device(sp)
-        event.set()
-    
-    def _update_librespot_device_on_thread(self, sp: spotipy.Spotify) -> SpotifyDevice:
-        device_updated_event = threading.Event()
-        update_thread = threading.Thread(target=self._update_device_with_event, args=(sp, device_updated_event))
-        update_thread.start()
-
-
-        # Esperar 1 segundo para ver si la función ha terminado
-        if device_updated_event.wait(timeout=1.5):
-            self.logger.info(f"Spotify librespot_device object Updated on Thread")
-            return self._librespot_device
-        else:
-            self.logger.error("Spotify update_librespot_device timed out")
-            return None
-
+        return True
 
     def _can_update(self, last_time: datetime, seconds_to_wait: int) -> True:
         if(last_time is None): return True
@@ -135,47 +208,96 @@ class SpotifyService:
             return False
         
     def is_librespot_playing(self) -> bool:
-        sp = self.sp
-        #is_playing = self._update_is_playing(sp)
-        #if(not is_playing): return False
-        #self.logger.info(f"Spotify is playing")
-
-        #librespot_device = self._update_librespot_device(sp)
-        librespot_device = self._update_librespot_device_on_thread(sp)
+        librespot_device = self._librespot_device
         if(librespot_device is None or not librespot_device.is_active): return False
-
-        self.logger.info(f"Spotify is playing on LibreSpot Device")
         return True
-        
+
     def decrease_volume_if_necessary(self):
-        try:
-            sp = self.sp
-            if(not self.is_librespot_playing()): return
+        # Fire and forget, only queues the change
+        with self._commands_condition:
+            self._decrease_requested = True
+        self._post_command(self.CMD_DECREASE_VOLUME)
+
+    def restore_volume(self):
+        with self._commands_condition:
+            self._decrease_requested = False
+        self._post_command(self.CMD_RESTORE_VOLUME)
+
+    def has_to_restore_volume(self):
+        with self._commands_condition:
+            return self._decrease_requested
 
-            librespot_device = self._librespot_device            
-            actual_volume = librespot_device.volume_percent
+    def _post_command(self, command: str):
+        with self._commands_condition:
+            if(self._commands and self._commands[-1] == command): return
+            self._commands.append(command)
+            self._commands_condition.notify()
+
+    def _command_loop(self):
+        while True:
+            with self._commands_condition:
+                while not self._commands:
+                    self._commands_condition.wait()
+                command = self._commands.popleft()
+            if(command == self.CMD_DECREASE_VOLUME):
+                self._decrease_volume()
+            else:
+                self._restore_volume()
+
+    def _decrease_volume(self):
+        if(self.volume_decreased): return
+        if(self.local_mixer.is_enabled() and self._decrease_local_volume()): return
+        self._decrease_web_api_volume()
+
+    def _decrease_local_volume(self) -> bool:
+        actual_volume = self.local_mixer.get_volume()
+        if(actual_volume is None):
+            self.logger.warning("LibreSpot local volume not found, using the Web API")
+            return False
+        new_volume = int(actual_volume*self.volume_decrease_value)
+        if(not self.local_mixer.set_volume(new_volume)): return False
+        self.logger.info(f"Spotify local volume: {actual_volume} -> {new_volume}")
+        self.last_volume = actual_volume
+        self.volume_decreased_with = self.DECREASED_LOCALLY
+        self.volume_decreased = True
+        return True
+
+    def _decrease_web_api_volume(self):
+        self._start_refresher()
+        try:
+            # The volume published by the librespot event hook saves a device lookup
+            librespot_device = self._librespot_device
+            actual_volume = self.librespot.get_volume_percent() if self.librespot is not None else None
+            if(actual_volume is None):
+                if(self._device_last_modified is None):
+                    self._refresh_librespot_device()
+                if(not self.is_librespot_playing()): return
+                librespot_device = self._librespot_device
+                actual_volume = librespot_device.volume_percent
             self.last_volume = actual_volume
             self.logger.info(f"Spotify Actual Volume: {actual_volume}")
             new_volume = int(actual_volume*self.volume_decrease_value)
             self.logger.info(f"Spotify New Volume : {new_volume}")
-            sp.volume(new_volume)
+            self.web_client.set_volume(new_volume, librespot_device.id if librespot_device else None)
+            self._volume_writes += 1
+            self.volume_decreased_with = self.DECREASED_WITH_WEB_API
             self.volume_decreased = True
-            time.sleep(0.5)
         except:
             self.logger.error(f"Not able to decrease the spotify volume")
 
-    def restore_volume(self):
+    def _restore_volume(self):
         try:
-            sp = self.sp
-            if(self.volume_decreased):
-                #sp.start_playback()
-                self.logger.info(f"Setting volumen again to: {self.last_volume}")
-                sp.volume(self.last_volume)
-                self._librespot_device.volume_percent = self.last_volume
-                self.volume_decreased = False
+            if(not self.volume_decreased): return
+            self.logger.info(f"Setting volumen again to: {self.last_volume}")
+            if(self.volume_decreased_with == self.DECREASED_LOCALLY):
+                if(not self.local_mixer.set_volume(self.last_volume)):
+                    self.logger.error(f"Not able to restore the local spotify volume")
+            else:
+                librespot_device = self._librespot_device
+                self.web_client.set_volume(self.last_volume, librespot_device.id if librespot_device else None)
+                self._volume_writes += 1
+                if(librespot_device is not None):
+                    librespot_device.volume_percent = self.last_volume
+            self.volume_decreased = False
         except:
             self.logger.error(f"Not able to restore the spotify volume")
-
-    def has_to_restore_volume(self):
-        if(not self.volume_decreased): return False
-        if(self.is_librespot_playing()): return True
\ No newline at end of file
@@ -0,0 +1,96 @@
+import threading
+
+class TopicRoute():
+    TYPE_SPEAKER = "speaker"
+    TYPE_COMMAND = "command"
+
+    def __init__(self, route_type: str, target, topic_filter: str):
+        self.route_type = route_type
+        self.target = target
+        self.topic_filter = topic_filter
+        self.order = 0
+
+
+class TopicNode():
+    def __init__(self):
+        self.children: dict[str, TopicNode] = {}
+        self.routes: list[TopicRoute] = []
+
+
+class TopicRouter():
+    # Trie over topic levels with MQTT '+' and '#' wildcards. When several
+    # filters match, the route registered first wins.
+    SINGLE_LEVEL_WILDCARD = "+"
+    MULTI_LEVEL_WILDCARD = "#"
+
+    def __init__(self, cache_size: int = 4096):
+        self._root = TopicNode()
+        self._route_count = 0
+        self._cache: dict[str, TopicRoute] = {}
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def add_route(self, topic_filter: str, route: TopicRoute):
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split("/"):
+                node = node.children.setdefault(level, TopicNode())
+            route.order = self._route_count
+            self._route_count += 1
+            node.routes.append(route)
+            self._cache.clear()
+
+    def add_speaker(self, speaker):
+        topic = speaker.get_subscribe_topic()
+        if(topic):
+            self.add_route(topic, TopicRoute(TopicRoute.TYPE_SPEAKER, speaker, topic))
+
+    def add_command(self, topic_filter: str, command_name: str):
+        self.add_route(topic_filter, TopicRoute(TopicRoute.TYPE_COMMAND, command_name, topic_filter))
+
+    def resolve(self, topic: str) -> TopicRoute:
+        cached = self._cache.get(topic)
+        if cached is not None:
+            return cached
+        route = self._match(topic.split("/"))
+        if route is not None:
+            with self._lock:
+                if len(self._cache) >= self._cache_size:
+                    self._cache.clear()
+                self._cache[topic] = route
+        return route
+
+    def _match(self, levels: list[str]) -> TopicRoute:
+        best_route = None
+        pending = [(self._root, 0)]
+        while pending:
+            node, depth = pending.pop()
+            multi_level = node.children.get(self.MULTI_LEVEL_WILDCARD)
+            if multi_level is not None:
+                best_route = self._pick_first(best_route, multi_level.routes)
+            if depth == len(levels):
+                best_route = self._pick_first(best_route, node.routes)
+                continue
+            literal = node.children.get(levels[depth])
+            if literal is not None:
+                pending.append((literal, depth + 1))
+            single_level = node.children.get(self.SINGLE_LEVEL_WILDCARD)
+            if single_level is not None:
+                pending.append((single_level, depth + 1))
+        return best_route
+
+    @staticmethod
+    def _pick_first(best_route: TopicRoute, routes: list[TopicRoute]) -> TopicRoute:
+        for route in routes:
+            if best_route is None or route.order < best_route.order:
+                best_route = route
+        return best_route
+
+    @classmethod
+    def from_subscriptions(cls, speakers: list, know_commands: list[dict]):
+        router = cls()
+        for speaker in speakers:
+            router.add_speaker(speaker)
+        for know_command in know_commands:
+            router.add_command(know_command["topic"], know_command["commandName"])
+        return router
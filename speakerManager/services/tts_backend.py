@@ -0,0 +1,115 @@
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
+from controllers.pcm_cache import PcmAudio
+from zarus_core import CustomLogging
+
+class TtsBackend(ABC):
+    # A speech engine. metered backends are charged against the character quota.
+    name = "none"
+    metered = False
+
+    @abstractmethod
+    def get_voice_signature(self, language="en") -> str:
+        pass
+
+    @abstractmethod
+    def generate_audio(self, text_to_send, filename, language="en"):
+        pass
+
+    @abstractmethod
+    def synthesize_chunks(self, text_to_send, language="en"):
+        pass
+
+    def is_available(self) -> bool:
+        return True
+
+class ChunkSynthesizer():
+    # Synthesises chunks concurrently on a bounded pool and returns the results in
+    # chunk order. A failing chunk is retried on its own, the others are kept.
+    def __init__(self, logger:CustomLogging, max_workers=4, max_retries=2, retry_delay=0.5):
+        self.logger = logger
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="TtsChunk")
+
+    def run(self, chunks, synthesize_chunk):
+        futures = [self.executor.submit(self._synthesize_with_retries, synthesize_chunk, i, chunk) for i, chunk in enumerate(chunks)]
+        # Every chunk settles before returning, so no worker is left writing after a failure
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def stream(self, chunks, synthesize_chunk):
+        futures = [self.executor.submit(self._synthesize_with_retries, synthesize_chunk, i, chunk) for i, chunk in enumerate(chunks)]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _synthesize_with_retries(self, synthesize_chunk, index, chunk):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return synthesize_chunk(index, chunk)
+            except Exception as error:
+                if(attempt == self.max_retries):
+                    raise
+                self.logger.warning(f"Chunk {index} failed ({error}), retry {attempt + 1} of {self.max_retries}")
+                time.sleep(self.retry_delay * (attempt + 1))
+
+class SpeechSplitter():
+
+    @staticmethod
+    def divide_text_by_newline(text, max_bytes=500):
+        lines = text.split('\n')
+        groups = []
+        current_group = ''
+        for line in lines:
+            line_len = SpeechSplitter._get_bytes_on_string(line)
+            if (line_len <= max_bytes):
+                current_group = SpeechSplitter._add_to_group(current_group, line, groups, max_bytes)
+            else:
+                current_group = SpeechSplitter._split_long_line(line, current_group, groups, max_bytes)
+        SpeechSplitter._add_current_group(groups, current_group)
+        return groups
+
+    @staticmethod
+    def _add_to_group(current_group, line, groups, max_bytes):
+        current_group_len = SpeechSplitter._get_bytes_on_string(current_group)
+        line_len = SpeechSplitter._get_bytes_on_string(line)
+        if (current_group_len + line_len) > max_bytes:
+            SpeechSplitter._add_current_group(groups, current_group)
+            current_group = line
+        else:
+            current_group += f" {line}"
+        return current_group
+
+    @staticmethod
+    def _split_long_line(line, current_group, groups, max_bytes):
+        while len(line) > 0:
+            limit = min(len(line), max_bytes)
+            index = line.rfind('. ', 0, limit) + 1
+            if index == 0:
+                index = limit
+            fragment = line[:index]
+            current_group = SpeechSplitter._add_to_group(current_group, fragment, groups, max_bytes)
+            line = line[len(fragment):]
+        return current_group
+
+    @staticmethod
+    def _add_current_group(groups, current_group):
+        if current_group:
+            groups.append(current_group)
+
+    @staticmethod
+    def _get_bytes_on_string(text):
+        return len(text.encode('utf-8'))
+
+class WavAssembler:
+    # Joins LINEAR16 responses in memory. Each response carries its own RIFF header,
+    # the output takes its format from the first one, like AudioMerger did on disk.
+
+    @staticmethod
+    def assemble(wav_chunks):
+        return PcmAudio.concatenate([PcmAudio.from_wav_bytes(wav_bytes) for wav_bytes in wav_chunks]).to_wav_bytes()
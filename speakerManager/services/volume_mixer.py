@@ -0,0 +1,138 @@
+from abc import ABC, abstractmethod
+import threading
+from subprocess import Popen, PIPE, DEVNULL, run, SubprocessError, CalledProcessError
+from zarus_core import CustomLogging
+
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+class VolumeMixer(ABC):
+    # One open handle to a hardware mixer. set_volume() is only called from the
+    # VolumeController thread, so implementations do not need their own locking.
+    @abstractmethod
+    def set_volume(self, control: str, volume_percent: int) -> bool:
+        pass
+
+    def close(self):
+        return None
+
+
+class AlsaAudioMixer(VolumeMixer):
+    # pyalsaaudio binding, the mixer element is opened once per control
+    def __init__(self, card: int, logger:CustomLogging):
+        self.card = card
+        self.logger = logger
+        self.controls = {}
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return alsaaudio is not None
+
+    def set_volume(self, control: str, volume_percent: int) -> bool:
+        try:
+            mixer = self.controls.get(control)
+            if mixer is None:
+                mixer = alsaaudio.Mixer(control, cardindex=self.card)
+                self.controls[control] = mixer
+            mixer.setvolume(volume_percent)
+            return True
+        except alsaaudio.ALSAAudioError as error:
+            self.controls.pop(control, None)
+            self.logger.error(f"Not able to set volume on card {self.card} [{control}]: {error}")
+            return False
+
+    def close(self):
+        for mixer in self.controls.values():
+            mixer.close()
+        self.controls = {}
+
+
+class AmixerSessionMixer(VolumeMixer):
+    # Long-lived "amixer -s" reading one command per line from stdin, restarted if it dies.
+    # The session skips unknown controls without a word, so each control is
+    # looked up once with sget before its first change.
+    def __init__(self, card: int, logger:CustomLogging, timeout: float = 2.0):
+        self.card = card
+        self.logger = logger
+        self.timeout = timeout
+        self.process: Popen = None
+        self.known_controls: set[str] = set()
+
+    def _ensure_process(self):
+        if self.process is None or self.process.poll() is not None:
+            self.logger.info(f"Starting amixer session for card {self.card}")
+            self.process = Popen(['amixer', '-q', '-c', str(self.card), '-s'], stdin=PIPE, stdout=DEVNULL, stderr=PIPE, text=True)
+            threading.Thread(target=self._log_errors, args=(self.process,), name="AmixerErrors", daemon=True).start()
+
+    def _log_errors(self, process: Popen):
+        for line in process.stderr:
+            self.logger.error(f"amixer on card {self.card}: {line.strip()}")
+
+    def _check_control(self, control: str) -> bool:
+        if control in self.known_controls: return True
+        try:
+            run(['amixer', '-c', str(self.card), 'sget', control], stdout=DEVNULL, stderr=PIPE, text=True, timeout=self.timeout, check=True)
+        except CalledProcessError as error:
+            self.logger.error(f"amixer rejected card {self.card} [{control}]: {error.stderr.strip()}")
+            return False
+        except (OSError, SubprocessError) as error:
+            self.logger.error(f"Not able to run amixer for card {self.card}: {error}")
+            return False
+        self.known_controls.add(control)
+        return True
+
+    def set_volume(self, control: str, volume_percent: int) -> bool:
+        if not self._check_control(control):
+            return False
+        command = f"sset '{control}' {volume_percent}%\n"
+        try:
+            self._ensure_process()
+            self.process.stdin.write(command)
+            self.process.stdin.flush()
+            return True
+        except BrokenPipeError:
+            self.logger.warning(f"amixer session for card {self.card} closed its input, restarting")
+            self.process = None
+        except OSError as error:
+            self.logger.error(f"Not able to start amixer for card {self.card}: {error}")
+            return False
+        try:
+            self._ensure_process()
+            self.process.stdin.write(command)
+            self.process.stdin.flush()
+            return True
+        except OSError as error:
+            self.logger.error(f"Not able to set volume on card {self.card} [{control}]: {error}")
+            return False
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.process.wait(timeout=2)
+            self.process = None
+
+
+class PulseMixer(VolumeMixer):
+    # pactl has no command session, so this still runs one process per change;
+    # the controller's coalescing keeps that to one per burst. The control is the sink name.
+    default_control = "@DEFAULT_SINK@"
+
+    def __init__(self, logger:CustomLogging, timeout: float = 2.0):
+        self.logger = logger
+        self.timeout = timeout
+
+    def set_volume(self, control: str, volume_percent: int) -> bool:
+        try:
+            run(['pactl', 'set-sink-volume', control, f"{volume_percent}%"], stdout=DEVNULL, stderr=PIPE, timeout=self.timeout, check=True)
+            return True
+        except CalledProcessError as error:
+            self.logger.error(f"pactl rejected sink [{control}]: {error.stderr.decode(errors='replace').strip()}")
+            return False
+        except (OSError, SubprocessError) as error:
+            self.logger.error(f"Not able to set volume on sink [{control}]: {error}")
+            return False
@@ -1,29 +1,45 @@
+import asyncio
 import time
 from devices.speaker_device import SpeakerDevice
 from devices.chromecast_device import ChromecastAudioDevice
 from devices.speaker_interface import Speaker
 from zarus_core import ConfigurationReader, CustomLogging
 from services.mqtt_service import MqttService, MqttConfig
+from services.topic_router import TopicRouter, TopicRoute
 from services.spotify_service import SpotifyService
 from services.librespot_service import LibreSpotService
+from services.chromecast_pool import ChromecastPool
+from services.librespot_mixer import LibrespotMixer
+from services.audio_http_server import AudioHttpServer
 from controllers.audio_controller import AudioController, AudioRequests, AudioConfig
 from controllers.tts_controller import TextToSpeechGenerator
+from controllers.tts_worker_pool import TtsWorkerPool, TtsJob
 from controllers.room_controller import RoomController
+from controllers.device_registry import DeviceRegistry
 from controllers.audio_speaker_manager import AudioSpeakerManager
 from controllers.audio_process_manager import AudioProcessManager
 from controllers.volume_controller import VolumeController
+from controllers.chromecast_fan_out import ChromecastFanOut
+from controllers.playback_engine import AsyncPlaybackEngine
+from controllers.playback_channels import PlaybackChannels
+from utils.event_queue import EventQueue
+from utils.latency_histogram import LatencyHistogram
 
 class SpeakerManager():
     mqtt_service: MqttService = None
     audio_controller: AudioController = None
     spotify_service: SpotifyService = None
+    mqtt_client = None
     use_spotify_service = True
     speaker_list: list[SpeakerDevice] = []
     chromecast_list: list[ChromecastAudioDevice] = []
+    chromecast_pool: ChromecastPool = None
+    audio_server: AudioHttpServer = None
     sounds_folder = "sounds/"
     loggin_path = "logs/speakerManager.log"
     api_config_file = "conf/text-to-speech-api.json"
     configuration_completed = False
+    wake_up_deadline = 3.0
 
     CMD_SPOTIFY_EVENT = "Spotify Event"
     CMD_REPRODUCE_SOUND = "Reproduce Sound"
@@ -32,22 +48,34 @@ class SpeakerManager():
     CMD_REPRODUCE_TTS_ES = "Reproduce Tts-Es"
     CMD_SET_VOLUME = "Set Volume"
     ASSISTANT_RECOGNITION_AUDIO_ID = "assistantRecognition"
+    TTS_AUDIO_ID = "tts"
+
+    EVT_REQUEST_QUEUED = "requestQueued"
+    EVT_AUDIO_FINISHED = "audioFinished"
+    EVT_LIBRESPOT_UPDATED = "librespotUpdated"
 
     def __init__(self):
         CustomLogging.configure_project(project_name="speakerManager", log_file=self.loggin_path)
         self.logger: CustomLogging = CustomLogging(component_name="SpeakerManager")
         self.logger.info("Creating Speaker Manager...")
+        self.event_queue = EventQueue()
+        self.wake_latency_histograms: dict[str, LatencyHistogram] = {}
         self.update_config_values()
         self.logger.info("Speaker Manager Created")
 
     def update_config_values(self):
         self.logger.info("Updating configuration Values")
+        started = time.monotonic()
         config_data = ConfigurationReader.read_config_file("conf/configuration.json")
         SpeakerManager.validate_config_values(config_data)
+        self.wake_up_deadline = config_data.get("playback", {}).get("wakeUpDeadline", self.wake_up_deadline)
 
         #Setting Mqtt config
         mqtt_config = MqttConfig.from_json(config_data)
-        self.mqtt_service = MqttService(mqtt_config=mqtt_config, process_message=self.on_mqtt_message, logger=self.logger)
+        self.mqtt_service = MqttService(mqtt_config=mqtt_config, process_message=self.on_mqtt_message, logger=self.logger, client=self.mqtt_client)
+
+        #Set Playback engine
+        self.playback_engine = AsyncPlaybackEngine(logger=self.logger)
 
         #Set Audios
         self.audio_controller = AudioController(config_data, logger=self.logger)
@@ -56,7 +84,9 @@ class SpeakerManager():
         self.audio_speaker_manager = AudioSpeakerManager(logger=self.logger)
 
         #Set AudioProcessManager
-        self.audio_process_manager = AudioProcessManager(self.sounds_folder, logger=self.logger)
+        self.audio_process_manager = AudioProcessManager(self.sounds_folder, logger=self.logger, playback_config=config_data.get("playback", {}))
+        self.audio_process_manager.set_finished_listener(self.on_audio_process_finished)
+        self.audio_process_manager.preload_audios(self.audio_controller.audios_list)
 
         #Set Rooms
         self.room_controller = RoomController(config_data, logger=self.logger)
@@ -64,49 +94,85 @@ class SpeakerManager():
         #Set Devices
         self.speaker_list = SpeakerDevice.list_from_json(config_data)
 
-        #Set Chromecast Devices
-        self.chromecast_list = ChromecastAudioDevice.list_from_json(config_data)
+        #Set Chromecast Devices, discovered and connected in the background
+        if(self.chromecast_pool is not None):
+            self.chromecast_pool.stop()
+        chromecast_config = config_data["chromecasts"]
+        self.chromecast_pool = ChromecastPool(logger=self.logger, discovery_timeout=chromecast_config.get("discoveryTimeout", 10.0))
+        if(self.audio_server is not None):
+            self.audio_server.stop()
+            self.audio_server = None
+        if(chromecast_config.get("server", {}).get("enabled", False)):
+            self.audio_server = AudioHttpServer(self.sounds_folder, logger=self.logger, server_config=chromecast_config["server"])
+            self.audio_server.start()
+        self.chromecast_list = ChromecastAudioDevice.list_from_json(config_data, self.chromecast_pool, self.audio_server)
+        self.chromecast_fan_out = ChromecastFanOut(logger=self.logger, start_tolerance=chromecast_config.get("startTolerance", 0.05), sync_timeout=chromecast_config.get("syncTimeout", 3.0))
 
-        #Set Spotify config
-        if(self.use_spotify_service):
-            self.spotify_service = SpotifyService(config_data, logger=self.logger)
+        #Set Device registry
+        self.device_registry = DeviceRegistry(self.speaker_list + self.chromecast_list, self.room_controller, logger=self.logger)
+
+        #Set Volume controller
+        self.volume_controller = VolumeController(config_data.get("volume", {}), logger=self.logger)
+
+        #Set Playback channels
+        self.playback_channels = PlaybackChannels(self.device_registry.get_room_groups(), logger=self.logger)
+
+        #Set Topic router
+        self.topic_router = TopicRouter.from_subscriptions(self.speaker_list, mqtt_config.subscription_topics)
 
         #Spotify Speaker
         self.librespot = LibreSpotService(logger=self.logger)
+
+        #Set Spotify config
+        if(self.use_spotify_service):
+            local_mixer = LibrespotMixer(config_data.get("spotify", {}).get("localMixer"), logger=self.logger, reserved_controls=self.volume_controller.get_all_targets())
+            self.spotify_service = SpotifyService(config_data, logger=self.logger, librespot=self.librespot, local_mixer=local_mixer)
         
         #Set TTS generator
-        self.textToSpeechGenerator = TextToSpeechGenerator(self.api_config_file, sounds_folder=self.sounds_folder, logger=self.logger)
+        self.textToSpeechGenerator = TextToSpeechGenerator(self.api_config_file, sounds_folder=self.sounds_folder, logger=self.logger, tts_config=config_data.get("tts", {}))
+
+        #Set TTS workers
+        tts_config = config_data.get("tts", {})
+        self.tts_worker_pool = TtsWorkerPool(self.process_tts_job, logger=self.logger, worker_count=tts_config.get("workers", 2), max_queue=tts_config.get("maxQueue", 8))
+
+        #Pre-render recurring TTS phrases in the background
+        self.textToSpeechGenerator.warm_up_phrases(config_data.get("ttsPhrases", []), on_phrase_ready=self.on_tts_phrase_ready)
         
         self.configuration_completed = True
+        self.logger.info(f"Configuration completed in {(time.monotonic() - started) * 1000:.0f}ms")
 
     def on_mqtt_message(self, topic_recieved: str, message_recieved: str):
         if(not self.configuration_completed):
             return
         
+        route = self.topic_router.resolve(topic_recieved)
+        if(route is None):
+            return
+
         #If the message is a command to a speaker
-        speaker_aux:SpeakerDevice = SpeakerDevice.get_by_subs_topic(self.speaker_list, topic_recieved)
-        if(speaker_aux):
+        if(route.route_type == TopicRoute.TYPE_SPEAKER):
+            speaker_aux:SpeakerDevice = route.target
             self.logger.info(f"Speaker status update | topic: {topic_recieved} | message: {message_recieved}")
             speaker_aux.update_status_from_message(message_recieved)
             return
 
         #If the message is a command to the program
-        command_name = self.mqtt_service.get_command_from_topic(topic_recieved)
-        if(command_name):
-            self.execute_command(command_name, topic_recieved, message_recieved)
-            return
+        self.execute_command(route.target, topic_recieved, message_recieved)
 
     def execute_command(self, command_name:str, topic_recieved:str, message:str):
         self.logger.info(f"Command triggered: [{command_name}] | topic: {topic_recieved} | message: {message}")
         if(self.CMD_SPOTIFY_EVENT == command_name):
             librespot_changed = self.librespot.update_status(message)
             if(librespot_changed):
+                if(self.use_spotify_service):
+                    self.spotify_service.request_refresh()
                 librespot_is_active = self.librespot.is_active()
                 spotify_audio_id = self.librespot.get_audio_id()
                 if(librespot_is_active):
-                    self.wake_speakers(spotify_audio_id, self.speaker_list)
+                    self.playback_engine.submit([], lambda: self.wake_speakers(spotify_audio_id, self.speaker_list))
                 else:
-                    self.on_audio_finished(spotify_audio_id)
+                    self.playback_engine.call(self.on_audio_finished, spotify_audio_id)
+            self.event_queue.post(self.EVT_LIBRESPOT_UPDATED)
             return
         
         topic_recieved_split = topic_recieved.split("/")
@@ -114,20 +180,55 @@ class SpeakerManager():
         rooms = topic_recieved_split[-2]
         
         if(self.CMD_REPRODUCE_SOUND == command_name):
-            self.audio_controller.add_new_audio_request(message, rooms, stop=False)
+            self.queue_audio_request(message, rooms, stop=False)
         elif(self.CMD_STOP_SOUND == command_name):
-            self.audio_controller.add_new_audio_request(message, rooms, stop=True)
+            self.queue_audio_request(message, rooms, stop=True)
         elif(self.CMD_REPRODUCE_TTS == command_name):
-            self.synthesize_and_queue_tts(message, rooms, "en")
+            self.queue_tts_request(message, rooms, "en")
         elif(self.CMD_REPRODUCE_TTS_ES == command_name):
-            self.synthesize_and_queue_tts(message, rooms, "es")
+            self.queue_tts_request(message, rooms, "es")
         elif(self.CMD_SET_VOLUME == command_name):
-            VolumeController.set_volume(message)
+            room_names = self.device_registry.get_room_names(rooms)
+            self.volume_controller.set_volume(message, room_names)
+
+    def queue_tts_request(self, message, rooms, language):
+        # Pre-rendered phrases skip synthesis and play under their own audio id
+        phrase_audio_id = self.textToSpeechGenerator.get_phrase_audio_id(message, language)
+        if(phrase_audio_id is not None):
+            self.logger.info(f"TTS phrase matched: [{phrase_audio_id}]")
+            self.queue_audio_request(phrase_audio_id, rooms)
+            return
+        self.tts_worker_pool.submit(TtsJob(message, rooms, language))
+
+    def on_tts_phrase_ready(self, phrase_audio_id, file_name):
+        audio_config = self.audio_controller.register_audio(phrase_audio_id, file_name, base_audio_id=self.TTS_AUDIO_ID)
+        self.audio_process_manager.preload_audios([audio_config])
+
+    def process_tts_job(self, tts_job:TtsJob):
+        self.synthesize_and_queue_tts(tts_job.text, tts_job.rooms, tts_job.language)
 
     def synthesize_and_queue_tts(self, message_recieved, rooms, language="en"):
-        file_generated = self.textToSpeechGenerator.generate_audio_file(message_recieved, language)
-        if(file_generated):
-            self.audio_controller.add_new_audio_request("tts",rooms)
+        if(self.textToSpeechGenerator.streaming):
+            # Synthesis keeps running in the background while the speakers wake up
+            tts_audio = self.textToSpeechGenerator.generate_audio_stream(message_recieved, language)
+        else:
+            tts_audio = self.textToSpeechGenerator.generate_audio_file(message_recieved, language)
+            if(tts_audio is not None):
+                tts_audio = (*tts_audio, None)
+        if(tts_audio is not None):
+            tts_name, file_name, tts_stream = tts_audio
+            self.textToSpeechGenerator.pin_audio_file(file_name)
+            if(tts_stream is not None and self.audio_server is not None):
+                self.audio_server.register_stream(file_name, tts_stream)
+            audio_id = self.audio_controller.register_ephemeral_audio(tts_name, file_name, base_audio_id=self.TTS_AUDIO_ID, stream=tts_stream)
+            self.queue_audio_request(audio_id, rooms)
+
+    def queue_audio_request(self, audio_id, rooms, stop=False):
+        self.audio_controller.add_new_audio_request(audio_id, rooms, stop=stop)
+        self.event_queue.post(self.EVT_REQUEST_QUEUED)
+
+    def on_audio_process_finished(self, audio_id: str):
+        self.event_queue.post(self.EVT_AUDIO_FINISHED, audio_id)
 
     def process_next_queued_requests(self):
         next_to_reproduce = self.audio_controller.get_next_to_reproduce()
@@ -136,21 +237,25 @@ class SpeakerManager():
         next_to_stop = self.audio_controller.get_next_to_stop()
         if(next_to_stop!=None):
             self.handle_stop_request(next_to_stop)
+        return next_to_reproduce is not None or next_to_stop is not None
     
+    def get_room_keys(self, rooms: str) -> list[str]:
+        room_names = self.device_registry.get_room_names(rooms)
+        if(not room_names):
+            return [rooms.lower()]
+        return room_names
+
     def get_speakers_for_rooms(self, rooms) -> list[SpeakerDevice]:
-        device_list: list[Speaker] = self.speaker_list[:] + self.chromecast_list[:]
-        speakers_found = []
-        roomsFound = self.room_controller.get_rooms_from_topic(rooms)
-        for room in roomsFound:
-            for speaker_id in room.speakers:
-                speaker_found = Speaker.get_by_id(device_list, speaker_id)
-                if (speaker_found is None):
-                    self.logger.warning(f"No speaker {speaker_id} found")
-                else:
-                    speakers_found.append(speaker_found)
-        return speakers_found
+        return self.device_registry.get_speakers_for_rooms(rooms)
 
     def handle_play_request(self, audio_requests:AudioRequests):
+        room_keys = self.get_room_keys(audio_requests.rooms)
+        job_factory = lambda playback_id: self.play_request_pipeline(audio_requests, playback_id)
+        self.playback_engine.call(self.playback_channels.submit, room_keys, audio_requests.audioId, audio_requests.priority, job_factory)
+
+    async def play_request_pipeline(self, audio_requests:AudioRequests, playback_id:str) -> bool:
+        self.audio_controller.mark_request_started(audio_requests)
+
         # 1. Resolve speakers and audio config
         rooms = audio_requests.rooms
         audio_id = audio_requests.audioId
@@ -158,12 +263,12 @@ class SpeakerManager():
         audio_config = self.audio_controller.get_audio_config_by_id(audio_id)
         if(audio_config is None):
             self.logger.warning(f"No audio filename found for {audio_id}")
-            return
+            return False
 
         # 2. Wake speakers before playback begins
-        self.wake_speakers(audio_id, speakers)
+        await self.wake_speakers(playback_id, speakers)
 
-        # 3. Duck Spotify volume if librespot is streaming
+        # 3. Duck Spotify volume if librespot is streaming, without waiting for it
         if(self.use_spotify_service):
             if(self.librespot.is_active()):
                 self.logger.info(f"LibreSpot is playing something")
@@ -172,65 +277,130 @@ class SpeakerManager():
                 self.logger.info(f"LibreSpot is not active")
 
         # 4. Start audio playback
-        self.start_playback(speakers, audio_config)
+        return await self.start_playback(speakers, audio_config.copy_for_playback(playback_id))
 
-    def wake_speakers(self, audio_id: str, speakers_list: list[SpeakerDevice]):
+    async def wake_speakers(self, audio_id: str, speakers_list: list[SpeakerDevice]):
         speakers_list_copy = speakers_list[:]
         self.logger.info("Turning on Speakers...")
-        pending_speakers = []
+        pending_acks = {}
         for speaker_unknow in speakers_list_copy:
             self.audio_speaker_manager.add_playing_speaker(speaker_unknow,audio_id)
             if (not speaker_unknow.get_status()):
-                pending_speakers.append(speaker_unknow)
-                speaker_unknow.set_turn_on_requested(True)
-                self.logger.info(f"Turn on requested for speaker: {speaker_unknow.id}, value {speaker_unknow.is_turn_on_requested()}")
-        count_tries = 0
-        while (len(pending_speakers)>0) and count_tries<4:
-            for speaker_aux in pending_speakers:
-                if (speaker_aux.is_turn_on_requested() == False):
-                    self.logger.info(f"Turn off requested for speaker: {speaker_aux.id}, value {speaker_aux.is_turn_on_requested()}, removing from pending list")
-                else:
-                    self.logger.info(f"Turning on speaker: {speaker_aux.id}")
-                    speaker_aux.turn_on_speaker()
-                    
-            time.sleep(0.5 * count_tries)
-            count_tries+=1
-            pending_speakers = [speaker for speaker in speakers_list_copy if not speaker.get_status()]
-
-    def reproduce_on_chromecasts(self, speakers: list[Speaker], audio_config:AudioConfig):
-        self.logger.info(f"[Chromecasts] Reproducing Audio on Chromecasts: {speakers}")
+                pending_acks[asyncio.wrap_future(speaker_unknow.wait_for_status(True))] = speaker_unknow
+        if(not pending_acks): return
+
+        # Fire every turn on command at once, then wait for the acknowledgements
+        started = time.monotonic()
+        for ack, speaker_aux in pending_acks.items():
+            self.logger.info(f"Turning on speaker: {speaker_aux.id}")
+            speaker_aux.turn_on_speaker()
+            ack.add_done_callback(lambda ack, speaker_aux=speaker_aux: self._record_wake_latency(speaker_aux, ack, started))
+
+        half_deadline = self.wake_up_deadline / 2
+        done, not_done = await asyncio.wait(pending_acks.keys(), timeout=half_deadline)
+        for ack in not_done:
+            speaker_aux = pending_acks[ack]
+            if (speaker_aux.is_turn_on_requested() == False):
+                self.logger.info(f"Turn off requested for speaker: {speaker_aux.id}, removing from pending list")
+                ack.cancel()
+            else:
+                self.logger.info(f"Speaker {speaker_aux.id} not confirmed after {half_deadline}s, retrying")
+                speaker_aux.turn_on_speaker()
+        not_done = {ack for ack in not_done if not ack.cancelled()}
+        if(not_done):
+            done, not_done = await asyncio.wait(not_done, timeout=self.wake_up_deadline - half_deadline)
+        for ack in not_done:
+            self.logger.warning(f"Speaker {pending_acks[ack].id} did not confirm within {self.wake_up_deadline}s")
+            ack.cancel()
+
+    def _record_wake_latency(self, speaker: SpeakerDevice, ack: asyncio.Future, started: float):
+        if(ack.cancelled()): return
+        histogram = self.wake_latency_histograms.get(speaker.id)
+        if(histogram is None):
+            histogram = LatencyHistogram(f"wake.{speaker.id}")
+            self.wake_latency_histograms[speaker.id] = histogram
+        histogram.record(time.monotonic() - started)
+        self.logger.info(histogram.summary())
+
+    def get_chromecasts(self, speakers: list[Speaker]) -> list[ChromecastAudioDevice]:
+        return [speaker for speaker in speakers if isinstance(speaker, ChromecastAudioDevice)]
+
+    def reproduce_on_chromecasts(self, chromecasts: list[ChromecastAudioDevice], audio_config:AudioConfig, on_start=None):
+        self.logger.info(f"[Chromecasts] Reproducing Audio on Chromecasts: {[chromecast.id for chromecast in chromecasts]}")
         try:
-            audioName = audio_config.file_name
-            for speaker in speakers:
-                for device_aux in self.chromecast_list:
-                    if(speaker.get_id() == device_aux.get_id()):
-                        device_aux.play_audio(audioName)
-        except:
-            self.logger.error("[Chromecast Error]: An exception occurred playing chromecast")
+            # Offline casts are skipped so they never hold back the local speakers
+            found = self.chromecast_pool.get_sessions([chromecast.id for chromecast in chromecasts], self.chromecast_pool.get_startup_wait())
+            sessions = []
+            for chromecast in chromecasts:
+                session = found.get(chromecast.id)
+                if(session is None):
+                    self.logger.warning(f"[Chromecasts] {chromecast.id} not discovered")
+                elif(not session.is_connected()):
+                    self.logger.warning(f"[Chromecasts] {chromecast.id} not connected, skipped")
+                else:
+                    sessions.append(session)
+            media_url = chromecasts[0].get_media_url(audio_config.file_name)
+            self.chromecast_fan_out.play(sessions, media_url, chromecasts[0].get_content_type(), on_start=on_start)
+        except Exception as error:
+            self.logger.error(f"[Chromecast Error]: An exception occurred playing chromecast: {error}")
         self.logger.info(f"[Chromecasts] Done.")
 
     def handle_stop_request(self, audio_requests:AudioRequests):
         audio_id = audio_requests.audioId
         audio_config = self.audio_controller.get_audio_config_by_id(audio_id)
         if(audio_config==None): return # Close if not filename founded
-        self.stop_playback(audio_config)
-
-    def start_playback(self, speakers, audio_config:AudioConfig):
+        room_keys = self.get_room_keys(audio_requests.rooms)
+        audio_ids = [audio_id]
+        if(audio_id == self.TTS_AUDIO_ID):
+            # Each announcement plays under its own id, "tts" stops all of them
+            audio_ids += self.audio_controller.get_ephemeral_ids()
+            audio_ids += self.textToSpeechGenerator.get_phrase_ids()
+        self.playback_engine.call(self.stop_audio_in_rooms, audio_ids, room_keys)
+
+    def stop_audio_in_rooms(self, audio_ids:list[str], room_keys:list[str]):
+        for audio_id in audio_ids:
+            for playback_id in self.playback_channels.cancel(audio_id, room_keys):
+                self.stop_playback(playback_id)
+            self.release_ephemeral_audio(audio_id)
+
+    def release_ephemeral_audio(self, audio_id:str):
+        if(not self.audio_controller.is_ephemeral(audio_id) or self.playback_channels.is_audio_active(audio_id)):
+            return
+        audio_config = self.audio_controller.unregister_audio(audio_id)
+        if(audio_config is not None):
+            self.textToSpeechGenerator.unpin_audio_file(audio_config.file_name)
+        if(audio_config is not None and not self.audio_controller.is_file_in_use(audio_config.file_name)):
+            self.audio_process_manager.forget_audio(audio_config.file_name)
+            if(self.audio_server is not None):
+                self.audio_server.forget(audio_config.file_name)
+        self.logger.info(f"Ephemeral audio released: [{audio_id}]")
+
+    async def start_playback(self, speakers, audio_config:AudioConfig) -> bool:
         self.logger.info(f"Reproducing Audio: {audio_config.file_name}")
         audio_id = audio_config.id
         try:
             if(self.audio_controller.is_audio_playing(audio_id)):
                 self.logger.info("Audio already executing")
-                self.stop_playback(audio_config)
-            #self.reproduce_on_chromecasts(speakers,audio_config)
-            sub_process_aux = self.audio_process_manager.execute_audio_process(audio_config)
-            self.audio_controller.link_process_with_audio(audio_id,sub_process_aux)
-            time.sleep(0.5)
+                self.stop_playback(audio_id)
+            # Linked before starting so a fast exit can never be seen before the link
+            self.audio_controller.link_process_with_audio(audio_id,audio_config)
+            chromecasts = self.get_chromecasts(speakers)
+            if(chromecasts):
+                # The local mixer starts at the same instant the casts get "play"
+                local_started = []
+                local_start = lambda: local_started.append(self.audio_process_manager.execute_audio_process(audio_config))
+                await asyncio.to_thread(self.reproduce_on_chromecasts, chromecasts, audio_config, local_start)
+                if(not local_started):
+                    self.audio_process_manager.execute_audio_process(audio_config)
+            else:
+                self.audio_process_manager.execute_audio_process(audio_config)
+            await asyncio.sleep(0.5)
+            return True
         except:
             self.logger.error("[Aplay Error]: An exception occurred using Aplay")
+            return False
 
-    def stop_playback(self, audioConfig:AudioConfig):
-        audio_id = audioConfig.id
+    def stop_playback(self, audio_id:str):
         self.logger.info(f"Stopping Audio file: {audio_id}...")
         try:
             self.audio_process_manager.kill_audio_process(audio_id)
@@ -238,7 +408,7 @@ class SpeakerManager():
         except:
             self.logger.error(f"Unable to kill audio file: {audio_id}")
 
-    def update_playback_state(self):
+    async def update_playback_state(self):
         queue_files_playing = self.audio_controller.get_queue_files_playing()
         for audio_id, sub_process_aux in list(queue_files_playing.items()):
             if self.audio_process_manager.subprocess_ended(audio_id):
@@ -247,31 +417,41 @@ class SpeakerManager():
             self.spotify_service.restore_volume()
 
     def on_audio_finished(self, audio_id:str):
+        self.playback_channels.notify_finished(audio_id)
         self.audio_controller.remove_playing_audio(audio_id)
         removed_audio_speakers = self.audio_speaker_manager.remove_audio_from_all_speakers(audio_id)
         empty_speakers = self.audio_speaker_manager.get_empty_speakers()
         speakers_to_turn_off = [speaker_aux for speaker_aux in removed_audio_speakers if speaker_aux in empty_speakers]
         self.logger.info(f"Audio finished: [{audio_id}] | affected speakers: {[s.id for s in removed_audio_speakers]} | empty speakers: {[s.id for s in empty_speakers]} | to turn off: {[s.id for s in speakers_to_turn_off]}")
         for speaker_aux in speakers_to_turn_off:
-            if(audio_id != self.ASSISTANT_RECOGNITION_AUDIO_ID):
+            if(PlaybackChannels.get_audio_id(audio_id) != self.ASSISTANT_RECOGNITION_AUDIO_ID):
                 self.logger.info(f"Turning off {speaker_aux.id}")
                 speaker_aux.turn_off_if_apply()
             else:
                 self.logger.info(f"Speakers will remain on due to Audio ID equals: {self.ASSISTANT_RECOGNITION_AUDIO_ID}")
+        self.release_ephemeral_audio(PlaybackChannels.get_audio_id(audio_id))
 
     def check_librespot_timeout(self):
         spotify_audio_id = self.librespot.get_audio_id()
         spotify_timed_out = self.librespot.activity_status_timed_out()
         if(spotify_timed_out):
-            self.on_audio_finished(spotify_audio_id)
+            self.playback_engine.call(self.on_audio_finished, spotify_audio_id)
+
+    def dispatch_events(self, events):
+        event_names = {event.name for event in events}
+        if(self.EVT_REQUEST_QUEUED in event_names):
+            while self.process_next_queued_requests():
+                pass
+        if(self.EVT_AUDIO_FINISHED in event_names):
+            self.playback_engine.submit([], self.update_playback_state)
 
     def run_loop(self):
         self.logger.info("Executing reproduceThreadLoop")
         while True:
-            self.process_next_queued_requests()
-            self.update_playback_state()
+            timeout = self.librespot.get_seconds_until_timeout()
+            events = self.event_queue.wait_for_events(timeout)
+            self.dispatch_events(events)
             self.check_librespot_timeout()
-            time.sleep(0.2)
 
     @classmethod
     def validate_config_values(cls,config_data):
@@ -0,0 +1,39 @@
+import threading
+import time
+from collections import deque
+
+class Event():
+    name: str
+    payload: object
+    created_at: float
+
+    def __init__(self, name: str, payload=None):
+        self.name = name
+        self.payload = payload
+        self.created_at = time.monotonic()
+
+
+class EventQueue():
+    _events: deque
+    _condition: threading.Condition
+
+    def __init__(self):
+        self._events = deque()
+        self._condition = threading.Condition()
+
+    def post(self, name: str, payload=None):
+        with self._condition:
+            self._events.append(Event(name, payload))
+            self._condition.notify()
+
+    def wait_for_events(self, timeout: float = None) -> list[Event]:
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._events)
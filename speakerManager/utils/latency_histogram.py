@@ -0,0 +1,45 @@
+import bisect
+import threading
+
+class LatencyHistogram():
+    DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, name: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max_value = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.total += seconds
+            self.count += 1
+            self.max_value = max(self.max_value, seconds)
+
+    def get_mean(self) -> float:
+        with self._lock:
+            return self.total / self.count if self.count else 0.0
+
+    def get_percentile(self, percentile: float) -> float:
+        # Upper bound of the bucket holding the percentile, the max for the overflow bucket
+        with self._lock:
+            if not self.count:
+                return 0.0
+            target = self.count * percentile / 100
+            accumulated = 0
+            for i, bucket_count in enumerate(self.counts):
+                accumulated += bucket_count
+                if accumulated >= target:
+                    return self.buckets[i] if i < len(self.buckets) else self.max_value
+            return self.max_value
+
+    def summary(self) -> str:
+        with self._lock:
+            labels = [f"<={bucket * 1000:g}ms" for bucket in self.buckets] + ["overflow"]
+            buckets = " ".join(f"{label}:{count}" for label, count in zip(labels, self.counts) if count)
+            mean = self.total / self.count if self.count else 0.0
+            return f"[{self.name}] n: {self.count} | mean: {mean * 1000:.1f}ms | max: {self.max_value * 1000:.1f}ms | {buckets}"
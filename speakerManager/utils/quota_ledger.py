@@ -0,0 +1,87 @@
+import datetime
+import os
+import threading
+
+class QuotaLedger():
+    # Daily counters kept in memory and persisted as appended "date,count" rows.
+    # Rows for the same date add up, so the old one-total-per-day CSV loads as is.
+    # The file is rewritten with one row per day every compact_every appends.
+    DATE_FORMAT = '%Y-%m-%d'
+
+    def __init__(self, file_path: str, compact_every: int = 200):
+        self.file_path = file_path
+        self.compact_every = compact_every
+        self.daily_counts: dict[str, int] = {}
+        self.monthly_counts: dict[str, int] = {}
+        self._appends_since_compaction = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.file_path):
+            open(self.file_path, 'w').close()
+            return
+        rows = 0
+        with open(self.file_path, mode='r') as ledger_file:
+            for line in ledger_file:
+                if not line.strip():
+                    continue
+                date_str, value = line.strip().split(',')
+                self._add(date_str, int(value))
+                rows += 1
+        if rows > len(self.daily_counts):
+            self.compact()
+
+    def _add(self, date_str: str, count: int):
+        self.daily_counts[date_str] = self.daily_counts.get(date_str, 0) + count
+        month_str = date_str[:7]
+        self.monthly_counts[month_str] = self.monthly_counts.get(month_str, 0) + count
+
+    def _append(self, date_str: str, count: int):
+        with open(self.file_path, mode='a', newline='') as ledger_file:
+            ledger_file.write(f"{date_str},{count}\n")
+        self._appends_since_compaction += 1
+        if self._appends_since_compaction >= self.compact_every:
+            self._compact()
+
+    @classmethod
+    def get_today_date_string(cls) -> str:
+        return datetime.datetime.now().strftime(cls.DATE_FORMAT)
+
+    def get_today(self) -> int:
+        with self._lock:
+            return self.daily_counts.get(self.get_today_date_string(), 0)
+
+    def get_month(self) -> int:
+        with self._lock:
+            return self.monthly_counts.get(self.get_today_date_string()[:7], 0)
+
+    def reserve(self, count: int, daily_limit: int, monthly_limit: int) -> bool:
+        # Check and charge in one step, so concurrent requests cannot both pass the limit
+        with self._lock:
+            date_str = self.get_today_date_string()
+            if self.daily_counts.get(date_str, 0) + count > daily_limit:
+                return False
+            if self.monthly_counts.get(date_str[:7], 0) + count > monthly_limit:
+                return False
+            self._add(date_str, count)
+            self._append(date_str, count)
+            return True
+
+    def release(self, count: int):
+        with self._lock:
+            date_str = self.get_today_date_string()
+            self._add(date_str, -count)
+            self._append(date_str, -count)
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, mode='w', newline='') as ledger_file:
+            for date_str in sorted(self.daily_counts):
+                ledger_file.write(f"{date_str},{self.daily_counts[date_str]}\n")
+        os.replace(temp_path, self.file_path)
+        self._appends_since_compaction = 0